@@ -0,0 +1,197 @@
+"""merging variant spellings of author names into canonical tags
+
+`name_to_tag` gives `author.F-Last` for each name on its own, so "J. Frankle" and
+"Jonathan Frankle" share a tag, but so do "John Smith" and "Jane Smith". here,
+we look at all the names at once:
+
+ - names are grouped into blocks by last name, so only names within a block are compared
+ - within a block, names whose first names are compatible are merged. initials match
+   any name with the same first letter, and full names must be a prefix of one another
+   or similar (see `AUTHOR_SIMILARITY_THRESHOLD`)
+ - if a block splits into several people with the same initial, those with a full
+   first name get `author.First-Last`, and bare initials keep `author.F-Last`
+
+an overrides file, in yaml or json, maps canonical tags to lists of name spellings
+or tags to merge into them. these take precedence over the clustering:
+
+```yaml
+J-Frankle:
+  - Jonathan Frankle
+  - author.Jon-Frankle
+```
+"""
+
+# standard library imports
+from typing import (
+	Optional,
+	Dict, List, Tuple, Iterable,
+)
+
+import json
+from difflib import SequenceMatcher
+
+# package imports
+import yaml # type: ignore
+
+# local imports
+from dendron_citations.process_meta import to_ascii,to_alpha
+
+
+# minimum `difflib` similarity ratio for two full first names to be merged
+AUTHOR_SIMILARITY_THRESHOLD : float = 0.85
+
+# a `(tag_name, str_name)` pair, as in `CitationEntry.author_tags`
+AuthorName = Tuple[str, str]
+
+
+def _tag(name : str) -> str:
+	"""add the `author.` prefix if it is missing"""
+	return name if name.startswith('author.') else f'author.{name}'
+
+def load_author_overrides(path : str) -> Dict[str, str]:
+	"""load an overrides file, returning a map of lowercase alias (name or tag) to canonical tag"""
+	with open(path, 'r', encoding = 'utf-8') as f:
+		if path.endswith('.json'):
+			data = json.load(f)
+		elif any(path.endswith(x) for x in ['.yaml', '.yml']):
+			data = yaml.safe_load(f)
+		else:
+			raise ValueError(f'unknown author overrides file type: {path}')
+
+	if not isinstance(data, dict):
+		raise ValueError(f'author overrides file should map canonical tags to lists of aliases: {path}')
+
+	output : Dict[str, str] = dict()
+	for canonical,aliases in data.items():
+		for alias in [canonical, *(aliases or list())]:
+			output[str(alias).strip().lower()] = _tag(str(canonical).strip())
+			output[_tag(str(alias).strip()).lower()] = _tag(str(canonical).strip())
+
+	return output
+
+
+def _split_name(tag_name : str, str_name : str) -> Tuple[str, Tuple[str,...]]:
+	"""get the last name (from the tag) and normalized first name tokens (from the name)"""
+	last : str = tag_name[len('author.'):].rsplit('-', 1)[-1]
+	tokens : List[str] = [
+		x
+		for x in (to_alpha(to_ascii(t)).lower() for t in str_name.split())
+		if x
+	]
+
+	# drop the trailing tokens which make up the last name
+	suffix : str = ''
+	for i in range(len(tokens) - 1, -1, -1):
+		suffix = tokens[i] + suffix
+		if suffix == last.lower():
+			return last, tuple(tokens[:i])
+		if len(suffix) >= len(last):
+			break
+
+	return last, tuple(tokens[:-1])
+
+def _compatible(a : Tuple[str,...], b : Tuple[str,...]) -> bool:
+	"""whether two lists of first name tokens could belong to the same person"""
+	for x,y in zip(a, b):
+		if (len(x) == 1) or (len(y) == 1):
+			if x[0] != y[0]:
+				return False
+		elif not (
+			x.startswith(y)
+			or y.startswith(x)
+			or (SequenceMatcher(None, x, y).ratio() >= AUTHOR_SIMILARITY_THRESHOLD)
+		):
+			return False
+	return True
+
+def _cluster_block(variants : Iterable[Tuple[str,...]]) -> List[List[Tuple[str,...]]]:
+	"""cluster the first names seen with a single last name
+
+	the first variant of each cluster is the most complete spelling in it
+	"""
+	full : List[Tuple[str,...]] = list()
+	partial : List[Tuple[str,...]] = list()
+	for v in variants:
+		(full if (v and len(v[0]) > 1) else partial).append(v)
+
+	# most complete spellings first, so they become the representatives
+	full.sort(key = lambda v : (-sum(len(x) for x in v), v))
+	partial.sort(key = lambda v : (-len(v), v))
+
+	clusters : List[List[Tuple[str,...]]] = list()
+	for v in full:
+		for cl in clusters:
+			if _compatible(cl[0], v):
+				cl.append(v)
+				break
+		else:
+			clusters.append([v])
+
+	# initials join a full name only if exactly one matches, otherwise they stay apart
+	n_full : int = len(clusters)
+	for v in partial:
+		matches : List[List[Tuple[str,...]]] = [ cl for cl in clusters[:n_full] if _compatible(cl[0], v) ]
+		if len(matches) == 1:
+			matches[0].append(v)
+			continue
+		for cl in clusters[n_full:]:
+			if _compatible(cl[0], v):
+				cl.append(v)
+				break
+		else:
+			clusters.append([v])
+
+	return clusters
+
+def cluster_author_names(
+		names : Iterable[AuthorName],
+		overrides : Optional[Dict[str, str]] = None,
+		cluster : bool = True,
+	) -> Dict[AuthorName, str]:
+	"""map each `(tag_name, str_name)` to a canonical tag
+
+	### Parameters:
+	 - `names : Iterable[AuthorName]`
+	   names to cluster, duplicates are fine
+	 - `overrides : Optional[Dict[str, str]]`
+	   from `load_author_overrides`
+	   (defaults to `None`)
+	 - `cluster : bool`
+	   whether to cluster names not covered by `overrides`. if false, they keep their tag
+	   (defaults to `True`)
+	"""
+	output : Dict[AuthorName, str] = dict()
+
+	# block by last name
+	blocks : Dict[str, Dict[Tuple[str,...], List[AuthorName]]] = dict()
+	for name in set(names):
+		tag_name, str_name = name
+		if overrides:
+			canonical : Optional[str] = overrides.get(str_name.strip().lower(), overrides.get(tag_name.lower()))
+			if canonical is not None:
+				output[name] = canonical
+				continue
+		if not cluster:
+			output[name] = tag_name
+			continue
+
+		last, first = _split_name(tag_name, str_name)
+		blocks.setdefault(last, dict()).setdefault(first, list()).append(name)
+
+	for last,variants in blocks.items():
+		clusters : List[List[Tuple[str,...]]] = _cluster_block(variants.keys())
+
+		# the usual `F-Last` tags, and how many clusters want each
+		base_tags : List[str] = [
+			f'author.{cl[0][0][0].upper()}-{last}' if cl[0] else f'author.{last}'
+			for cl in clusters
+		]
+		for cl,base in zip(clusters, base_tags):
+			tag : str = base
+			if (base_tags.count(base) > 1) and cl[0] and (len(cl[0][0]) > 1):
+				tag = f'author.{cl[0][0].capitalize()}-{last}'
+			for v in cl:
+				for name in variants[v]:
+					output[name] = tag
+
+	return output
@@ -0,0 +1,231 @@
+"""sidecar index of a bibtex file, for looking up single entries without parsing the whole file
+
+the index maps each (lowercase) key to the byte offset and length of its entry,
+a hash of the entry, and the original-case key. it is stored next to the bibtex
+file and revalidated using the file size, mtime, and a hash of the start and
+end of the file. entries are read from a memory map, so fetching and parsing
+one entry does not depend on the size of the library.
+"""
+
+# standard library imports
+from typing import (
+	Optional, Any,
+	Dict, List, Iterable,
+	Callable,
+)
+
+import os
+import sys
+import json
+import mmap
+import hashlib
+
+# package imports
+import biblib.bib # type: ignore
+
+# local imports
+from dendron_citations.dc_util import (
+	OrderedDictType,
+)
+from dendron_citations.bibtex_util import (
+	BibtexSpan,scan_bibtex,parse_bibtex_chunks,
+	BIBTEX_MACRO_TYPES,BIBTEX_IGNORED_TYPES,
+)
+
+
+# appended to the bibtex filename to get the filename of the index
+BIB_INDEX_SUFFIX : str = '.dc_index.json'
+
+# bump this if the format of the index changes, to force a rebuild
+BIB_INDEX_VERSION : int = 1
+
+# bytes at the start and end of the file which are hashed to validate the index
+BIB_INDEX_REGION_SIZE : int = 4096
+
+
+def _region_hash(data : Any, size : int) -> str:
+	"""hash of the start and end of the file, catching edits which keep size and mtime"""
+	hasher = hashlib.sha1()
+	hasher.update(data[:BIB_INDEX_REGION_SIZE])
+	hasher.update(data[max(0, size - BIB_INDEX_REGION_SIZE):size])
+	return hasher.hexdigest()
+
+
+class BibIndex:
+	"""random-access index of the entries of a bibtex file
+
+	```python
+	idx = BibIndex('refs.bib')
+	db = idx.load(['vaswani2017attention'])
+	```
+	"""
+
+	def __init__(
+			self,
+			filename : str,
+			index_path : Optional[str] = None,
+			save : bool = True,
+		) -> None:
+		"""open the index for `filename`, rebuilding it if it is missing or stale
+
+		### Parameters:
+		 - `filename : str`
+		   bibtex file
+		 - `index_path : Optional[str]`
+		   where to store the index
+		   (defaults to `None`, meaning `filename + BIB_INDEX_SUFFIX`)
+		 - `save : bool`
+		   whether to save the index if it was rebuilt
+		   (defaults to `True`)
+		"""
+		self.filename : str = filename
+		self.index_path : str = index_path if index_path is not None else filename + BIB_INDEX_SUFFIX
+
+		# lowercase key -> {'key', 'offset', 'length', 'hash'}
+		self.entries : Dict[str, Dict[str, Any]] = dict()
+		# `[offset, length]` of each `@string` or `@preamble` block
+		self.macros : List[List[int]] = list()
+
+		with open(self.filename, 'rb') as f:
+			# mmap can't map empty files
+			self._mm : Optional[mmap.mmap] = (
+				mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+				if os.fstat(f.fileno()).st_size > 0
+				else None
+			)
+
+		self._stat : Dict[str, Any] = self._current_stat()
+		if not self._load():
+			self.build()
+			if save:
+				self.save()
+
+	def _data(self) -> Any:
+		return self._mm if self._mm is not None else b''
+
+	def _current_stat(self) -> Dict[str, Any]:
+		stat : os.stat_result = os.stat(self.filename)
+		return {
+			'size' : stat.st_size,
+			'mtime_ns' : stat.st_mtime_ns,
+			'region_hash' : _region_hash(self._data(), stat.st_size),
+		}
+
+	def _load(self) -> bool:
+		"""load the index from disk, returning whether it is present and valid"""
+		if not os.path.isfile(self.index_path):
+			return False
+
+		try:
+			with open(self.index_path, 'r', encoding = 'utf-8') as f:
+				data : Dict[str, Any] = json.load(f)
+		except (OSError, ValueError) as err:
+			print(f"WARNING: couldn't read bibtex index {self.index_path}, will rebuild it:\t{err}", file = sys.stderr)
+			return False
+
+		if (data.get('version') != BIB_INDEX_VERSION) or (data.get('stat') != self._stat):
+			return False
+
+		self.entries = data['entries']
+		self.macros = data['macros']
+		return True
+
+	def build(self) -> None:
+		"""scan the whole file once, recording the location and hash of every entry"""
+		data : Any = self._data()
+		self.entries = dict()
+		self.macros = list()
+		for span in scan_bibtex(data):
+			if span.typ in BIBTEX_IGNORED_TYPES:
+				continue
+			if span.typ in BIBTEX_MACRO_TYPES:
+				self.macros.append([span.start, span.end - span.start])
+				continue
+			self.entries[span.key.lower()] = {
+				'key' : span.key,
+				'typ' : span.typ,
+				'offset' : span.start,
+				'length' : span.end - span.start,
+				'hash' : hashlib.sha1(data[span.start:span.end]).hexdigest(),
+			}
+
+	def save(self) -> None:
+		with open(self.index_path, 'w', encoding = 'utf-8') as f:
+			json.dump(
+				{
+					'version' : BIB_INDEX_VERSION,
+					'stat' : self._stat,
+					'entries' : self.entries,
+					'macros' : self.macros,
+				},
+				f,
+			)
+
+	def is_stale(self) -> bool:
+		"""whether the file changed since the index was opened, going by its size and mtime
+
+		unlike opening the index, this doesn't read the file, so it is cheap to
+		check before every use
+		"""
+		stat : os.stat_result = os.stat(self.filename)
+		return (stat.st_size != self._stat['size']) or (stat.st_mtime_ns != self._stat['mtime_ns'])
+
+	def close(self) -> None:
+		if self._mm is not None:
+			self._mm.close()
+			self._mm = None
+
+	def __contains__(self, key : str) -> bool:
+		return key.lower() in self.entries
+
+	def __len__(self) -> int:
+		return len(self.entries)
+
+	def keys(self) -> List[str]:
+		"""original-case keys, in file order"""
+		return [ x['key'] for x in self.entries.values() ]
+
+	def span(self, key : str) -> BibtexSpan:
+		info : Dict[str, Any] = self.entries[key.lower()]
+		return BibtexSpan(
+			typ = info['typ'],
+			key = info['key'],
+			start = info['offset'],
+			end = info['offset'] + info['length'],
+		)
+
+	def entry_hash(self, key : str) -> str:
+		return self.entries[key.lower()]['hash']
+
+	def raw(self, key : str) -> str:
+		"""raw text of a single entry"""
+		info : Dict[str, Any] = self.entries[key.lower()]
+		return self._data()[info['offset'] : info['offset'] + info['length']].decode('utf-8')
+
+	def _macro_chunks(self) -> List[str]:
+		data : Any = self._data()
+		return [
+			data[offset : offset + length].decode('utf-8')
+			for offset,length in self.macros
+		]
+
+	def load(self, keys : Iterable[str]) -> OrderedDictType[str, biblib.bib.Entry]:
+		"""parse only the entries with the given keys (case insensitive)
+
+		### Raises:
+		 - `KeyError` : if any key is not in the file
+		"""
+		orig_keys : List[str] = [ self.entries[k.lower()]['key'] for k in keys ]
+		return parse_bibtex_chunks(
+			chunks = self._macro_chunks() + [ self.raw(k) for k in orig_keys ],
+			keys = orig_keys,
+			name = self.filename,
+		)
+
+	def load_selected(self, select : Callable[[BibtexSpan, str], bool]) -> OrderedDictType[str, biblib.bib.Entry]:
+		"""parse only the entries for which `select(span, raw_text)` is true"""
+		return self.load([
+			key
+			for key in self.keys()
+			if select(self.span(key), self.raw(key))
+		])
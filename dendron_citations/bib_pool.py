@@ -0,0 +1,164 @@
+"""parsing a bibtex file in parallel, using a pool of processes
+
+biblib tokenizes bibtex in pure python, so parsing a large library is bound to
+a single core. since `BibIndex` already knows where each entry starts and ends,
+batches of entries can be parsed independently: each worker memory-maps the
+file, and parses the `@string` and `@preamble` blocks along with its batch, so
+macros expand as they would for the whole file. entries with a `crossref` are
+resolved against their parent afterwards (see `iter_bib_raw`), since the
+parent can be in any batch.
+"""
+
+# standard library imports
+from typing import (
+	Optional, Any,
+	Dict, List, Tuple, Iterable, Iterator, Deque,
+	Callable,
+)
+
+import mmap
+from collections import OrderedDict,deque
+from concurrent.futures import ProcessPoolExecutor,Future
+
+# package imports
+import biblib.bib # type: ignore
+
+# local imports
+from dendron_citations.dc_util import (
+	OrderedDictType,
+)
+from dendron_citations.bibtex_util import parse_bibtex_chunks
+from dendron_citations.bib_index import BibIndex
+from dendron_citations.run_state import FailureLog
+
+
+# (key, offset, length) of an entry in the file
+SpanInfo = Tuple[str, int, int]
+# see `pack_bib_entry`
+PackedEntry = Tuple[Any, ...]
+
+
+def pack_bib_entry(entry : biblib.bib.Entry) -> PackedEntry:
+	"""biblib entries can't be unpickled (their constructor needs the fields), so they are sent as tuples"""
+	return (
+		entry.typ,
+		entry.key,
+		list(entry.items()),
+		getattr(entry, 'pos', None),
+		getattr(entry, 'field_pos', None),
+	)
+
+def unpack_bib_entry(packed : PackedEntry) -> biblib.bib.Entry:
+	typ, key, fields, pos, field_pos = packed
+	return biblib.bib.Entry(fields, typ = typ, key = key, pos = pos, field_pos = field_pos)
+
+
+def parse_isolated(
+		load : Callable[[List[str]], OrderedDictType[str, biblib.bib.Entry]],
+		keys : List[str],
+		failures : Optional[FailureLog] = None,
+	) -> OrderedDictType[str, biblib.bib.Entry]:
+	"""parse `keys` with `load`, and if that fails, parse them one at a time so only the bad entries are lost"""
+	try:
+		return load(keys)
+	except Exception as err: # pylint: disable=broad-except
+		if failures is None:
+			raise
+		if len(keys) == 1:
+			failures.record(keys[0], 'parse', err)
+			return OrderedDict()
+
+	output : OrderedDictType[str, biblib.bib.Entry] = OrderedDict()
+	for key in keys:
+		output.update(parse_isolated(load, [key], failures))
+	return output
+
+def _parse_batch(
+		filename : str,
+		macros : List[List[int]],
+		spans : List[SpanInfo],
+		isolate : bool,
+	) -> Tuple[List[Tuple[str, PackedEntry]], Dict[str, Dict[str, Any]]]:
+	"""worker: parse some entries of `filename`, returning them packed, and any failures"""
+	with open(filename, 'rb') as f:
+		with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as mm:
+			macro_chunks : List[str] = [ mm[offset : offset + length].decode('utf-8') for offset,length in macros ]
+			raw : Dict[str, str] = {
+				key : mm[offset : offset + length].decode('utf-8')
+				for key,offset,length in spans
+			}
+
+	def _load(keys : List[str]) -> OrderedDictType[str, biblib.bib.Entry]:
+		return parse_bibtex_chunks(
+			chunks = macro_chunks + [ raw[k] for k in keys ],
+			keys = keys,
+			name = filename,
+		)
+
+	failures : Optional[FailureLog] = FailureLog() if isolate else None
+	db : OrderedDictType[str, biblib.bib.Entry] = parse_isolated(_load, [ key for key,_,_ in spans ], failures)
+	return (
+		[ (key, pack_bib_entry(entry)) for key,entry in db.items() ],
+		failures.failures if failures is not None else dict(),
+	)
+
+
+class BibParsePool:
+	"""parses batches of entries from a `BibIndex` in worker processes"""
+
+	def __init__(
+			self,
+			bib_index : BibIndex,
+			max_procs : int,
+			failures : Optional[FailureLog] = None,
+		) -> None:
+		"""
+		### Parameters:
+		 - `bib_index : BibIndex`
+		   index of the file to parse
+		 - `max_procs : int`
+		   number of worker processes
+		 - `failures : Optional[FailureLog]`
+		   if given, entries which fail to parse are recorded here and skipped
+		   (defaults to `None`, meaning errors are raised)
+		"""
+		self.bib_index : BibIndex = bib_index
+		self.max_procs : int = max_procs
+		self.failures : Optional[FailureLog] = failures
+
+	def _submit(self, pool : ProcessPoolExecutor, keys : List[str]) -> Future:
+		spans : List[SpanInfo] = list()
+		for key in keys:
+			span = self.bib_index.span(key)
+			spans.append((span.key, span.start, span.end - span.start))
+		return pool.submit(
+			_parse_batch,
+			self.bib_index.filename,
+			self.bib_index.macros,
+			spans,
+			self.failures is not None,
+		)
+
+	def _collect(self, future : Future) -> OrderedDictType[str, biblib.bib.Entry]:
+		packed, failures = future.result()
+		if self.failures is not None:
+			self.failures.merge(failures)
+		return OrderedDict(
+			(key, unpack_bib_entry(entry))
+			for key,entry in packed
+		)
+
+	def parse(self, batches : Iterable[List[str]]) -> Iterator[OrderedDictType[str, biblib.bib.Entry]]:
+		"""parse each batch of keys, yielding the parsed batches in order
+
+		a few batches per process are kept in flight, so results don't pile up
+		if the consumer is slower than the workers
+		"""
+		with ProcessPoolExecutor(max_workers = self.max_procs) as pool:
+			pending : Deque[Future] = deque()
+			for keys in batches:
+				pending.append(self._submit(pool, keys))
+				if len(pending) >= 2 * self.max_procs:
+					yield self._collect(pending.popleft())
+			while pending:
+				yield self._collect(pending.popleft())
@@ -3,10 +3,14 @@
 
 # standard library imports
 from typing import (
-	List,
+	Optional, Union,
+	List, Tuple, NamedTuple,
+	Pattern, Match,
 )
 
+import re
 import sys
+import mmap
 from collections import OrderedDict
 
 # package imports
@@ -65,3 +69,133 @@ def load_bibtex_raw(filename : str) -> OrderedDictType[str, biblib.bib.Entry]:
 			raise KeyError(f'key {key.lower()} not found in database, expected from `all_keys`')
 
 	return db_new
+
+
+class BibtexSpan(NamedTuple):
+	"""location of a single `@type{key, ...}` block in a bibtex file, in bytes"""
+	typ : str
+	key : str
+	start : int
+	end : int
+
+# blocks which are not entries, but which entries might depend on
+BIBTEX_MACRO_TYPES : Tuple[str,...] = ('string', 'preamble')
+BIBTEX_IGNORED_TYPES : Tuple[str,...] = ('comment', )
+
+_BIBTEX_BLOCK_START : Pattern = re.compile(rb'@[ \t]*([a-zA-Z]+)[ \t\r\n]*([{(])')
+_BIBTEX_BRACES : Pattern = re.compile(rb'[{}]')
+_BIBTEX_PARENS : Pattern = re.compile(rb'[()]')
+
+def _block_end(data : Union[bytes, mmap.mmap], open_pos : int, delim : bytes) -> int:
+	"""given the position of an opening `{` or `(`, find the position after its match"""
+	pattern : Pattern = _BIBTEX_BRACES if delim == b'{' else _BIBTEX_PARENS
+	depth : int = 0
+	for match in pattern.finditer(data, open_pos):
+		if match.group() == delim:
+			depth += 1
+		else:
+			depth -= 1
+			if depth == 0:
+				return match.end()
+	raise ValueError(f'unterminated bibtex block starting at byte {open_pos}')
+
+def scan_bibtex(data : Union[bytes, mmap.mmap]) -> List[BibtexSpan]:
+	"""find the location of every block in the contents of a bibtex file, without parsing it
+	
+	only `@` followed by a name and an opening `{` or `(` at brace depth 0 starts
+	a block, so stray `@` characters (such as in emails in comments) are skipped
+	"""
+	spans : List[BibtexSpan] = list()
+	pos : int = 0
+	while True:
+		match : Optional[Match] = _BIBTEX_BLOCK_START.search(data, pos)
+		if match is None:
+			break
+		typ : str = match.group(1).decode('ascii').lower()
+		end : int = _block_end(data, match.start(2), match.group(2))
+		key : str = ''
+		if typ not in BIBTEX_MACRO_TYPES + BIBTEX_IGNORED_TYPES:
+			key = (
+				data[match.end():end]
+				.split(b',', 1)[0]
+				.decode('utf-8')
+				.strip()
+			)
+		spans.append(BibtexSpan(typ = typ, key = key, start = match.start(), end = end))
+		pos = end
+
+	return spans
+
+def bibtex_raw_field(raw : str, field : str) -> Optional[str]:
+	"""get the value of a field from the raw text of a single entry, without parsing it
+	
+	only handles `{...}`, `"..."`, and bare values, and does not expand macros
+	"""
+	match : Optional[Match] = re.search(
+		rf'[,{{(\s]{re.escape(field)}\s*=\s*', 
+		raw, 
+		re.IGNORECASE,
+	)
+	if match is None:
+		return None
+
+	pos : int = match.end()
+	if raw[pos:pos+1] == '{':
+		depth : int = 0
+		for i in range(pos, len(raw)):
+			if raw[i] == '{':
+				depth += 1
+			elif raw[i] == '}':
+				depth -= 1
+				if depth == 0:
+					return raw[pos + 1 : i]
+		return None
+	elif raw[pos:pos+1] == '"':
+		end_quote : int = raw.find('"', pos + 1)
+		return raw[pos + 1 : end_quote] if end_quote != -1 else None
+	else:
+		return re.split(r'[,})\s]', raw[pos:], 1)[0]
+
+def parse_bibtex_chunks(
+		chunks : List[str],
+		keys : List[str],
+		name : str,
+	) -> OrderedDictType[str, biblib.bib.Entry]:
+	"""parse the raw text of some blocks of a bibtex file with biblib
+	
+	`chunks` should contain any `@string` or `@preamble` blocks needed, and 
+	`keys` are the original-case keys of the entries in `chunks`, in order
+	"""
+	if not keys:
+		return OrderedDict()
+
+	try:
+		db : OrderedDictType[str, biblib.bib.Entry] = (
+			biblib.bib
+			.Parser()
+			.parse('\n\n'.join(chunks), name = name, log_fp = sys.stderr)
+			.get_entries()
+		)
+	except biblib.bib.FieldError as err:
+		print('WARNING: ', err)
+		raise
+
+	db_new : OrderedDictType[str, biblib.bib.Entry] = OrderedDict()
+	for key in keys:
+		if key.lower() in db:
+			db_new[key] = db[key.lower()]
+		else:
+			raise KeyError(f'key {key.lower()} not found in database, expected from scan of {name}')
+
+	return db_new
+
+def inherit_crossref(entry : biblib.bib.Entry, parent : biblib.bib.Entry) -> None:
+	"""fill in the fields missing from `entry` with those of its `crossref` parent, as bibtex does"""
+	entry_pos : Optional[dict] = getattr(entry, 'field_pos', None)
+	parent_pos : Optional[dict] = getattr(parent, 'field_pos', None)
+	for field,val in parent.items():
+		if (field == 'crossref') or (field in entry):
+			continue
+		entry[field] = val
+		if (entry_pos is not None) and (parent_pos is not None) and (field in parent_pos):
+			entry_pos[field] = parent_pos[field]
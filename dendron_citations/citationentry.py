@@ -2,17 +2,19 @@
 
 # standard library imports
 from typing import (
-	Optional, Literal,
-	Dict, List,
+	Optional, Literal, Union, Any,
+	Dict, List, Tuple, Sequence, FrozenSet,
 )
 
 
 from collections import OrderedDict
-from dataclasses import dataclass,asdict
+from functools import lru_cache
+from dataclasses import dataclass,fields as dataclass_fields,replace
 
 # package imports
 # implementation of mustache templating
 import chevron # type: ignore 
+import chevron.tokenizer # type: ignore
 
 import biblib.bib # type: ignore
 
@@ -22,17 +24,69 @@ from dendron_citations.dc_util import (
 )
 from dendron_citations.md_util import PandocMarkdown
 from dendron_citations.process_meta import (
-	safe_get,safe_get_any,safe_get_split,
 	strip_bibtex_fmt,name_to_tag,
-	process_tag_name,process_note_HACKY,
+	process_note_HACKY,Biblib_Name_Type,
 )
 from dendron_citations.process_meta import Config
+from dendron_citations.field_map import FieldExtractor,get_field_extractor
 
 
 
 AuthorTagDictKeys = Literal['tag_name', 'str_name']
 AuthorTagDict = Dict[AuthorTagDictKeys,str]
 
+# a mustache template, either as a string or as tokens from `compile_template`
+Template = Union[str, Sequence[Tuple[str,str]]]
+
+@lru_cache(maxsize = 8)
+def compile_template(template : str) -> Tuple[Tuple[str,str], ...]:
+	"""tokenize a mustache template once, so it isn't re-tokenized for every entry
+
+	`chevron.render` accepts the tokens in place of the template string.
+	the result is cached, so repeated runs in one process (such as the daemon) reuse it
+	"""
+	return tuple(chevron.tokenizer.tokenize(template))
+
+# fields used outside of the template: in the frontmatter, tag notes, the lookup index, and sharding
+ALWAYS_NEEDED_FIELDS : FrozenSet[str] = frozenset({
+	'bib_key', 'zotero_key', 'title', 'authors', 'author_tags', 
+	'date', 'files', 'keywords', 'collections',
+})
+
+@lru_cache(maxsize = 8)
+def template_fields(template : Tuple[Tuple[str,str], ...]) -> Optional[FrozenSet[str]]:
+	"""names of the `CitationEntry` fields referenced by a compiled template, or `None` if we can't tell
+
+	variables and sections count by the first part of a dotted name, and 
+	`_bln_<name>` counts as `<name>`. a partial could reference anything
+	"""
+	names : set = set()
+	for tag,key in template:
+		if tag == 'partial':
+			return None
+		if tag in ('variable', 'no escape', 'section', 'inverted section'):
+			name : str = key.split('.', 1)[0]
+			names.add(name[len('_bln_'):] if name.startswith('_bln_') else name)
+	
+	return frozenset(names & { f.name for f in dataclass_fields(CitationEntry) })
+
+def get_needed_fields(cfg : Config) -> Optional[FrozenSet[str]]:
+	"""fields of `CitationEntry` which need to be computed for `cfg`, or `None` for all of them
+
+	with `cfg.prune_fields`, this is the fields in the template and `ALWAYS_NEEDED_FIELDS`.
+	exporting needs everything, and sharding by year or deterministic IDs need `bib_meta`
+	"""
+	if (not cfg.prune_fields) or (cfg.export_path is not None):
+		return None
+	used : Optional[FrozenSet[str]] = template_fields(compile_template(cfg.template))
+	if used is None:
+		return None
+	return used | ALWAYS_NEEDED_FIELDS | (
+		frozenset({'bib_meta'})
+		if (cfg.note_shards == 'year') or cfg.deterministic_ids
+		else frozenset()
+	)
+
 @dataclass(frozen = True)
 class CitationEntry:
 	"""a universal citation entry"""
@@ -52,19 +106,39 @@ class CitationEntry:
 	bib_meta : Optional[OrderedDictType[str, str]] = None
 
 	@staticmethod
-	def from_bib(bib_key, bib_entry : biblib.bib.Entry, cfg : Config) -> 'CitationEntry':
-		"""create a citation entry from a biblib entry"""
+	def from_bib(
+			bib_key, 
+			bib_entry : biblib.bib.Entry, 
+			cfg : Config,
+			process_note : bool = True,
+			extractor : Optional[FieldExtractor] = None,
+		) -> 'CitationEntry':
+		"""create a citation entry from a biblib entry
+		
+		if `process_note` is false, the raw note is stored, and should later be
+		converted with `with_processed_note` (this lets us run pandoc elsewhere).
+		fields are found using `extractor`, by default the one for `cfg.field_map`,
+		and fields not in `get_needed_fields(cfg)` are left as `None`
+		"""
+		if extractor is None:
+			extractor = get_field_extractor(cfg, get_needed_fields(cfg))
+		fields : Dict[str, Any] = extractor(bib_entry)
+		# missing if the note isn't needed, so we don't call pandoc
+		raw_note : OptionalStr = fields.pop('note', None)
+		needed : Optional[FrozenSet[str]] = get_needed_fields(cfg)
+
 		authors : List[str] = list()
 		author_tags : Optional[List[AuthorTagDict]] = list()
 		try:
+			names : List[Biblib_Name_Type] = bib_entry.authors()
 			authors = [
 				strip_bibtex_fmt(f'{nm.first} {nm.last}')
-				for nm in bib_entry.authors()
+				for nm in names
 			]
 
 			author_tags = [
 				{ 'tag_name' : name_to_tag(nm, cfg), 'str_name' : nm_str }
-				for nm,nm_str in zip(bib_entry.authors(), authors)
+				for nm,nm_str in zip(names, authors)
 			]
 
 		except biblib.bib.FieldError as err:
@@ -72,32 +146,19 @@ class CitationEntry:
 
 		return CitationEntry(
 			bib_key = bib_key,
-			title = safe_get(bib_entry, 'title'),
 			authors = authors,
 			author_tags = author_tags,
-			typ = safe_get(bib_entry, 'typ'),
-			date = safe_get(bib_entry, 'date'),
-			links = safe_get_split(bib_entry, 'url', ';'),
-			files = [
-				x.replace(r'\:', ':').replace('\\\\', '/')
-				for x in safe_get_split(bib_entry, 'file', ';')
-			],
-			keywords = [
-				process_tag_name(x)	
-				for x in safe_get_split(bib_entry, 'keywords', ',')
-			],
-			collections = safe_get_split(bib_entry, 'collections', ','),
-			abstract = safe_get_any(bib_entry, ['abstract', 'abstractnote', 'abstractNote', 'summary']),
-			note = process_note_HACKY(safe_get_any(
-				bib_entry, 
-				['note', 'notes', 'annote', 'annotation', 'annotations', 'comments'],
-				process = lambda x : x,
-			)),
-			bib_meta = OrderedDict(bib_entry),
+			**fields,
+			note = process_note_HACKY(raw_note) if process_note else raw_note,
+			bib_meta = OrderedDict(bib_entry) if (needed is None) or ('bib_meta' in needed) else None,
 		)
 
-	def serialize(self) -> Dict:
-		"""serialize the object as a dict
+	def with_processed_note(self) -> 'CitationEntry':
+		"""return a copy with the raw note converted by `process_note_HACKY`"""
+		return replace(self, note = process_note_HACKY(self.note))
+
+	def serialize(self, fields : Optional[FrozenSet[str]] = None) -> Dict:
+		"""serialize the object as a dict, with only `fields` if given
 		
 		- lists into lists of dicts: 
 			mustache only allows lists of dicts, not of literals
@@ -108,7 +169,11 @@ class CitationEntry:
 			so, for each iterable with key `name`, we add a key `_bln_name` with value `True`
 
 		"""
-		d_basic : Dict = asdict(self)
+		d_basic : Dict = {
+			f.name : getattr(self, f.name)
+			for f in dataclass_fields(self)
+			if (fields is None) or (f.name in fields)
+		}
 		d_out : Dict = dict()
 		for k,v in d_basic.items():
 			if isinstance(v, (list, tuple)):
@@ -125,8 +190,16 @@ class CitationEntry:
 		return d_out
 
 
-	def to_md(self, template : str) -> PandocMarkdown:
-		"""create a markdown string from a template"""
+	def to_md(self, template : Template) -> PandocMarkdown:
+		"""create a markdown string from a template (or template tokens, see `compile_template`)
+		
+		only the fields the template references are serialized
+		"""
+		tokens : Tuple[Tuple[str,str], ...] = (
+			compile_template(template)
+			if isinstance(template, str)
+			else tuple(template)
+		)
 		note : PandocMarkdown = PandocMarkdown.get_dendron_template(
 			fm = {"traitIds" : "referenceNote"},
 		)
@@ -139,7 +212,7 @@ class CitationEntry:
 		# note.yaml_data['__bibtex__'] = self.bib_meta
 		# note.yaml_data['__entry__'] = self.serialize()
 
-		note.content = chevron.render(template, self.serialize())
+		note.content = chevron.render(tokens, self.serialize(template_fields(tokens)))
 
 		return note
 
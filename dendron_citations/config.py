@@ -1,13 +1,65 @@
-"""handling configuation and defaults for dendron_citations"""
+"""handling configuation and defaults for dendron_citations
+
+config files and templates are read through `read_file_cached`, so loading the
+same config again, such as for every request to a long-running process, only
+costs a `stat` of each file until it changes. loading a config never changes
+the working directory: paths in a config file are resolved relative to that
+file instead. every field is checked against its annotated type when a
+`Config` is created.
+"""
 
 # standard library imports
 from typing import (
-	Optional, Dict,
+	Optional, Any, Union,
+	Dict, List, Tuple,
+	Callable,
 )
 
 import os
 import sys
-from dataclasses import dataclass
+import json
+import copy
+import threading
+from dataclasses import dataclass,fields
+
+# package imports
+import yaml # type: ignore
+
+# fields which are paths, resolved relative to the config file they are given in
+CONFIG_PATH_FIELDS : Tuple[str, ...] = (
+	'bib_filename', 'vault_loc', 'template_path', 'zotero_db', 'author_aliases_path', 'export_path',
+)
+
+# absolute path -> (mtime, size, parsed contents)
+_FILE_CACHE : Dict[str, Tuple[int, int, Any]] = dict()
+_FILE_CACHE_LOCK : threading.Lock = threading.Lock()
+
+# the C loader is much faster, but not always available
+_YAML_LOADER : Any = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def read_file_cached(path : str, parse : Callable[[str], Any] = str) -> Any:
+	"""the contents of `path`, passed through `parse`, reusing the last result
+	if the mtime and size of the file haven't changed
+
+	the result is shared between calls, so don't modify it. caches are per
+	path, so don't read the same file with different `parse` functions
+
+	### Raises:
+	 - `OSError` : if the file can't be read
+	"""
+	abs_path : str = os.path.abspath(path)
+	stat : os.stat_result = os.stat(abs_path)
+	with _FILE_CACHE_LOCK:
+		cached : Optional[Tuple[int, int, Any]] = _FILE_CACHE.get(abs_path)
+	if (cached is not None) and (cached[0] == stat.st_mtime_ns) and (cached[1] == stat.st_size):
+		return cached[2]
+
+	with open(abs_path, 'r', encoding = 'utf-8') as f:
+		data : Any = parse(f.read())
+	with _FILE_CACHE_LOCK:
+		_FILE_CACHE[abs_path] = (stat.st_mtime_ns, stat.st_size, data)
+	return data
 
 DEFAULT_TEMPLATE : str = """
 
@@ -51,8 +103,7 @@ def _get_template(self : 'Config') -> str:
 	if self.template_path is not None:
 		if os.path.isfile(self.template_path):
 			try:
-				with open(self.template_path, 'r', encoding = 'utf-8') as f:
-					return str(f.read())
+				return read_file_cached(self.template_path)
 			except (OSError, IOError, FileNotFoundError) as err:
 				print(f"WARNING: couldn't read template file {self.template_path}:\t{err}", file = sys.stderr)
 				print("\twill use 'DEFAULT_TEMPLATE'")
@@ -76,13 +127,47 @@ class Config:
 	verbose : bool = False
 	kebab_case_tag_names : bool = False
 	template_path : Optional[str] = None
+	zotero_db : Optional[str] = None
+	pipeline_queue_size : int = 16
+	bib_parse_procs : int = 0
+	pandoc_max_procs : int = 4
+	pandoc_timeout : float = 30.0
+	pandoc_server_url : Optional[str] = None
+	pandoc_retries : int = 2
+	max_writes_per_sec : Optional[float] = None
+	max_memory_mb : Optional[float] = None
+	vault_index : bool = True
+	deterministic_ids : bool = False
+	lookup_index : bool = True
+	cluster_authors : bool = False
+	author_aliases_path : Optional[str] = None
+	note_shards : Optional[str] = None
+	field_map : Optional[Dict[str, Dict[str, Any]]] = None
+	export_path : Optional[str] = None
+	tag_note_members : bool = False
+	prune_fields : bool = True
 	
 	template : str = DEFAULT_TEMPLATE
 	# template : str = cached_property(_get_template)
 
 	def __post_init__(self):
+		self.validate()
 		self.template = _get_template(self)
 
+	def validate(self) -> None:
+		"""check every field against its annotated type. ints are accepted for floats
+
+		### Raises:
+		 - `ValueError` : listing every field with the wrong type
+		"""
+		errors : List[str] = [
+			f'`{fld.name}` should be {_type_name(fld.type)}, got {getattr(self, fld.name)!r}'
+			for fld in fields(self)
+			if not _check_type(getattr(self, fld.name), fld.type)
+		]
+		if errors:
+			raise ValueError('invalid config:\n\t' + '\n\t'.join(errors))
+
 
 	def as_dict(self) -> Dict:
 		return dict(
@@ -93,4 +178,83 @@ class Config:
 			verbose = self.verbose,
 			kebab_case_tag_names = self.kebab_case_tag_names,
 			template_path = self.template_path,
+			zotero_db = self.zotero_db,
+			pipeline_queue_size = self.pipeline_queue_size,
+			bib_parse_procs = self.bib_parse_procs,
+			pandoc_max_procs = self.pandoc_max_procs,
+			pandoc_timeout = self.pandoc_timeout,
+			pandoc_server_url = self.pandoc_server_url,
+			pandoc_retries = self.pandoc_retries,
+			max_writes_per_sec = self.max_writes_per_sec,
+			max_memory_mb = self.max_memory_mb,
+			vault_index = self.vault_index,
+			deterministic_ids = self.deterministic_ids,
+			lookup_index = self.lookup_index,
+			cluster_authors = self.cluster_authors,
+			author_aliases_path = self.author_aliases_path,
+			note_shards = self.note_shards,
+			field_map = self.field_map,
+			export_path = self.export_path,
+			tag_note_members = self.tag_note_members,
+			prune_fields = self.prune_fields,
 		)
+
+
+# checks for the plain types used in `Config`. bools are ints in python, but not in a config
+_TYPE_CHECKS : Dict[Any, Callable[[Any], bool]] = {
+	Any : lambda val : True,
+	type(None) : lambda val : val is None,
+	bool : lambda val : isinstance(val, bool),
+	int : lambda val : isinstance(val, int) and not isinstance(val, bool),
+	float : lambda val : isinstance(val, (int, float)) and not isinstance(val, bool),
+	str : lambda val : isinstance(val, str),
+}
+
+def _check_type(val : Any, typ : Any) -> bool:
+	"""whether `val` is of type `typ`, for the types used in `Config`"""
+	origin : Any = getattr(typ, '__origin__', None)
+	if origin is Union:
+		return any( _check_type(val, t) for t in typ.__args__ )
+	if origin is dict:
+		key_type, val_type = typ.__args__
+		return isinstance(val, dict) and all(
+			_check_type(k, key_type) and _check_type(v, val_type)
+			for k,v in val.items()
+		)
+	if typ in _TYPE_CHECKS:
+		return _TYPE_CHECKS[typ](val)
+	return isinstance(val, typ) and not isinstance(val, bool)
+
+def _type_name(typ : Any) -> str:
+	return typ.__name__ if isinstance(typ, type) else str(typ).replace('typing.', '')
+
+
+def _parse_config_file(path : str) -> Callable[[str], Dict[str, Any]]:
+	if path.endswith(('.yaml', '.yml')):
+		return lambda text : yaml.load(text, Loader = _YAML_LOADER) or dict()
+	if path.endswith('.json'):
+		return json.loads
+	raise ValueError(f'unknown config file type: {path}')
+
+def load_config_file(cfg_path : str) -> Dict[str, Any]:
+	"""read a yaml or json config file, with relative paths in it resolved against its directory
+
+	parsed files are cached (see `read_file_cached`), and a copy is returned
+
+	### Raises:
+	 - `ValueError` : for unknown extensions, files which aren't a mapping, or unknown fields
+	"""
+	data : Any = read_file_cached(cfg_path, _parse_config_file(cfg_path))
+	if not isinstance(data, dict):
+		raise ValueError(f'config file {cfg_path} should contain a mapping, got {type(data).__name__}')
+
+	unknown : List[str] = sorted(set(data) - set( fld.name for fld in fields(Config) ))
+	if unknown:
+		raise ValueError(f'unknown fields in config file {cfg_path}: {unknown}')
+
+	data = copy.deepcopy(data)
+	cfg_dir : str = os.path.dirname(cfg_path)
+	for key in CONFIG_PATH_FIELDS:
+		if isinstance(data.get(key), str) and not os.path.isabs(data[key]):
+			data[key] = os.path.join(cfg_dir, data[key])
+	return data
@@ -0,0 +1,299 @@
+"""long-lived daemon for editor integrations
+
+running the CLI for every editor action means paying for python startup, the
+pandoc check, and a full parse of the bibtex file each time. instead, the daemon
+keeps the parsed library, the compiled template, and the vault index in memory,
+and answers JSON-RPC 2.0 requests, one per line, over stdin/stdout or a unix socket.
+the bibtex file is only indexed again when its size or mtime changes, and only
+the notes a request touches are checked against the vault.
+
+methods:
+ - `ping` : returns `"pong"`
+ - `render-key` : `{"key" : <key>}`, regenerate the note for a single entry
+ - `regenerate-changed` : regenerate entries which changed in the bibtex file since the last call
+   (or since the daemon started)
+ - `lookup-by-author` : `{"author" : <name or tag>}`, keys of entries by a matching author
+ - `shutdown` : stop the daemon
+
+example request and response:
+```json
+{"jsonrpc": "2.0", "id": 1, "method": "render-key", "params": {"key": "vaswani2017attention"}}
+{"jsonrpc": "2.0", "id": 1, "result": {"key": "vaswani2017attention", "notes": ["refs.vaswani2017attention.md"], "failures": {}}}
+```
+
+an entry which fails to parse, build, or render doesn't stop the daemon: it is
+skipped, and reported in the `failures` of the result, mapping its key to the
+stage and error as in `dendron_citations.run_state.FailureLog`. it is retried
+by every request until it is fixed in the bibtex file.
+"""
+
+# standard library imports
+from typing import (
+	Optional, Any,
+	Dict, List, Iterable,
+	Callable,
+)
+
+import os
+import sys
+import json
+import socketserver
+from contextlib import redirect_stdout
+
+# local imports
+from dendron_citations.config import Config
+from dendron_citations.citationentry import CitationEntry,compile_template,get_needed_fields
+from dendron_citations.field_map import FieldExtractor,get_field_extractor
+from dendron_citations.bib_index import BibIndex
+from dendron_citations.bib_pool import parse_isolated
+from dendron_citations.run_state import FailureLog
+from dendron_citations.vault_index import VaultIndex
+from dendron_citations.lookup_index import LookupIndex
+from dendron_citations.stages import RunContext,generate_notes,update_tag_members
+
+
+# standard JSON-RPC 2.0 error codes
+JSONRPC_PARSE_ERROR : int = -32700
+JSONRPC_INVALID_REQUEST : int = -32600
+JSONRPC_METHOD_NOT_FOUND : int = -32601
+JSONRPC_INVALID_PARAMS : int = -32602
+JSONRPC_SERVER_ERROR : int = -32000
+
+
+class RefsDaemon:
+	"""keeps a bibtex library and vault warm, and handles JSON-RPC requests against them"""
+
+	def __init__(self, cfg : Config) -> None:
+		if cfg.zotero_db is not None:
+			raise ValueError('daemon mode only supports bibtex files, not `zotero_db`')
+
+		self.cfg : Config = cfg
+		self.running : bool = True
+
+		# compiled once, and cached by `compile_template`
+		compile_template(cfg.template)
+
+		self.index : Optional[VaultIndex] = (
+			VaultIndex(cfg.vault_loc, revalidate = True)
+			if cfg.vault_index
+			else None
+		)
+		self.lookup : Optional[LookupIndex] = LookupIndex(cfg.vault_loc) if cfg.lookup_index else None
+
+		# the parsed library, keyed by lowercase key, and the entry hashes it was parsed from
+		self.bib_index : BibIndex = BibIndex(cfg.bib_filename)
+		self.entries : Dict[str, CitationEntry] = dict()
+		self.entry_hashes : Dict[str, str] = dict()
+		# entries which fail are left out, and retried by the next request
+		self._update_entries(self.bib_index.keys(), FailureLog())
+
+		self.methods : Dict[str, Callable[..., Any]] = {
+			'ping' : lambda : 'pong',
+			'render-key' : self.render_key,
+			'regenerate-changed' : self.regenerate_changed,
+			'lookup-by-author' : self.lookup_by_author,
+			'shutdown' : self.shutdown,
+		}
+
+	def _update_entries(self, keys : Iterable[str], failures : FailureLog) -> None:
+		"""parse `keys` from the bibtex file, and store them
+		
+		entries which fail to parse or build are recorded in `failures` and
+		dropped, and their hash isn't stored, so they count as changed until fixed
+		"""
+		extractor : FieldExtractor = get_field_extractor(self.cfg, get_needed_fields(self.cfg))
+		keys = list(keys)
+		for key in keys:
+			self.entries.pop(key.lower(), None)
+			self.entry_hashes.pop(key.lower(), None)
+
+		for key,val in parse_isolated(self.bib_index.load, keys, failures).items():
+			try:
+				self.entries[key.lower()] = CitationEntry.from_bib(
+					key, val, cfg = self.cfg, process_note = False, extractor = extractor,
+				)
+			except Exception as err: # pylint: disable=broad-except
+				failures.record(key, 'build', err)
+				continue
+			self.entry_hashes[key.lower()] = self.bib_index.entry_hash(key)
+
+	def _reload(self, failures : FailureLog) -> List[str]:
+		"""check the bibtex file for changes, reparsing only changed entries. returns changed keys
+		
+		the file is only indexed again if it changed on disk, but entries which
+		failed before are retried. entries which fail are recorded in `failures`,
+		and not returned
+		"""
+		if self.bib_index.is_stale():
+			self.bib_index.close()
+			self.bib_index = BibIndex(self.cfg.bib_filename)
+
+		changed : List[str] = [
+			key
+			for key in self.bib_index.keys()
+			if self.entry_hashes.get(key.lower()) != self.bib_index.entry_hash(key)
+		]
+		for key in list(self.entries):
+			if key not in self.bib_index:
+				del self.entries[key]
+				del self.entry_hashes[key]
+
+		self._update_entries(changed, failures)
+		return [ key for key in changed if key.lower() in self.entries ]
+
+	def _generate(self, entries : List[CitationEntry], failures : FailureLog) -> List[str]:
+		fnames : List[str] = generate_notes(
+			self.cfg, entries,
+			run = RunContext(index = self.index, lookup = self.lookup, failures = failures),
+		)
+		if self.lookup is not None:
+			self.lookup.retain(str(entry.bib_key) for entry in self.entries.values())
+			if self.cfg.tag_note_members:
+				update_tag_members(self.cfg, self.lookup, self.index)
+			self.lookup.save()
+		if self.index is not None:
+			self.index.save()
+		return fnames
+
+	def render_key(self, key : str) -> Dict[str, Any]:
+		"""regenerate one note. `failures` maps keys of entries which failed to the stage and error"""
+		failures : FailureLog = FailureLog()
+		self._reload(failures)
+		if key not in self.bib_index:
+			raise ValueError(f'key not found in {self.cfg.bib_filename}: {key}')
+		if key.lower() not in self.entries:
+			# it failed to parse, now or when first loaded
+			return {'key' : key, 'notes' : [], 'failures' : failures.failures}
+		return {
+			'key' : str(self.entries[key.lower()].bib_key),
+			'notes' : self._generate([self.entries[key.lower()]], failures),
+			'failures' : failures.failures,
+		}
+
+	def regenerate_changed(self) -> Dict[str, Any]:
+		"""regenerate changed entries. entries which failed are in `failures`, not `keys`"""
+		failures : FailureLog = FailureLog()
+		changed : List[str] = self._reload(failures)
+		return {
+			'keys' : changed,
+			'notes' : self._generate([ self.entries[k.lower()] for k in changed ], failures),
+			'failures' : failures.failures,
+		}
+
+	def lookup_by_author(self, author : str) -> Dict[str, Any]:
+		"""match an author tag such as `author.J-Frankle` exactly, or any part of an author name"""
+		query : str = author.strip().lower()
+		keys : List[str] = list()
+		for entry in self.entries.values():
+			for tag in (entry.author_tags or list()):
+				if (
+					(tag['tag_name'].lower() == query)
+					or ((not query.startswith('author.')) and (query in tag['str_name'].lower()))
+				):
+					keys.append(str(entry.bib_key))
+					break
+
+		return {'keys' : sorted(keys)}
+
+	def shutdown(self) -> str:
+		self.running = False
+		return 'shutting down'
+
+	def handle(self, request : Any) -> Optional[Dict[str, Any]]:
+		"""handle a single JSON-RPC request. returns `None` for notifications"""
+		if not (isinstance(request, dict) and isinstance(request.get('method'), str)):
+			return _error(None, JSONRPC_INVALID_REQUEST, 'invalid request')
+
+		req_id : Any = request.get('id')
+		method : Optional[Callable[..., Any]] = self.methods.get(request['method'])
+		if method is None:
+			return _error(req_id, JSONRPC_METHOD_NOT_FOUND, f'method not found: {request["method"]}')
+
+		params : Any = request.get('params', dict())
+		try:
+			if isinstance(params, dict):
+				result : Any = method(**params)
+			elif isinstance(params, list):
+				result = method(*params)
+			else:
+				return _error(req_id, JSONRPC_INVALID_PARAMS, 'params must be an object or array')
+		except TypeError as err:
+			return _error(req_id, JSONRPC_INVALID_PARAMS, str(err))
+		except Exception as err: # pylint: disable=broad-except
+			return _error(req_id, JSONRPC_SERVER_ERROR, f'{type(err).__name__}: {err}')
+
+		if 'id' not in request:
+			return None
+		return {'jsonrpc' : '2.0', 'id' : req_id, 'result' : result}
+
+	def handle_line(self, line : str) -> Optional[str]:
+		"""handle a line containing a JSON-RPC request, returning the response line"""
+		try:
+			request : Any = json.loads(line)
+		except ValueError as err:
+			return json.dumps(_error(None, JSONRPC_PARSE_ERROR, f'parse error: {err}'))
+
+		response : Optional[Dict[str, Any]] = self.handle(request)
+		return None if response is None else json.dumps(response)
+
+
+def _error(req_id : Any, code : int, message : str) -> Dict[str, Any]:
+	return {'jsonrpc' : '2.0', 'id' : req_id, 'error' : {'code' : code, 'message' : message}}
+
+
+def serve_stdio(daemon : RefsDaemon) -> None:
+	"""read requests from stdin, write responses to stdout
+
+	anything else printed while handling a request goes to stderr, so it can't
+	corrupt the responses
+	"""
+	out = sys.stdout
+	for line in sys.stdin:
+		if not line.strip():
+			continue
+		with redirect_stdout(sys.stderr):
+			response : Optional[str] = daemon.handle_line(line)
+		if response is not None:
+			out.write(response + '\n')
+			out.flush()
+		if not daemon.running:
+			break
+
+def serve_socket(daemon : RefsDaemon, socket_path : str) -> None:
+	"""listen on a unix socket, handling one connection at a time"""
+	if not hasattr(socketserver, 'UnixStreamServer'):
+		raise OSError('unix sockets are not available on this platform, use stdin/stdout instead')
+
+	class _Handler(socketserver.StreamRequestHandler):
+		def handle(self) -> None:
+			for raw in self.rfile:
+				line : str = raw.decode('utf-8')
+				if not line.strip():
+					continue
+				response : Optional[str] = daemon.handle_line(line)
+				if response is not None:
+					self.wfile.write((response + '\n').encode('utf-8'))
+					self.wfile.flush()
+				if not daemon.running:
+					break
+
+	if os.path.exists(socket_path):
+		os.remove(socket_path)
+
+	with socketserver.UnixStreamServer(socket_path, _Handler) as server: # type: ignore[attr-defined]
+		try:
+			while daemon.running:
+				server.handle_request()
+		finally:
+			os.remove(socket_path)
+
+def run_daemon(cfg : Config, socket_path : Optional[str] = None) -> None:
+	"""start the daemon, on a unix socket if `socket_path` is given, otherwise on stdin/stdout"""
+	if socket_path is not None:
+		daemon : RefsDaemon = RefsDaemon(cfg)
+		print(f'listening on {socket_path}', file = sys.stderr)
+		serve_socket(daemon, socket_path)
+	else:
+		with redirect_stdout(sys.stderr):
+			daemon = RefsDaemon(cfg)
+		serve_stdio(daemon)
@@ -0,0 +1,182 @@
+"""export of every entry to a single JSONL file or SQLite database
+
+other tools (search, static sites) used to recover metadata by parsing every
+note in the vault. setting `export_path` in the config makes each run also
+write the entries, with author tags and processed notes, to one file, which
+can be loaded in a single read. the format depends on the extension:
+
+ - `.jsonl`, or `.jsonl.gz` for gzip : one JSON object per line, per entry
+ - `.sqlite`, `.sqlite3`, or `.db` : an `entries` table with a few columns
+   for querying and the full entry as JSON in `data`, and an `entry_authors`
+   table with the author tags of each entry
+
+entries are written as they pass through the pipeline. runs which only
+process some entries (selective, resumed, or incremental zotero runs) keep the
+records of the other entries from the previous export, and entries which are
+no longer in the source are dropped.
+"""
+
+# standard library imports
+from typing import (
+	Optional, Any,
+	Dict, List, Tuple, Iterable, IO,
+)
+
+import os
+import sys
+import gzip
+import json
+import sqlite3
+from dataclasses import asdict
+
+# local imports
+from dendron_citations.citationentry import CitationEntry
+
+
+JSONL_EXTENSIONS : Tuple[str, ...] = ('.jsonl', '.jsonl.gz')
+SQLITE_EXTENSIONS : Tuple[str, ...] = ('.sqlite', '.sqlite3', '.db')
+
+_SQLITE_SCHEMA : Tuple[str, ...] = (
+	"""CREATE TABLE IF NOT EXISTS entries (
+		bib_key TEXT PRIMARY KEY,
+		zotero_key TEXT,
+		title TEXT,
+		typ TEXT,
+		date TEXT,
+		abstract TEXT,
+		note TEXT,
+		data TEXT NOT NULL
+	)""",
+	"""CREATE TABLE IF NOT EXISTS entry_authors (
+		bib_key TEXT NOT NULL,
+		position INTEGER NOT NULL,
+		tag_name TEXT,
+		str_name TEXT
+	)""",
+	'CREATE INDEX IF NOT EXISTS entry_authors_bib_key ON entry_authors(bib_key)',
+	'CREATE INDEX IF NOT EXISTS entry_authors_tag_name ON entry_authors(tag_name)',
+)
+
+
+def entry_record(entry : CitationEntry) -> Dict[str, Any]:
+	"""everything in `entry`, as a JSON-serializable dict"""
+	record : Dict[str, Any] = asdict(entry)
+	if record['bib_meta'] is not None:
+		record['bib_meta'] = dict(record['bib_meta'])
+	return record
+
+
+class CitationExporter:
+	"""base class for exporters. `add` is called for each entry, then `finish` or `abort`"""
+
+	def __init__(self, path : str) -> None:
+		self.path : str = path
+
+	def add(self, entry : CitationEntry) -> None:
+		raise NotImplementedError()
+
+	def finish(self, keys : Optional[Iterable[str]] = None) -> None:
+		"""complete the export. if `keys` is given, drop entries not in it"""
+		raise NotImplementedError()
+
+	def abort(self) -> None:
+		"""stop after an error, leaving the previous export usable"""
+		raise NotImplementedError()
+
+
+class JsonlExporter(CitationExporter):
+	"""writes to a temporary file, which replaces the export once finished"""
+
+	def __init__(self, path : str) -> None:
+		super().__init__(path)
+		self.tmp_path : str = path + '.tmp'
+		self.written : set = set()
+		self._f : IO[str] = self._open(self.tmp_path, 'wt')
+
+	def _open(self, path : str, mode : str) -> IO[str]:
+		if self.path.endswith('.gz'):
+			return gzip.open(path, mode, encoding = 'utf-8') # type: ignore
+		return open(path, mode, encoding = 'utf-8')
+
+	def add(self, entry : CitationEntry) -> None:
+		self._f.write(json.dumps(entry_record(entry), default = str) + '\n')
+		self.written.add(str(entry.bib_key))
+
+	def _carry_over(self, keep : Optional[set]) -> None:
+		"""copy records of entries which weren't written in this run from the previous export"""
+		if not os.path.isfile(self.path):
+			return
+
+		try:
+			with self._open(self.path, 'rt') as f_old:
+				for line in f_old:
+					key : str = json.loads(line)['bib_key']
+					if (key not in self.written) and ((keep is None) or (key in keep)):
+						self._f.write(line)
+		except (OSError, EOFError, ValueError, KeyError) as err:
+			print(f"WARNING: couldn't read previous export {self.path}, some entries may be missing:\t{err}", file = sys.stderr)
+
+	def finish(self, keys : Optional[Iterable[str]] = None) -> None:
+		self._carry_over(set(keys) if keys is not None else None)
+		self._f.close()
+		os.replace(self.tmp_path, self.path)
+
+	def abort(self) -> None:
+		self._f.close()
+		os.remove(self.tmp_path)
+
+
+class SqliteExporter(CitationExporter):
+	"""upserts each entry into the database, committing once finished"""
+
+	def __init__(self, path : str) -> None:
+		super().__init__(path)
+		# entries are added from a pipeline stage, but never from two threads at once
+		self._conn : sqlite3.Connection = sqlite3.connect(path, check_same_thread = False)
+		for statement in _SQLITE_SCHEMA:
+			self._conn.execute(statement)
+
+	def add(self, entry : CitationEntry) -> None:
+		record : Dict[str, Any] = entry_record(entry)
+		key : str = str(entry.bib_key)
+		self._conn.execute(
+			'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+			(
+				key, entry.zotero_key, entry.title, entry.typ, entry.date, entry.abstract, entry.note,
+				json.dumps(record, default = str),
+			),
+		)
+		self._conn.execute('DELETE FROM entry_authors WHERE bib_key = ?', (key,))
+		authors : List[Tuple[str, int, str, str]] = [
+			(key, i, tag['tag_name'], tag['str_name'])
+			for i,tag in enumerate(entry.author_tags or list())
+		]
+		self._conn.executemany('INSERT INTO entry_authors VALUES (?, ?, ?, ?)', authors)
+
+	def finish(self, keys : Optional[Iterable[str]] = None) -> None:
+		if keys is not None:
+			self._conn.execute('CREATE TEMP TABLE keep (bib_key TEXT PRIMARY KEY)')
+			self._conn.executemany('INSERT OR IGNORE INTO keep VALUES (?)', ((k,) for k in keys))
+			self._conn.execute('DELETE FROM entries WHERE bib_key NOT IN (SELECT bib_key FROM keep)')
+			self._conn.execute('DELETE FROM entry_authors WHERE bib_key NOT IN (SELECT bib_key FROM keep)')
+			self._conn.execute('DROP TABLE keep')
+		self._conn.commit()
+		self._conn.close()
+
+	def abort(self) -> None:
+		# entries added so far are complete, so keep them
+		self._conn.commit()
+		self._conn.close()
+
+
+def open_exporter(path : str) -> CitationExporter:
+	"""the exporter for `path`, chosen by its extension
+
+	### Raises:
+	 - `ValueError` : for unknown extensions
+	"""
+	if path.endswith(JSONL_EXTENSIONS):
+		return JsonlExporter(path)
+	if path.endswith(SQLITE_EXTENSIONS):
+		return SqliteExporter(path)
+	raise ValueError(f'unknown extension for `export_path` {path!r}, expected one of {JSONL_EXTENSIONS + SQLITE_EXTENSIONS}')
@@ -0,0 +1,140 @@
+"""declarative mapping from bibtex fields to `CitationEntry` fields
+
+different tools export the same information under different field names, such
+as `abstract` or `abstractnote`, and `url` or `bdsk-url-1`. the mapping lists,
+for each `CitationEntry` field, the bibtex fields to look in, in order of
+preference, how to split the value into a list, and how to process each value.
+it can be extended with `field_map` in the config, where each given field
+replaces the default spec for that field:
+
+```yaml
+field_map:
+  abstract:
+    keys: [abstract, abstractnote, summary, abstract_en]
+  keywords:
+    keys: [keywords, mendeley-tags, tags]
+    split: ','
+    process: tag
+```
+
+the mapping is compiled once into a `FieldExtractor`, which makes a single pass
+over the fields of each entry. fields which aren't needed (see
+`dendron_citations.citationentry.get_needed_fields`) are left out when
+compiling, so they aren't looked up or processed at all.
+"""
+
+# standard library imports
+from typing import (
+	Optional, Any,
+	Dict, List, Tuple, Mapping, FrozenSet,
+	Callable,
+)
+
+import json
+from functools import lru_cache
+
+# local imports
+from dendron_citations.config import Config
+from dendron_citations.process_meta import strip_bibtex_fmt,process_tag_name
+
+
+FieldSpec = Dict[str, Any]
+FieldMap = Dict[str, FieldSpec]
+
+DEFAULT_FIELD_MAP : FieldMap = {
+	'title' : {'keys' : ['title']},
+	'typ' : {'keys' : ['typ']},
+	'date' : {'keys' : ['date']},
+	'links' : {'keys' : ['url', 'bdsk-url-1'], 'split' : ';'},
+	'files' : {'keys' : ['file'], 'split' : ';', 'process' : 'file'},
+	'keywords' : {'keys' : ['keywords', 'mendeley-tags'], 'split' : ',', 'process' : 'tag'},
+	'collections' : {'keys' : ['collections'], 'split' : ','},
+	'abstract' : {'keys' : ['abstract', 'abstractnote', 'abstractNote', 'summary']},
+	# notes are processed later, see `CitationEntry.from_bib`
+	'note' : {'keys' : ['note', 'notes', 'annote', 'annotation', 'annotations', 'comments'], 'process' : 'raw'},
+}
+
+def _process_file(s : str) -> str:
+	return strip_bibtex_fmt(s).replace(r'\:', ':').replace('\\\\', '/')
+
+FIELD_PROCESSORS : Dict[str, Callable[[str], str]] = {
+	'strip' : strip_bibtex_fmt,
+	'raw' : lambda x : x,
+	'tag' : lambda x : process_tag_name(strip_bibtex_fmt(x)),
+	'file' : _process_file,
+}
+
+
+class FieldExtractor:
+	"""extracts `CitationEntry` fields from the fields of a bibtex entry"""
+
+	def __init__(
+			self, 
+			field_map : Optional[FieldMap] = None, 
+			fields : Optional[FrozenSet[str]] = None,
+		) -> None:
+		"""compile `field_map`, which is merged over `DEFAULT_FIELD_MAP`, for only `fields` if given
+
+		### Raises:
+		 - `ValueError` : for unknown target fields or processors
+		"""
+		spec : FieldMap = {**DEFAULT_FIELD_MAP, **(field_map or dict())}
+
+		# bibtex field -> list of (preference, target field)
+		self._sources : Dict[str, List[Tuple[int, str]]] = dict()
+		# target field -> function of the raw value
+		self._convert : Dict[str, Callable[[Any], Any]] = dict()
+		# target fields which are lists
+		self._lists : List[str] = list()
+
+		for field,field_spec in spec.items():
+			if field not in DEFAULT_FIELD_MAP:
+				raise ValueError(f'unknown field in `field_map`: {field}, expected one of {list(DEFAULT_FIELD_MAP)}')
+			process_name : str = field_spec.get('process', 'strip')
+			if process_name not in FIELD_PROCESSORS:
+				raise ValueError(f'unknown `process` for field {field}: {process_name}, expected one of {list(FIELD_PROCESSORS)}')
+			if (fields is not None) and (field not in fields):
+				continue
+
+			for i,key in enumerate(field_spec.get('keys', [field])):
+				self._sources.setdefault(key, list()).append((i, field))
+
+			self._convert[field] = self._make_converter(FIELD_PROCESSORS[process_name], field_spec.get('split'))
+			if field_spec.get('split') is not None:
+				self._lists.append(field)
+
+	@staticmethod
+	def _make_converter(process : Callable[[str], str], sep : Optional[str]) -> Callable[[Any], Any]:
+		if sep is None:
+			return process
+		return lambda val : [ process(x) for x in str(val).split(sep) ]
+
+	def __call__(self, fields : Mapping[str, Any]) -> Dict[str, Any]:
+		"""get every target field. missing fields are `None`, or an empty list for split fields"""
+		found : Dict[str, Tuple[int, Any]] = dict()
+		for key,val in fields.items():
+			for pref,field in self._sources.get(key, ()):
+				if (field not in found) or (pref < found[field][0]):
+					found[field] = (pref, val)
+
+		output : Dict[str, Any] = { field : None for field in self._convert }
+		for field in self._lists:
+			output[field] = list()
+
+		for field,(_,val) in found.items():
+			try:
+				output[field] = self._convert[field](val)
+			except KeyError:
+				# biblib raises this for undefined macros
+				pass
+
+		return output
+
+
+@lru_cache(maxsize = 8)
+def _compile_field_map(field_map_json : str, fields : Optional[FrozenSet[str]]) -> FieldExtractor:
+	return FieldExtractor(json.loads(field_map_json), fields)
+
+def get_field_extractor(cfg : Config, fields : Optional[FrozenSet[str]] = None) -> FieldExtractor:
+	"""the compiled extractor for `cfg.field_map`, for only `fields` if given, cached"""
+	return _compile_field_map(json.dumps(cfg.field_map, sort_keys = True), fields)
@@ -0,0 +1,181 @@
+"""resource limits for background runs, and a report of the throughput achieved
+
+a full run writes every changed note as fast as the disk allows, which can
+disrupt interactive work when it runs in the background. with `ResourceLimits`:
+
+ - `max_writes_per_sec` : notes are written at most this often. writes are
+   spaced out evenly, and the pipeline behind the writer fills up and stalls
+   (see `dendron_citations.pipeline`) rather than running ahead
+ - `max_memory_mb` : while the resident memory of the process is over this,
+   no new entries are read from the source until the entries already in the
+   pipeline drain. if it stays over with nothing queued, the run carries on,
+   since holding back can't help
+
+the number of concurrent pandoc processes is already capped by `pandoc_max_procs`.
+"""
+
+# standard library imports
+from typing import (
+	Optional, Any,
+	Dict, List,
+	Callable,
+)
+
+import os
+import sys
+import gc
+import time
+import threading
+
+# optional, unix only
+try:
+	import resource
+	RESOURCE_AVAILABLE : bool = True
+except ImportError:
+	RESOURCE_AVAILABLE = False
+
+
+# how often to check memory again while holding back the source, in seconds
+MEMORY_POLL_INTERVAL : float = 0.1
+
+
+def current_memory_mb() -> Optional[float]:
+	"""resident memory of this process, or `None` if we can't tell
+
+	read from `/proc` on linux. elsewhere, the peak so far is the best we can do
+	"""
+	try:
+		with open('/proc/self/statm', 'r', encoding = 'utf-8') as f:
+			return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+	except (OSError, ValueError, IndexError, AttributeError):
+		pass
+	return peak_memory_mb()
+
+def peak_memory_mb() -> Optional[float]:
+	"""peak resident memory of this process, or `None` if we can't tell"""
+	if not RESOURCE_AVAILABLE:
+		return None
+	max_rss : int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# kilobytes on linux, bytes on macos
+	return max_rss / (2**20 if sys.platform == 'darwin' else 2**10)
+
+
+class ResourceLimits:
+	"""throttles writes and reading from the source, counting both for a throughput report"""
+
+	def __init__(
+			self,
+			max_writes_per_sec : Optional[float] = None,
+			max_memory_mb : Optional[float] = None,
+		) -> None:
+		"""
+		### Parameters:
+		 - `max_writes_per_sec : Optional[float]`
+		   maximum rate of note writes
+		   (defaults to `None`, meaning no limit)
+		 - `max_memory_mb : Optional[float]`
+		   resident memory above which the source is held back
+		   (defaults to `None`, meaning no limit)
+
+		### Raises:
+		 - `ValueError` : if a limit is not positive
+		"""
+		for name,val in (('max_writes_per_sec', max_writes_per_sec), ('max_memory_mb', max_memory_mb)):
+			if (val is not None) and (val <= 0):
+				raise ValueError(f'`{name}` must be positive, got {val}')
+		if (max_memory_mb is not None) and (current_memory_mb() is None):
+			print('WARNING: memory use of this process is unknown on this platform, ignoring `max_memory_mb`', file = sys.stderr)
+			max_memory_mb = None
+
+		self.max_writes_per_sec : Optional[float] = max_writes_per_sec
+		self.max_memory_mb : Optional[float] = max_memory_mb
+
+		self.n_items : int = 0
+		self.n_writes : int = 0
+		# seconds spent held back by each limit
+		self.write_wait : float = 0.0
+		self.memory_wait : float = 0.0
+
+		self._start : float = time.monotonic()
+		self._next_write : float = self._start
+		self._warned_memory : bool = False
+		# writes come from the sink, and from tag notes after the pipeline
+		self._lock : threading.Lock = threading.Lock()
+
+	@property
+	def is_limited(self) -> bool:
+		return (self.max_writes_per_sec is not None) or (self.max_memory_mb is not None)
+
+	def wait_write(self) -> None:
+		"""called before writing a note. blocks until the write is allowed"""
+		with self._lock:
+			self.n_writes += 1
+			if self.max_writes_per_sec is None:
+				return
+			now : float = time.monotonic()
+			self._next_write = max(self._next_write, now)
+			delay : float = self._next_write - now
+			self._next_write += 1.0 / self.max_writes_per_sec
+			self.write_wait += delay
+
+		if delay > 0:
+			time.sleep(delay)
+
+	def wait_memory(self, backlog : Callable[[], int]) -> None:
+		"""called before the source passes on an entry. blocks while memory is
+		over the limit, and `backlog()`, the number of entries queued in the
+		pipeline, is not zero
+		"""
+		self.n_items += 1
+		if self.max_memory_mb is None:
+			return
+
+		start : float = time.monotonic()
+		collected : bool = False
+		while True:
+			memory : Optional[float] = current_memory_mb()
+			if (memory is None) or (memory <= self.max_memory_mb):
+				break
+			if backlog() == 0:
+				if not self._warned_memory:
+					print(
+						f'WARNING: using {memory:.0f}MB with nothing queued, over `max_memory_mb` of {self.max_memory_mb:.0f}MB. continuing',
+						file = sys.stderr,
+					)
+					self._warned_memory = True
+				break
+			if not collected:
+				gc.collect()
+				collected = True
+				continue
+			time.sleep(MEMORY_POLL_INTERVAL)
+
+		self.memory_wait += time.monotonic() - start
+
+	def report(self) -> Dict[str, Any]:
+		"""throughput achieved so far"""
+		seconds : float = time.monotonic() - self._start
+		return {
+			'seconds' : seconds,
+			'entries' : self.n_items,
+			'entries_per_sec' : self.n_items / seconds if seconds > 0 else 0.0,
+			'writes' : self.n_writes,
+			'writes_per_sec' : self.n_writes / seconds if seconds > 0 else 0.0,
+			'write_wait_seconds' : self.write_wait,
+			'memory_wait_seconds' : self.memory_wait,
+			'peak_memory_mb' : peak_memory_mb(),
+		}
+
+	def format_report(self) -> str:
+		rep : Dict[str, Any] = self.report()
+		lines : List[str] = [
+			f'  read {rep["entries"]} entries and wrote {rep["writes"]} notes in {rep["seconds"]:.2f}s',
+			f'  ({rep["entries_per_sec"]:.1f} entries/s, {rep["writes_per_sec"]:.1f} writes/s)',
+		]
+		if self.max_writes_per_sec is not None:
+			lines.append(f'  held back {rep["write_wait_seconds"]:.2f}s by `max_writes_per_sec` of {self.max_writes_per_sec}')
+		if self.max_memory_mb is not None:
+			lines.append(f'  held back {rep["memory_wait_seconds"]:.2f}s by `max_memory_mb` of {self.max_memory_mb}')
+		if rep['peak_memory_mb'] is not None:
+			lines.append(f'  peak memory {rep["peak_memory_mb"]:.1f}MB')
+		return '\n'.join(lines)
@@ -0,0 +1,196 @@
+"""persistent index from authors, keywords, and collections to citation keys
+
+author names only used to survive a run as the list of names in each author's
+tag note, so finding every reference by an author meant searching the vault.
+instead, we keep an index file in the vault recording the author tags (with the
+spelling of each name), keywords, and collections of every entry. it is updated
+with each run, only touching the entries which were regenerated, and can be
+queried without parsing the bibtex file:
+
+```bash
+dendron_gen_refs.py [cfg_path] --lookup --author=Frankle
+```
+
+the file also contains, sorted, the inverted maps from each author tag, keyword,
+and collection to citation keys, for use by other tools.
+"""
+
+# standard library imports
+from typing import (
+	Optional, Any,
+	Dict, List, Iterable,
+)
+
+import os
+import sys
+import json
+from collections import defaultdict
+from itertools import chain
+
+# local imports
+from dendron_citations.citationentry import CitationEntry
+from dendron_citations.process_meta import process_tag_name
+from dendron_citations.sharding import unshard_author_tag
+
+
+# filename of the index, placed in the vault
+LOOKUP_INDEX_FILENAME : str = '.dendron_citations.lookup_index.json'
+
+# bump this if the format of the index changes, to force a rebuild
+LOOKUP_INDEX_VERSION : int = 1
+
+# per entry: `authors` is a list of `[tag_name, str_name]`, the rest are lists of strings,
+# except `note`, the name of the reference note (which may be missing)
+LookupRecord = Dict[str, Any]
+
+
+class LookupIndex:
+	"""index of authors, keywords, and collections, keyed by citation key"""
+
+	def __init__(self, vault_loc : str, index_path : Optional[str] = None) -> None:
+		"""load the index for a vault, if it exists
+
+		### Parameters:
+		 - `vault_loc : str`
+		   directory of the vault
+		 - `index_path : Optional[str]`
+		   where to store the index
+		   (defaults to `None`, meaning `LOOKUP_INDEX_FILENAME` in the vault)
+		"""
+		self.index_path : str = (
+			index_path
+			if index_path is not None
+			else os.path.join(vault_loc, LOOKUP_INDEX_FILENAME)
+		)
+		self.entries : Dict[str, LookupRecord] = dict()
+		# tag -> hash of the members last written to its tag note, see `tag_members`
+		self.tag_member_hashes : Dict[str, str] = dict()
+		self._load()
+
+	def _load(self) -> None:
+		if not os.path.isfile(self.index_path):
+			return
+
+		try:
+			with open(self.index_path, 'r', encoding = 'utf-8') as f:
+				data : Dict[str, Any] = json.load(f)
+		except (OSError, ValueError) as err:
+			print(f"WARNING: couldn't read lookup index {self.index_path}, will rebuild it:\t{err}", file = sys.stderr)
+			return
+
+		if data.get('version') == LOOKUP_INDEX_VERSION:
+			self.entries = data['entries']
+			self.tag_member_hashes = data.get('tag_member_hashes', dict())
+
+	def add(self, entry : CitationEntry, note : Optional[str] = None) -> None:
+		"""record an entry, and optionally the name of its note, replacing any previous record with the same key"""
+		self.entries[str(entry.bib_key)] = {
+			**({'note' : note} if note is not None else dict()),
+			'authors' : [
+				[tag['tag_name'], tag['str_name']]
+				for tag in (entry.author_tags or list())
+			],
+			'keywords' : list(entry.keywords or list()),
+			'collections' : list(entry.collections or list()),
+		}
+
+	def retain(self, keys : Iterable[str]) -> None:
+		"""drop every entry not in `keys`, such as ones removed from the bibtex file"""
+		keep = set(keys)
+		self.entries = {
+			key : val
+			for key,val in self.entries.items()
+			if key in keep
+		}
+
+	def inverted(self) -> Dict[str, Dict[str, Any]]:
+		"""maps from each author tag, keyword, and collection to sorted keys
+
+		author tags map to `{'keys' : [...], 'aliases' : [...]}`, where aliases
+		are all the spellings of the name seen for that tag
+		"""
+		author_keys : Dict[str, set] = defaultdict(set)
+		author_aliases : Dict[str, set] = defaultdict(set)
+		keywords : Dict[str, set] = defaultdict(set)
+		collections : Dict[str, set] = defaultdict(set)
+
+		for key,rec in self.entries.items():
+			for tag_name,str_name in rec['authors']:
+				author_keys[tag_name].add(key)
+				author_aliases[tag_name].add(str_name)
+			for kw in rec['keywords']:
+				keywords[kw].add(key)
+			for coll in rec['collections']:
+				collections[coll].add(key)
+
+		return {
+			'authors' : {
+				tag : {'keys' : sorted(keys), 'aliases' : sorted(author_aliases[tag])}
+				for tag,keys in sorted(author_keys.items())
+			},
+			'keywords' : { k : sorted(v) for k,v in sorted(keywords.items()) },
+			'collections' : { k : sorted(v) for k,v in sorted(collections.items()) },
+		}
+
+	def save(self) -> None:
+		with open(self.index_path, 'w', encoding = 'utf-8') as f:
+			json.dump(
+				{
+					'version' : LOOKUP_INDEX_VERSION,
+					'entries' : self.entries,
+					'tag_member_hashes' : self.tag_member_hashes,
+					**self.inverted(),
+				},
+				f,
+				sort_keys = True,
+			)
+
+	def tag_members(self, note_prefix : str) -> Dict[str, List[str]]:
+		"""map from every tag (author tags, keywords, and collections) to the sorted names of the notes with it
+
+		entries recorded without a note name are assumed to be at `note_prefix` followed by the key
+		"""
+		members : Dict[str, set] = defaultdict(set)
+		for key,rec in self.entries.items():
+			note : str = rec.get('note', f'{note_prefix}{key}')
+			for tag_name,_ in rec['authors']:
+				members[tag_name].add(note)
+			for tag in chain(rec['keywords'], rec['collections']):
+				members[tag].add(note)
+
+		return { tag : sorted(notes) for tag,notes in members.items() }
+
+	def by_author(self, author : str) -> Dict[str, List[str]]:
+		"""find entries by an author, given a tag such as `author.J-Frankle` or `J-Frankle`
+		(sharded or not), or any part of a spelling of their name (case insensitive)
+
+		returns `{'keys' : [...], 'aliases' : [...]}`
+		"""
+		query : str = author.strip().lower()
+		query_tag : str = unshard_author_tag(query if query.startswith('author.') else f'author.{query}')
+		keys : set = set()
+		aliases : set = set()
+		for key,rec in self.entries.items():
+			for tag_name,str_name in rec['authors']:
+				if (unshard_author_tag(tag_name).lower() == query_tag) or (query in str_name.lower()):
+					keys.add(key)
+					aliases.add(str_name)
+
+		return {'keys' : sorted(keys), 'aliases' : sorted(aliases)}
+
+	def by_keyword(self, keyword : str) -> List[str]:
+		"""find entries with a keyword (case insensitive)"""
+		query : str = process_tag_name(keyword.strip()).lower()
+		return sorted(
+			key
+			for key,rec in self.entries.items()
+			if any(kw.lower() == query for kw in rec['keywords'])
+		)
+
+	def by_collection(self, collection : str) -> List[str]:
+		"""find entries in a collection"""
+		return sorted(
+			key
+			for key,rec in self.entries.items()
+			if collection in rec['collections']
+		)
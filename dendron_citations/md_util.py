@@ -3,12 +3,14 @@
 from typing import (
 	Any, Optional,
 	Dict, List, Tuple, Iterable,
-	Callable,
+	Callable, Container,
 )
 
 import os
 import time
+import hashlib
 from copy import deepcopy
+from functools import lru_cache
 import string
 import random
 
@@ -51,13 +53,44 @@ def keylist_access_nested_dict(
 
 
 
-def gen_dendron_ID():
+DENDRON_ID_CHARS : str = string.ascii_letters + string.digits
+DENDRON_ID_LENGTH : int = 21
+
+def gen_dendron_ID(
+		seed : Optional[str] = None,
+		taken : Optional[Container[str]] = None,
+	) -> str:
 	"""generate a valid dendron ID
 	
 	should be 21 characters, alphanumeric
+
+	### Parameters:
+	 - `seed : Optional[str]`   
+	   if given, the ID is derived from a hash of `seed`, so that the same
+	   seed always gives the same ID. otherwise, the ID is random
+	   (defaults to `None`)
+	 - `taken : Optional[Container[str]]`   
+	   IDs which are already in use, and should be avoided
+	   (defaults to `None`)
 	"""
-	
-	return ''.join(random.choices(string.ascii_letters + string.digits, k = 21))
+
+	attempt : int = 0
+	while True:
+		if seed is None:
+			output : str = ''.join(random.choices(DENDRON_ID_CHARS, k = DENDRON_ID_LENGTH))
+		else:
+			# salt the seed on collisions, so the result is still deterministic
+			salted : str = seed if attempt == 0 else f'{seed}#{attempt}'
+			num : int = int.from_bytes(hashlib.sha256(salted.encode('utf-8')).digest(), 'big')
+			chars : List[str] = list()
+			for _ in range(DENDRON_ID_LENGTH):
+				num, rem = divmod(num, len(DENDRON_ID_CHARS))
+				chars.append(DENDRON_ID_CHARS[rem])
+			output = ''.join(chars)
+
+		if (taken is None) or (output not in taken):
+			return output
+		attempt += 1
 
 
 
@@ -144,6 +177,58 @@ DEFAULT_WRITER : Callable = lambda x : yaml.dump(
 	width = 9999,
 )
 
+class PandocMarkdownWriter:
+	"""writes notes with fixed settings, for writing many notes in bulk
+
+	the order of the frontmatter keys is computed once for each set of keys,
+	and reused, since notes of the same kind all have the same keys
+	"""
+
+	def __init__(
+			self,
+			delim : str = '---',
+			keyorder : Tuple[str,...] = DEFAULT_KEYORDER,
+			writer : Callable[[dict],str] = DEFAULT_WRITER,
+		) -> None:
+		"""see `PandocMarkdown` for the parameters"""
+		self.delim : str = delim
+		self.keyorder : Tuple[str,...] = keyorder
+		self.writer : Callable[[dict],str] = writer
+		# keys of the frontmatter, in their original order -> keys in output order
+		self._key_orders : Dict[Tuple[str,...], Tuple[str,...]] = dict()
+
+	def key_order(self, keys : Tuple[str,...]) -> Tuple[str,...]:
+		"""`keys` in the order given by `keyorder`, followed by any others in their original order"""
+		order : Optional[Tuple[str,...]] = self._key_orders.get(keys)
+		if order is None:
+			key_set : set = set(keys)
+			order = (
+				*( k for k in self.keyorder if k in key_set ),
+				*( k for k in keys if k not in self.keyorder ),
+			)
+			self._key_orders[keys] = order
+		return order
+
+	def dumps(self, yaml_data : Dict[str, Any], content : str) -> str:
+		return '\n'.join([
+			self.delim,
+			self.writer({
+				k : yaml_data[k]
+				for k in self.key_order(tuple(yaml_data))
+			}).strip(),
+			self.delim,
+			content.lstrip(),
+		])
+
+@lru_cache(maxsize = 16)
+def get_md_writer(
+		delim : str = '---',
+		keyorder : Tuple[str,...] = DEFAULT_KEYORDER,
+		writer : Callable[[dict],str] = DEFAULT_WRITER,
+	) -> PandocMarkdownWriter:
+	"""the shared writer for these settings, so its key orders are reused across notes"""
+	return PandocMarkdownWriter(delim, keyorder, writer)
+
 class PandocMarkdown:
 	"""class for handling pandoc-style markdown and frontmatter"""
 
@@ -191,8 +276,20 @@ class PandocMarkdown:
 		"""
 
 		with open(filename, "r", encoding = "utf-8") as f:
-			# split the document by yaml file front matter
-			sections : List[str] = f.read().split(self.delim)
+			self.loads(f.read(), filename = filename)
+
+	def loads(self, s : str, filename : str = '<string>') -> None:
+		"""load a string into the pandoc markdown object
+		
+		### Parameters:
+		 - `s : str`   
+		   the contents of a markdown file
+		 - `filename : str`   
+		   only used in error messages
+		"""
+
+		# split the document by yaml file front matter
+		sections : List[str] = s.split(self.delim)
 
 		# check the zeroth section is empty
 		if sections[0].strip():
@@ -214,31 +311,17 @@ class PandocMarkdown:
 		"""updates the updated time in the frontmatter"""
 		self.yaml_data['updated'] = int(time.time() * 1000)
 	
-	def dumps(self) -> str:
+	def dumps(self, md_writer : Optional['PandocMarkdownWriter'] = None) -> str:
+		"""the note as a string. does not modify the note
+
+		uses `md_writer` if given, otherwise the shared writer for this note's settings
+		"""
 		if (self.yaml_data is None) or (self.content is None):
 			raise Exception('')
 
-		self.keyorder = tuple(list(self.keyorder) + [
-			k for k in self.yaml_data
-			if k not in self.keyorder
-		])
-		
-		# for k in self.keyorder:
-		# 	if not (k in self.yaml_data):
-		# 		raise KeyError(f'key {k} found in keyorder but not in yaml_data')
-
-		self.yaml_data = {
-			k : self.yaml_data[k]
-			for k in self.keyorder
-			if k in self.yaml_data
-		}
-
-		return '\n'.join([
-			self.delim,
-			self.writer(self.yaml_data).strip(),
-			self.delim,
-			self.content.lstrip(),
-		])
+		if md_writer is None:
+			md_writer = get_md_writer(self.delim, self.keyorder, self.writer)
+		return md_writer.dumps(self.yaml_data, self.content)
 
 	@staticmethod
 	def get_dendron_template(
@@ -264,6 +347,52 @@ class PandocMarkdown:
 
 		return file
 
+# the output of the template is placed between these markers in reference notes.
+# on regeneration, only the text between them is replaced, so anything written
+# outside of them is kept
+GENERATED_BEGIN : str = '<!-- dendron_citations:begin -->'
+GENERATED_END : str = '<!-- dendron_citations:end -->'
+
+def wrap_generated(generated : str) -> str:
+	"""place `generated` between `GENERATED_BEGIN` and `GENERATED_END`"""
+	return f'{GENERATED_BEGIN}\n{generated.strip()}\n{GENERATED_END}'
+
+def split_generated(content : str) -> Optional[Tuple[str, str, str]]:
+	"""split `content` into the text before, inside, and after the generated region
+
+	returns `None` if the markers are missing, such as for notes made by older versions
+	"""
+	begin : int = content.find(GENERATED_BEGIN)
+	if begin < 0:
+		return None
+	end : int = content.find(GENERATED_END, begin + len(GENERATED_BEGIN))
+	if end < 0:
+		return None
+	return (
+		content[:begin],
+		content[begin + len(GENERATED_BEGIN) : end].strip(),
+		content[end + len(GENERATED_END):],
+	)
+
+def merge_generated(old_content : Optional[str], generated : str, append : bool = False) -> str:
+	"""replace the generated region of `old_content` with `generated`, keeping the rest
+
+	if `old_content` has no markers, the wrapped `generated` is appended to it
+	if `append` is true, and replaces it otherwise. if `old_content` is `None`,
+	the result is just the wrapped `generated`
+	"""
+	parts : Optional[Tuple[str, str, str]] = (
+		split_generated(old_content)
+		if old_content is not None
+		else None
+	)
+	if parts is None:
+		if append and (old_content is not None):
+			return old_content.rstrip() + '\n\n' + wrap_generated(generated) + '\n'
+		return wrap_generated(generated) + '\n'
+	before, _, after = parts
+	return before + wrap_generated(generated) + after
+
 def modify_file_fm(file : str, apply_funcs : Tuple[Callable,...]) -> None:
 	pdm : PandocMarkdown = PandocMarkdown()
 	pdm.load(file)
@@ -0,0 +1,254 @@
+"""asyncio engine for running many pandoc note conversions concurrently
+
+`process_note_HACKY` calls pandoc once per note, blocking until it finishes.
+here, we instead keep a bounded number of pandoc subprocesses in flight, each
+with a timeout, so that a single pathological note cannot stall the whole run.
+if a `pandoc server` url is given, requests are sent to it instead of
+spawning a new process per note.
+
+timeouts, crashes, and connection errors are treated as transient, and those
+conversions are retried a few times before falling back to plaintext.
+"""
+
+# standard library imports
+from typing import (
+	Optional, Union,
+	List, Tuple, Sequence,
+	Callable,
+)
+
+import sys
+import json
+import time
+import shutil
+import asyncio
+from urllib.parse import urlsplit
+
+# local imports
+from dendron_citations.dc_util import (
+	OptionalStr,
+)
+from dendron_citations.process_meta import (
+	PYPANDOC_AVAILABLE,
+	classify_note,postprocess_pandoc_note,process_note_plain,
+)
+
+if PYPANDOC_AVAILABLE:
+	import pypandoc # type: ignore
+
+# seconds to wait before the first retry, doubled for each one after
+PANDOC_RETRY_DELAY : float = 0.5
+
+
+class PandocTransientError(RuntimeError):
+	"""a conversion failed for a reason which might not happen again, such as a timeout"""
+
+
+def find_pandoc() -> OptionalStr:
+	"""find the pandoc executable, preferring the one pypandoc uses"""
+	if PYPANDOC_AVAILABLE:
+		try:
+			return pypandoc.get_pandoc_path()
+		except (OSError, RuntimeError):
+			pass
+	return shutil.which('pandoc')
+
+
+class PandocPool:
+	"""runs pandoc conversions concurrently, with at most `max_procs` in flight"""
+
+	def __init__(
+			self,
+			max_procs : int = 4,
+			timeout : float = 30.0,
+			server_url : OptionalStr = None,
+			pandoc_path : OptionalStr = None,
+			retries : int = 2,
+		) -> None:
+		"""create a pool of pandoc conversions
+
+		### Parameters:
+		 - `max_procs : int`
+		   maximum number of conversions running at once
+		   (defaults to `4`)
+		 - `timeout : float`
+		   seconds before a single conversion is killed and treated as failed
+		   (defaults to `30.0`)
+		 - `server_url : OptionalStr`
+		   url of a running `pandoc server`, such as `http://localhost:3030`.
+		   if given, conversions are sent there instead of spawning subprocesses
+		   (defaults to `None`)
+		 - `pandoc_path : OptionalStr`
+		   path to the pandoc executable
+		   (defaults to `None`, meaning use `find_pandoc()`)
+		 - `retries : int`
+		   how many times to retry conversions which failed with a `PandocTransientError`
+		   (defaults to `2`)
+		"""
+		self.max_procs : int = max(1, max_procs)
+		self.timeout : float = timeout
+		self.server_url : OptionalStr = server_url
+		self.pandoc_path : OptionalStr = pandoc_path if pandoc_path is not None else find_pandoc()
+		self.retries : int = max(0, retries)
+
+	@property
+	def available(self) -> bool:
+		return (self.server_url is not None) or (self.pandoc_path is not None)
+
+	async def _convert_subprocess(self, text : str, fmt : str) -> str:
+		assert self.pandoc_path is not None
+		try:
+			proc : asyncio.subprocess.Process = await asyncio.create_subprocess_exec(
+				self.pandoc_path, f'--from={fmt}', '--to=markdown',
+				stdin = asyncio.subprocess.PIPE,
+				stdout = asyncio.subprocess.PIPE,
+				stderr = asyncio.subprocess.PIPE,
+			)
+		except OSError as err:
+			# such as running out of processes or file handles
+			raise PandocTransientError(f"couldn't start pandoc: {err}") from err
+		try:
+			stdout, stderr = await asyncio.wait_for(
+				proc.communicate(text.encode('utf-8')),
+				timeout = self.timeout,
+			)
+		except asyncio.TimeoutError as err:
+			proc.kill()
+			await proc.wait()
+			raise PandocTransientError(f'pandoc timed out after {self.timeout} seconds') from err
+
+		assert proc.returncode is not None
+		if proc.returncode < 0:
+			# killed by a signal, rather than rejecting the input
+			raise PandocTransientError(f'pandoc was killed by signal {-proc.returncode}')
+		if proc.returncode != 0:
+			raise RuntimeError(f'pandoc exited with code {proc.returncode}: {stderr.decode("utf-8", "replace").strip()}')
+
+		return stdout.decode('utf-8')
+
+	async def _convert_server(self, text : str, fmt : str) -> str:
+		assert self.server_url is not None
+		url = urlsplit(self.server_url)
+		body : bytes = json.dumps({'text' : text, 'from' : fmt, 'to' : 'markdown'}).encode('utf-8')
+		request : bytes = '\r\n'.join([
+			f'POST {url.path or "/"} HTTP/1.0',
+			f'Host: {url.netloc}',
+			'Content-Type: application/json',
+			'Accept: text/plain',
+			f'Content-Length: {len(body)}',
+			'', '',
+		]).encode('ascii') + body
+
+		async def _request() -> bytes:
+			reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+			try:
+				writer.write(request)
+				await writer.drain()
+				# HTTP/1.0, so the server closes the connection when done
+				return await reader.read()
+			finally:
+				writer.close()
+
+		try:
+			response : bytes = await asyncio.wait_for(_request(), timeout = self.timeout)
+		except asyncio.TimeoutError as err:
+			raise PandocTransientError(f'pandoc server timed out after {self.timeout} seconds') from err
+		except OSError as err:
+			raise PandocTransientError(f"couldn't reach pandoc server at {self.server_url}: {err}") from err
+
+		head, _, content = response.partition(b'\r\n\r\n')
+		status : str = head.split(b'\r\n', 1)[0].decode('ascii', 'replace')
+		if ' 200 ' not in f'{status} ':
+			if ' 5' in status:
+				raise PandocTransientError(f'pandoc server returned {status}: {content.decode("utf-8", "replace").strip()}')
+			raise RuntimeError(f'pandoc server returned {status}: {content.decode("utf-8", "replace").strip()}')
+
+		return content.decode('utf-8')
+
+	async def convert(self, text : str, fmt : str) -> str:
+		"""convert `text` from `fmt` to markdown"""
+		if self.server_url is not None:
+			return await self._convert_server(text, fmt)
+		return await self._convert_subprocess(text, fmt)
+
+	async def _convert_all(self, jobs : Sequence[Tuple[str,str]]) -> List[Union[str, BaseException]]:
+		# the semaphore has to be created inside the running event loop
+		sem : asyncio.Semaphore = asyncio.Semaphore(self.max_procs)
+
+		async def _bounded(text : str, fmt : str) -> str:
+			async with sem:
+				return await self.convert(text, fmt)
+
+		return await asyncio.gather(
+			*(_bounded(text, fmt) for text,fmt in jobs),
+			return_exceptions = True,
+		)
+
+	def convert_all(self, jobs : Sequence[Tuple[str,str]]) -> List[Union[str, BaseException]]:
+		"""run all `(text, fmt)` conversions concurrently
+
+		returns the converted text for each job, or the exception it raised
+		"""
+		if not jobs:
+			return list()
+		return asyncio.run(self._convert_all(jobs))
+
+	def convert_all_retrying(self, jobs : Sequence[Tuple[str,str]]) -> List[Union[str, BaseException]]:
+		"""like `convert_all`, but jobs which fail with a `PandocTransientError` are retried"""
+		results : List[Union[str, BaseException]] = self.convert_all(jobs)
+		for attempt in range(self.retries):
+			idxs_retry : List[int] = [
+				i
+				for i,result in enumerate(results)
+				if isinstance(result, PandocTransientError)
+			]
+			if not idxs_retry:
+				break
+			time.sleep(PANDOC_RETRY_DELAY * 2**attempt)
+			for i,result in zip(idxs_retry, self.convert_all([ jobs[i] for i in idxs_retry ])):
+				results[i] = result
+
+		return results
+
+	def process_notes(
+			self, 
+			notes : Sequence[OptionalStr],
+			on_error : Optional[Callable[[int, BaseException], None]] = None,
+		) -> List[OptionalStr]:
+		"""concurrent equivalent of calling `process_note_HACKY` on each note
+
+		notes which look like html or latex are converted with pandoc, all at once.
+		plaintext notes, and any whose conversion fails, get `process_note_plain`.
+		if given, `on_error(i, err)` is called for each note whose conversion failed
+		"""
+		if not self.available:
+			return [
+				None if note is None else process_note_plain(note)
+				for note in notes
+			]
+
+		# find which notes need pandoc, and process the rest right away
+		output : List[OptionalStr] = list()
+		idxs : List[int] = list()
+		jobs : List[Tuple[str,str]] = list()
+		for i,note in enumerate(notes):
+			fmt : OptionalStr = None if note is None else classify_note(note)
+			if (note is None) or (fmt is None):
+				output.append(None if note is None else process_note_plain(note))
+			else:
+				output.append(None)
+				idxs.append(i)
+				jobs.append((note, fmt))
+
+		# run them, and merge the results back in
+		for i,(text,fmt),result in zip(idxs, jobs, self.convert_all_retrying(jobs)):
+			if isinstance(result, BaseException):
+				if on_error is not None:
+					on_error(i, result)
+				else:
+					print(f"WARNING: couldn't convert note as {fmt}: {result}", file = sys.stderr)
+				output[i] = process_note_plain(text)
+			else:
+				output[i] = postprocess_pandoc_note(result)
+
+		return output
@@ -0,0 +1,161 @@
+"""streaming pipeline of generator stages, connected by bounded queues
+
+each stage is a function taking an iterable of items and returning an iterable
+of items, and each runs in its own thread. since pandoc subprocesses and disk
+writes release the GIL, I/O-bound stages overlap with CPU-bound ones. the
+queues between stages are bounded, so a slow stage applies backpressure
+rather than letting the whole library pile up in memory.
+"""
+
+# standard library imports
+from typing import (
+	Any, Optional,
+	List, Iterable, Iterator, Sequence,
+	Callable,
+)
+
+import queue
+import threading
+
+Stage = Callable[[Iterable[Any]], Iterable[Any]]
+Sink = Callable[[Iterable[Any]], None]
+
+# marks the end of a stage's output
+_DONE : object = object()
+
+# how often blocked stages check whether the pipeline was aborted, in seconds
+_POLL_INTERVAL : float = 0.1
+
+
+def _put(q : queue.Queue, item : Any, abort : threading.Event) -> bool:
+	"""put `item` in `q`, giving up if `abort` is set. returns whether the item was put"""
+	while not abort.is_set():
+		try:
+			q.put(item, timeout = _POLL_INTERVAL)
+			return True
+		except queue.Full:
+			pass
+	return False
+
+def _iter_queue(q : queue.Queue, abort : threading.Event) -> Iterator[Any]:
+	"""iterate over items in `q` until `_DONE` is found, or `abort` is set"""
+	while not abort.is_set():
+		try:
+			item : Any = q.get(timeout = _POLL_INTERVAL)
+		except queue.Empty:
+			continue
+		if item is _DONE:
+			return
+		yield item
+
+def _run_stage(
+		stage : Optional[Stage],
+		items : Iterable[Any],
+		q_out : queue.Queue,
+		abort : threading.Event,
+		errors : List[BaseException],
+	) -> None:
+	"""run a stage (or just pass through a source, if `stage is None`) into `q_out`"""
+	try:
+		for item in (items if stage is None else stage(items)):
+			if not _put(q_out, item, abort):
+				return
+		_put(q_out, _DONE, abort)
+	except BaseException as err: # pylint: disable=broad-except
+		errors.append(err)
+		abort.set()
+
+
+def _hold_back(
+		source : Iterable[Any],
+		before_item : Callable[[Callable[[], int]], None],
+		backlog : Callable[[], int],
+	) -> Iterator[Any]:
+	for item in source:
+		before_item(backlog)
+		yield item
+
+def run_pipeline(
+		source : Iterable[Any],
+		stages : Sequence[Stage],
+		sink : Sink,
+		queue_size : int = 16,
+		before_item : Optional[Callable[[Callable[[], int]], None]] = None,
+	) -> None:
+	"""run `source` through each of `stages` in order, and consume the output with `sink`
+
+	### Parameters:
+	 - `source : Iterable[Any]`
+	   items to process. iterated in its own thread
+	 - `stages : Sequence[Stage]`
+	   generator functions, each run in its own thread
+	 - `sink : Sink`
+	   consumes the output of the last stage, run in the calling thread
+	 - `queue_size : int`
+	   maximum number of items waiting between two stages.
+	   if 0 or negative, everything runs serially in the calling thread
+	   (defaults to `16`)
+	 - `before_item : Optional[Callable[[Callable[[], int]], None]]`
+	   if given, called in the source thread before each item is passed on, with
+	   a function giving the number of items waiting in the queues. it can block
+	   to hold back the source, see `dendron_citations.limits.ResourceLimits`
+	   (defaults to `None`)
+
+	### Raises:
+	 - the first exception raised by any stage or the sink.
+	   the remaining stages are stopped
+	"""
+
+	if queue_size <= 0:
+		items : Iterable[Any] = (
+			_hold_back(source, before_item, lambda : 0)
+			if before_item is not None
+			else source
+		)
+		for stage in stages:
+			items = stage(items)
+		sink(items)
+		return
+
+	abort : threading.Event = threading.Event()
+	errors : List[BaseException] = list()
+	queues : List[queue.Queue] = [
+		queue.Queue(maxsize = queue_size)
+		for _ in range(len(stages) + 1)
+	]
+	if before_item is not None:
+		source = _hold_back(source, before_item, lambda : sum(q.qsize() for q in queues))
+
+	# the source, and then every stage, gets a thread
+	threads : List[threading.Thread] = [
+		threading.Thread(
+			target = _run_stage,
+			args = (None, source, queues[0], abort, errors),
+			daemon = True,
+		),
+		*(
+			threading.Thread(
+				target = _run_stage,
+				args = (stage, _iter_queue(queues[i], abort), queues[i + 1], abort, errors),
+				daemon = True,
+			)
+			for i,stage in enumerate(stages)
+		),
+	]
+
+	for thread in threads:
+		thread.start()
+
+	try:
+		sink(_iter_queue(queues[-1], abort))
+	except BaseException:
+		abort.set()
+		raise
+	finally:
+		if errors:
+			abort.set()
+		for thread in threads:
+			thread.join()
+
+	if errors:
+		raise errors[0]
@@ -0,0 +1,249 @@
+"""dry run: what a regeneration would change in the vault, without rendering anything
+
+before a large regeneration, it helps to know how many notes will be written.
+`plan_changes` works this out cheaply: the vault is listed once, and the
+version of each entry in the source (the hash of its bibtex text, or its zotero
+`dateModified`) is compared with the version its note was written from (see
+`dendron_citations.run_state.load_source_versions`, and the zotero state). only
+new and changed entries are parsed, to find their note names and tags. notes
+are never converted, rendered, or written, and neither is anything else:
+
+```bash
+dendron_gen_refs.py [cfg_path] --plan [--fmt=json]
+```
+
+reference notes are counted as
+ - `created` : the entry has no note yet
+ - `changed` : the entry, or the config, changed since its note was written.
+   the note will be rendered again, and rewritten if it comes out different.
+   listed under its new name if its shard changed, since it will be moved
+ - `unchanged` : the note is up to date
+ - `orphaned` : a note with `note_prefix` which no entry maps to. these are
+   left alone by a run
+
+and `tag_notes` are the tag notes which would be created. for bibtex files,
+versions are recorded by full runs, so entries regenerated by selective runs
+or the daemon since then count as changed.
+"""
+
+# standard library imports
+from typing import (
+	Optional, Any,
+	Dict, List, Tuple,
+)
+
+import os
+import time
+from dataclasses import dataclass,field,asdict
+from functools import partial
+
+# local imports
+from dendron_citations.config import Config
+from dendron_citations.citationentry import CitationEntry
+from dendron_citations.lookup_index import LookupIndex
+from dendron_citations.selection import EntrySelection
+from dendron_citations.sharding import note_fname,check_shard_scheme
+from dendron_citations.run_state import FailureLog,load_source_versions
+from dendron_citations.zotero_util import (
+	ZoteroDB,ZoteroState,ZOTERO_STATE_FILENAME,load_zotero_state,
+)
+from dendron_citations.stages import (
+	iter_bib_raw,build_entries,cluster_authors,shard_entries,
+	bib_versions,find_reference_notes,zotero_changed_keys,zotero_note_fname,
+)
+
+
+PLAN_CATEGORIES : Tuple[str, ...] = (
+	'created', 'changed', 'unchanged', 'orphaned', 'tag_notes', 'failed',
+)
+
+
+@dataclass
+class VaultPlan:
+	"""the notes a run would touch, as filenames relative to the vault"""
+	created : List[str] = field(default_factory = list)
+	changed : List[str] = field(default_factory = list)
+	unchanged : List[str] = field(default_factory = list)
+	orphaned : List[str] = field(default_factory = list)
+	tag_notes : List[str] = field(default_factory = list)
+	# keys of new or changed entries which couldn't be loaded
+	failed : List[str] = field(default_factory = list)
+	# seconds spent scanning the vault and source, loading entries, and in total
+	timing : Dict[str, float] = field(default_factory = dict)
+
+	def counts(self) -> Dict[str, int]:
+		return { name : len(getattr(self, name)) for name in PLAN_CATEGORIES }
+
+	def as_dict(self) -> Dict[str, Any]:
+		return {
+			'counts' : self.counts(),
+			**asdict(self),
+		}
+
+	def format_text(self, list_notes : bool = False) -> str:
+		"""a summary, with the count in each category, and every note if `list_notes`"""
+		timing : Dict[str, float] = self.timing
+		lines : List[str] = [
+			f'plan computed in {timing["total"]:.3f}s '
+			f'(scan {timing["scan"]:.3f}s, load {timing["load"]:.3f}s):',
+		]
+		for name,count in self.counts().items():
+			lines.append(f'  {name:<12}{count}')
+			if list_notes:
+				lines.extend( f'    {x}' for x in getattr(self, name) )
+		return '\n'.join(lines)
+
+
+def _lookup_tags(lookup : LookupIndex, key : str) -> List[str]:
+	"""tags of an entry as recorded in the lookup index, the same as `CitationEntry.get_all_tags`"""
+	rec : Dict[str, Any] = lookup.entries.get(key, dict())
+	return [
+		*( tag_name for tag_name,_ in rec.get('authors', list()) ),
+		*rec.get('keywords', list()),
+		*rec.get('collections', list()),
+	]
+
+def _load_changed_zotero(
+		cfg : Config,
+		zotero_db : str,
+		failures : FailureLog,
+		timing : Dict[str, float],
+	) -> Tuple[Dict[str, str], List[CitationEntry]]:
+	"""notes of zotero items which are up to date by key, and the other items, loaded
+	
+	compares `dateModified` of each item with the zotero state in the vault
+	"""
+	start : float = time.perf_counter()
+	state : ZoteroState = load_zotero_state(cfg.vault_loc + ZOTERO_STATE_FILENAME)
+	with ZoteroDB(zotero_db) as zdb:
+		versions : Dict[str, str] = zdb.item_versions()
+		to_load : List[str] = zotero_changed_keys(cfg, versions, state)
+		to_load_set : set = set(to_load)
+		unchanged : Dict[str, str] = {
+			state[key]['bib_key'] : zotero_note_fname(cfg, state[key])
+			for key in versions
+			if key not in to_load_set
+		}
+		# the vault was listed before this
+		timing['scan'] = time.perf_counter() - start
+
+		entries : List[CitationEntry] = list(zdb.load_entries(
+			cfg,
+			keys = to_load,
+			process_note = False,
+			on_error = partial(failures.record, stage = 'load'),
+		).values())
+
+	return unchanged, entries
+
+def _load_changed_bib(
+		cfg : Config,
+		failures : FailureLog,
+		timing : Dict[str, float],
+		exact : Dict[str, str],
+		sharded : Dict[str, str],
+	) -> Tuple[Dict[str, str], List[CitationEntry]]:
+	"""notes of bibtex entries which are up to date by key, and the other entries, loaded
+	
+	compares the hash of each entry with the version its note was written from
+	"""
+	start : float = time.perf_counter()
+	old_versions : Dict[str, str] = load_source_versions(cfg)
+	unchanged : Dict[str, str] = dict()
+	to_load : List[str] = list()
+	for key,version in bib_versions(cfg).items():
+		fname : Optional[str] = exact.get(key) if cfg.note_shards is None else sharded.get(key)
+		if (fname is not None) and (old_versions.get(key) == version):
+			unchanged[key] = fname
+		else:
+			to_load.append(key)
+	timing['scan'] = time.perf_counter() - start
+
+	entries : List[CitationEntry] = list(build_entries(
+		iter_bib_raw(cfg, selection = EntrySelection(keys = tuple(to_load)), failures = failures),
+		cfg,
+		failures,
+	))
+	return unchanged, entries
+
+def _add_loaded(
+		plan : VaultPlan,
+		entry : CitationEntry,
+		cfg : Config,
+		vault_notes : set,
+		sharded : Dict[str, str],
+	) -> Tuple[str, str]:
+	"""count the note of a new or changed entry as created or changed. returns
+	its filename, and the filename of its existing note, which are the same unless
+	the note is under another shard and will be moved, see `move_old_note`
+	"""
+	fname : str = note_fname(entry, cfg)
+	old_fname : str = sharded.get(str(entry.bib_key), fname) if cfg.note_shards is not None else fname
+	if (fname in vault_notes) or (old_fname in vault_notes):
+		plan.changed.append(fname)
+	else:
+		plan.created.append(fname)
+	return fname, old_fname
+
+def plan_changes(cfg : Config) -> VaultPlan:
+	"""work out what `full_process(cfg)` would do to the vault, without writing anything"""
+	check_shard_scheme(cfg.note_shards)
+	plan : VaultPlan = VaultPlan()
+	start : float = time.perf_counter()
+
+	vault_notes : set = set()
+	exact : Dict[str, str] = dict()
+	sharded : Dict[str, str] = dict()
+	if os.path.isdir(cfg.vault_loc):
+		vault_notes = set( x for x in os.listdir(cfg.vault_loc) if x.endswith('.md') )
+		exact, sharded = find_reference_notes(cfg.vault_loc, cfg.note_prefix)
+
+	lookup : Optional[LookupIndex] = LookupIndex(cfg.vault_loc) if cfg.lookup_index else None
+	failures : FailureLog = FailureLog()
+	listed : float = time.perf_counter() - start
+	# notes which are up to date, by key
+	unchanged : Dict[str, str]
+	entries : List[CitationEntry]
+	if cfg.zotero_db is not None:
+		unchanged, entries = _load_changed_zotero(cfg, cfg.zotero_db, failures, plan.timing)
+	else:
+		unchanged, entries = _load_changed_bib(cfg, failures, plan.timing, exact, sharded)
+	plan.timing['scan'] += listed
+
+	# note names and tags depend on these
+	if cfg.cluster_authors or (cfg.author_aliases_path is not None):
+		entries = list(cluster_authors(entries, cfg, dict(), lookup))
+	if cfg.note_shards is not None:
+		entries = list(shard_entries(entries, cfg))
+	plan.timing['load'] = time.perf_counter() - start - plan.timing['scan']
+
+	expected : set = set(unchanged.values())
+	tags : set = set()
+	for entry in entries:
+		expected.update(_add_loaded(plan, entry, cfg, vault_notes, sharded))
+		tags.update(entry.get_all_tags())
+
+	# bibtex runs make tag notes for every entry, zotero runs only for the ones loaded
+	if (cfg.zotero_db is None) and (lookup is not None):
+		for key in unchanged:
+			tags.update(_lookup_tags(lookup, key))
+
+	plan.created.sort()
+	plan.changed.sort()
+	plan.unchanged = sorted(unchanged.values())
+	plan.orphaned = sorted(
+		fname
+		for stem,fname in exact.items()
+		# skip the note at the root of the hierarchy
+		if stem and (fname not in expected)
+	)
+	if cfg.make_tag_notes:
+		plan.tag_notes = sorted(
+			f'tags.{tag}.md'
+			for tag in tags
+			if f'tags.{tag}.md' not in vault_notes
+		)
+	plan.failed = sorted(failures.failures)
+	plan.timing['total'] = time.perf_counter() - start
+
+	return plan
@@ -5,10 +5,13 @@
 from dataclasses import dataclass
 from typing import (
 	Dict, List,
-	Callable,
+	Callable, Pattern,
 )
 
+import re
+import sys
 from collections import defaultdict
+from itertools import islice
 import unicodedata
 
 # package imports
@@ -22,11 +25,11 @@ try:
 		PYPANDOC_AVAILABLE = True
 	except RuntimeError as e:
 		PYPANDOC_AVAILABLE = False
-		print(f"WARNING: pypandoc couldn't find pandoc: {e}")
+		print(f"WARNING: pypandoc couldn't find pandoc: {e}", file = sys.stderr)
 
 except ImportError:
 	PYPANDOC_AVAILABLE = False
-	print('WARNING: pypandoc not available. converting notes from bibtex might not work')
+	print('WARNING: pypandoc not available. converting notes from bibtex might not work', file = sys.stderr)
 
 
 # local imports
@@ -40,10 +43,24 @@ from dendron_citations.config import Config
 GLOBAL_AUTHORS_DICT : Dict[str,List[str]] = defaultdict(list)
 
 
+def to_ascii(s : str) -> str:
+	"""decompose unicode characters and drop anything non-ascii
+	
+	pure-ascii strings, which is most bibtex fields, are returned as-is
+	since they are unchanged by NFKD normalization
+	"""
+	if s.isascii():
+		return s
+	return unicodedata.normalize('NFKD', s).encode('ascii', 'ignore').decode('ascii')
+
+# NOTE: the `str.replace` chains below are faster than a single `str.translate`
+# on typical short fields, since `replace` returns the same string without
+# copying when the character is absent, and `translate` with deletions or
+# multi-character replacements takes CPython's slow path
+
 def strip_bibtex_fmt(s : str) -> str:
 	return (
-		unicodedata.normalize('NFKD', s)
-		.encode('ascii', 'ignore').decode('ascii')
+		to_ascii(s)
 		.replace('{', '')
 		.replace('}', '')
 		.replace('\n', '  ')
@@ -56,8 +73,7 @@ def strip_bibtex_fmt(s : str) -> str:
 
 def process_tag_name(s : str, nodot : bool = True, kebab_case_tag_names : bool = False) -> str:
 	s_new : str = (
-		unicodedata.normalize('NFKD', s)
-		.encode('ascii', 'ignore').decode('ascii')
+		to_ascii(s)
 		.replace(' - ', '-')
 		.replace(' ', '_')
 		.replace('\t', '__')
@@ -151,40 +167,51 @@ def _handle_whitespace(s : str) -> str:
 	return '\n'.join(output)
 
 
-def process_note_HACKY(s : OptionalStr) -> OptionalStr:
-	"""a very very fragile attempt at making the bibtex notes look nice
+# only this many characters at the start of a note are looked at when classifying it
+NOTE_CLASSIFY_SAMPLE : int = 4096
 
-	try to detect whether the note is html, latex, or plain markdown, and then use pandoc to convert it
-	
-	TODO: eventually this should just get the notes directly from zotero
-	"""
+# how many markup tokens must be found in the sample to call a note html or latex
+NOTE_MIN_MARKUP_TOKENS : int = 2
 
-	if s is None:
-		return None
+_HTML_TOKEN : Pattern = re.compile(
+	r'</?(?:p|div|span|br|hr|b|i|u|s|em|strong|a|img|ul|ol|li|h[1-6]|blockquote|pre|code|sup|sub|table|thead|tbody|tr|th|td)'
+	r'(?:\s+[a-zA-Z_:][-a-zA-Z0-9_:.]*(?:\s*=\s*(?:"[^"]*"|\'[^\']*\'|[^\s"\'<>=]+))?)*\s*/?>',
+	re.IGNORECASE,
+)
 
-	# if we have pypandoc, try to process the notes as html or latex
-	if PYPANDOC_AVAILABLE:
-		if (s.count('<') / len(s) > 0.05) and (s.count('>') / len(s) > 0.05):
-			# probably html
-			try:
-				return _handle_whitespace(
-					pypandoc.convert_text(s, 'markdown', format = 'html')
-					.replace('# ', '## ')
-				)
-			except RuntimeError as err:
-				print(f"WARNING: couldn't convert note as HTML: {err}")
+_LATEX_TOKEN : Pattern = re.compile(
+	r'\\(?:begin|end)\{[a-zA-Z*]+\}'
+	r'|\\(?:(?:sub)*section|paragraph|chapter|textbf|textit|texttt|textsc|emph|underline'
+	r'|textsuperscript|textsubscript|footnote|cite[tp]?|ref|label|href|url)\*?\{'
+	r'|\\(?:item|par)\b'
+)
 
-		elif s.count('\\') / len(s) > 0.01:
-			# probably latex
-			try:
-				return _handle_whitespace(
-					pypandoc.convert_text(s, 'markdown', format = 'latex')
-					.replace('# ', '## ')
-				)
-			except RuntimeError as err:
-				print(f"WARNING: couldn't convert note as LaTeX: {err}")
+def _has_tokens(pattern : Pattern, s : str) -> bool:
+	"""whether `pattern` matches at least `NOTE_MIN_MARKUP_TOKENS` times in `s`"""
+	return sum(1 for _ in islice(pattern.finditer(s), NOTE_MIN_MARKUP_TOKENS)) >= NOTE_MIN_MARKUP_TOKENS
 
-	# otherwise, assume plaintext/markdown and do some very fragile processing
+def classify_note(s : str) -> OptionalStr:
+	"""guess the format of a note for pandoc: `'html'`, `'latex'`, or `None` for plaintext/markdown
+	
+	only the first `NOTE_CLASSIFY_SAMPLE` characters are checked, looking for actual
+	html tags or latex commands, rather than just counting `<` or `\\` characters.
+	this way, plaintext with the odd `<` or windows path in it doesn't get sent to pandoc
+	"""
+	sample : str = s[:NOTE_CLASSIFY_SAMPLE]
+	# a note starting with a tag is html, even if its first element is very long
+	if _HTML_TOKEN.match(sample.lstrip()) or _has_tokens(_HTML_TOKEN, sample):
+		return 'html'
+	elif _has_tokens(_LATEX_TOKEN, sample):
+		return 'latex'
+	
+	return None
+
+def postprocess_pandoc_note(s : str) -> str:
+	"""clean up markdown output by pandoc"""
+	return _handle_whitespace(s.replace('# ', '## '))
+
+def process_note_plain(s : str) -> str:
+	"""very fragile processing of a note assumed to be plaintext/markdown"""
 	s = (
 		s
 		.replace('\\par', '\n\n') # replace \par with newlines
@@ -199,11 +226,38 @@ def process_note_HACKY(s : OptionalStr) -> OptionalStr:
 	)
 
 	# sometimes, not exports replace " " with "~". not a clue why.
-	if s.count('~') / len(s) > 0.1:
+	if s and (s.count('~') / len(s) > 0.1):
 		s = s.replace('~', ' ')
 
 	return s
 
+def process_note_HACKY(s : OptionalStr) -> OptionalStr:
+	"""a very very fragile attempt at making the bibtex notes look nice
+
+	try to detect whether the note is html, latex, or plain markdown, and then use pandoc to convert it
+	
+	see `dendron_citations.pandoc_pool` for converting many notes concurrently
+
+	TODO: eventually this should just get the notes directly from zotero
+	"""
+
+	if s is None:
+		return None
+
+	# if we have pypandoc, try to process the notes as html or latex
+	if PYPANDOC_AVAILABLE:
+		fmt : OptionalStr = classify_note(s)
+		if fmt is not None:
+			try:
+				return postprocess_pandoc_note(
+					pypandoc.convert_text(s, 'markdown', format = fmt)
+				)
+			except RuntimeError as err:
+				print(f"WARNING: couldn't convert note as {fmt}: {err}")
+
+	# otherwise, assume plaintext/markdown and do some very fragile processing
+	return process_note_plain(s)
+
 
 def safe_get(
 		d : Dict, 
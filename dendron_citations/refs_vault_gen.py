@@ -1,63 +1,31 @@
 """generate a vault of dendron notes from entries in a bibtex file
-# Usage: 
-
-to generate reference notes, run from anywhere:
-
-```bash
-dendron_gen_refs.py [cfg_path] [--<kwarg>=<val>]
-```
-
-## Help and configuration
-
-- `--help` : print help message and exit:
-```bash
-dendron_gen_refs.py --help
-```
-
-- `--print_cfg` : print to console an example config in either json or yaml (json by default):
+# Usage:
 
 ```bash
-dendron_gen_refs.py --print_cfg [--fmt=<format>]
+dendron_gen_refs.py [cfg_path] [--<keyword>=<value>]
 ```
 
-## Generation:
-
-when running
-```bash
-dendron_gen_refs.py [cfg_path] [**kwargs]
-```
-
-`cfg_path` should be the location of a yaml or json config file
-any of those items can be overwritten as keyword arguments using 
-`--<keyword>=<value>`
-
-the expected config elements, types, and default values are:
-```python
-	bib_filename : str = 'refs.bib'
-	vault_loc : str = 'vault/'
-	note_prefix : str = 'refs.'
-	make_tag_notes : bool = True
-	verbose : bool = False
-	kebab_case_tag_names : bool = False
-	template_path : Optional[str] = None
-```
-
-## Examples:
-
-```bash
-dendron_gen_refs.py gen --bib_filename=<bibtex_file> --vault_loc=<output_dir>
-```
-
-Or, we could create a config file such as 
-[`examples/custom_cfg.json`](examples/custom_cfg.json)
-and pass it in as
-```bash
-dendron_gen_refs.py gen <path_to_config_file>
-```
-
-> **Note:** if you pass a config file, the script will change its directory 
-to that of the config file, to allow paths to be specified relative to that file.
-
+`cfg_path` is a yaml or json config file. any config field can be
+overridden with `--<keyword>=<value>`, see `--print_cfg` for the fields
+and their defaults.
+
+ - `--help` : print this message and exit
+ - `--print_cfg [--fmt=<json|yaml>]` : print an example config and exit
+ - `--keys=<k1>,<k2>`, `--collection=<key>`, `--modified-since=<date>` :
+   regenerate only the selected entries
+ - `--plan [--fmt=json]` : print what a run would change, without writing
+ - `--lookup --author=<tag or name>` (or `--keyword`, `--collection`) :
+   query the lookup index without parsing the bibtex file
+ - `--migrate_shards --note_shards=<year|letter>` : move notes to a new
+   sharding scheme, keeping their IDs, and regenerate the vault
+ - `--daemon [--socket=<path>]` : serve JSON-RPC requests from stdin or a
+   unix socket, keeping everything in memory between them
+
+relative paths in a config file are relative to that file, and those
+passed as arguments to the working directory.
+
+see README.md for the config fields, template, sharding, export, and
+daemon protocol in detail.
 """
 
 # pylint: disable=invalid-name, bad-indentation
@@ -65,152 +33,345 @@ to that of the config file, to allow paths to be specified relative to that file
 # standard library imports
 from typing import (
 	Optional, Any,
-	Dict, List,
+	Dict, List, Iterable,
 )
 
 import os
 import sys
 import json
+from functools import partial
+from contextlib import redirect_stdout
+from dataclasses import fields
 
 # package imports
 import yaml # type: ignore
-import biblib.bib # type: ignore
 
 # local imports
-from dendron_citations.dc_util import (
-	OrderedDictType,
-)
-from dendron_citations.md_util import PandocMarkdown,gen_dendron_ID
-from dendron_citations.bibtex_util import load_bibtex_raw
-from dendron_citations.process_meta import Config,GLOBAL_AUTHORS_DICT
+from dendron_citations.md_util import PandocMarkdown
+from dendron_citations.process_meta import Config
+from dendron_citations.config import load_config_file
 from dendron_citations.citationentry import CitationEntry
+from dendron_citations.pipeline import Stage
+from dendron_citations.vault_index import VaultIndex
+from dendron_citations.lookup_index import LookupIndex
+from dendron_citations.export import CitationExporter,open_exporter
+from dendron_citations.limits import ResourceLimits
+from dendron_citations.sharding import (
+	note_fname,shard_author_tag,check_shard_scheme,
+)
+from dendron_citations.selection import EntrySelection
+from dendron_citations.run_state import (
+	FailureLog,RunCheckpoint,FAILURE_REPORT_FILENAME,
+	save_source_versions,
+)
+from dendron_citations.zotero_util import (
+	ZoteroDB,ZOTERO_STATE_FILENAME,
+	load_zotero_state,save_zotero_state,
+)
+from dendron_citations.stages import (
+	RunContext,iter_bib_raw,iter_entries_zotero,build_entries,generate_notes,
+	update_tag_members,source_keys,bib_versions,find_reference_notes,
+)
+from dendron_citations.plan import VaultPlan,plan_changes
+from dendron_citations.daemon import run_daemon
 
 
+def full_process(cfg : Config, selection : Optional[EntrySelection] = None):
+	"""given a bibtex file or zotero database, output a vault of dendron notes
+	
+	runs as a pipeline of stages (see `dendron_citations.pipeline`):
+	source -> entry builder -> note enricher -> renderer -> writer
 
+	if `cfg.export_path` is set, entries are also exported there (see `dendron_citations.export`).
+	writes and memory use are throttled by `cfg.max_writes_per_sec` and
+	`cfg.max_memory_mb` (see `dendron_citations.limits`).
+	if `selection` is given, only the selected entries are regenerated.
 
+	an entry which fails is skipped, and listed in `FAILURE_REPORT_FILENAME` 
+	in the vault. full runs keep a checkpoint (see `dendron_citations.run_state`),
+	so rerunning after an interruption or failures only processes the failed,
+	changed, and unprocessed entries
+	"""
 
+	if cfg.verbose:
+		print(cfg.as_dict())
 
-def make_tag_note(tag : str, vault_loc : str) -> None:
-	"""check for the existance of a tag note in the vault, and make it if it doesnt exist"""
-	
-	tag_path : str = f'{vault_loc}tags.{tag}.md'
-	
-	if os.path.exists(tag_path):
-		return
-
-	note : PandocMarkdown = PandocMarkdown.get_dendron_template(
-		fm = dict(),
-		do_id = True,
+	check_shard_scheme(cfg.note_shards)
+	if cfg.tag_note_members and not cfg.lookup_index:
+		raise ValueError('`tag_note_members` needs `lookup_index`, which records the members of each tag')
+
+	index : Optional[VaultIndex] = VaultIndex(cfg.vault_loc) if cfg.vault_index else None
+	lookup_idx : Optional[LookupIndex] = LookupIndex(cfg.vault_loc) if cfg.lookup_index else None
+	failures : FailureLog = FailureLog()
+	checkpoint : Optional[RunCheckpoint] = (
+		RunCheckpoint(cfg)
+		if (selection is None) or selection.is_all
+		else None
 	)
-	note.yaml_data['title'] = tag
 
-	note.content = f'# {tag}\n\n'
+	source : Iterable[Any]
+	pre_stages : List[Stage] = list()
+	if cfg.zotero_db is not None:
+		# zotero entries come out already built
+		source = iter_entries_zotero(
+			cfg, 
+			process_note = False, 
+			selection = selection, 
+			failures = failures, 
+			checkpoint = checkpoint,
+		)
+	else:
+		source = iter_bib_raw(cfg, selection = selection, failures = failures, checkpoint = checkpoint)
+		pre_stages.append(partial(build_entries, cfg = cfg, failures = failures))
 
-	# global GLOBAL_AUTHORS_DICT
-	# if its an author tag, figure out all the names for the author:
-	if tag.startswith('author.'):
-		# removeprefix only works in python 3.9+
-		# authortag : str = tag.removeprefix('author.')
-		authortag : str = tag[len('author.'):]
+	exporter : Optional[CitationExporter] = (
+		open_exporter(cfg.export_path)
+		if cfg.export_path is not None
+		else None
+	)
+	limits : ResourceLimits = ResourceLimits(
+		max_writes_per_sec = cfg.max_writes_per_sec,
+		max_memory_mb = cfg.max_memory_mb,
+	)
 
-		note.content += '\n'.join([
-			'## Author names:',
-			'',
-			'\n'.join([
-				f'- {x}'
-				for x in GLOBAL_AUTHORS_DICT[authortag]
-			]),
-		])
+	try:
+		generate_notes(
+			cfg, source,
+			pre_stages = pre_stages,
+			run = RunContext(
+				index = index,
+				lookup = lookup_idx,
+				failures = failures,
+				checkpoint = checkpoint,
+				exporter = exporter,
+				limits = limits,
+			),
+		)
+	except BaseException:
+		# keep what was done, so the next run can resume
+		if checkpoint is not None:
+			checkpoint.save()
+		if exporter is not None:
+			exporter.abort()
+		raise
+	finally:
+		if index is not None:
+			index.save()
+
+	if checkpoint is not None:
+		checkpoint.finish(failures)
+	failures.save(cfg.vault_loc + FAILURE_REPORT_FILENAME)
+
+	if len(failures) > 0:
+		print(
+			f'WARNING: {len(failures)} entries failed, see {cfg.vault_loc + FAILURE_REPORT_FILENAME}. '
+			+ 'rerun to retry them',
+			file = sys.stderr,
+		)
+		if cfg.zotero_db is not None:
+			# make sure failed items are retried, even if they don't change
+			state_path : str = cfg.vault_loc + ZOTERO_STATE_FILENAME
+			save_zotero_state(state_path, {
+				key : val
+				for key,val in load_zotero_state(state_path).items()
+				if (key not in failures) and (val['bib_key'] not in failures)
+			})
+
+	# record what full runs from a bibtex file wrote, for `--plan`
+	versions : Optional[Dict[str, str]] = (
+		bib_versions(cfg)
+		if (cfg.zotero_db is None) and (checkpoint is not None)
+		else None
+	)
+	if versions is not None:
+		save_source_versions(cfg, {
+			key : version
+			for key,version in versions.items()
+			if key not in failures
+		})
+
+	# drop entries which no longer exist in the source
+	keys : Optional[List[str]] = (
+		(list(versions) if versions is not None else source_keys(cfg, selection))
+		if (lookup_idx is not None) or (exporter is not None)
+		else None
+	)
+	if lookup_idx is not None:
+		if keys is not None:
+			lookup_idx.retain(keys)
+		if cfg.tag_note_members:
+			n_tags : int = update_tag_members(cfg, lookup_idx, index, limits)
+			if cfg.verbose:
+				print(f'  updated members of {n_tags} tag notes')
+			if index is not None:
+				index.save()
+		lookup_idx.save()
+	if exporter is not None:
+		exporter.finish(keys)
 
-	with open(tag_path, 'w', encoding = 'utf-8') as f:
-		f.write(note.dumps())
+	if limits.is_limited or cfg.verbose:
+		print(limits.format_report())
 
-def full_process(cfg : Config):
-	"""given a bibtex file, output a vault of dendron notes"""
 
-	if cfg.verbose:
-		print(cfg.as_dict())
-	# load the bibtext as a bunch of biblib entries
-	db : OrderedDictType[str, biblib.bib.Entry] = load_bibtex_raw(cfg.bib_filename)
-
-	all_tags : List[str] = list()
-	vault_prefix : str = cfg.vault_loc + cfg.note_prefix
-
-	for key,val in db.items():
-		if cfg.verbose:
-			print(f'  processing key:\t{key}')
-
-		# convert biblib entries to our format
-		entry : CitationEntry = CitationEntry.from_bib(key, val, cfg = cfg)
-		# save the tags for later
-		all_tags.extend(entry.get_all_tags())
-
-		# make the note
-		note : PandocMarkdown = entry.to_md(cfg.template)
-		fname : str = f'{vault_prefix}{key}.md'
-
-		# handle note metadata
-		if os.path.exists(fname):
-			# if the filename exists, get the created time and id from the old note
-			old_note : PandocMarkdown = PandocMarkdown()
-			old_note.load(fname)
-
-			if 'created' in old_note.yaml_data:
-				note.yaml_data['created'] = old_note.yaml_data['created']
-
-			if 'updated' in old_note.yaml_data:
-				note.yaml_data['updated'] = old_note.yaml_data['updated']
-			
-			if 'id' in old_note.yaml_data:
-				note.yaml_data['id'] = old_note.yaml_data['id']
-			else:
-				note.yaml_data['id'] = gen_dendron_ID()
-		else:
-			# we don't update the time unless the note is new
-			note.update_time()
-			note.yaml_data['id'] = gen_dendron_ID()
-
-		# save the note
-		with open(fname, 'w', encoding = 'utf-8') as f:
-			f.write(note.dumps())
-	
-	# make notes for any given tag
-	# dendron backlinks can be used to see which notes are linked to a tag
-	# NOTE: existing notes will not be overwritten. 
-	if cfg.make_tag_notes:
-		for tag in set(all_tags):
-			if cfg.verbose:
-				print(f'  processing tag:\t{tag}')
-			make_tag_note(tag, cfg.vault_loc)
-
-
-def gen(cfg_path : Optional[str], **kwargs):
-	"""read config from both file and kwargs, merge (kwargs overwrite), run `full_process`"""
-
-	# change the working directory to the config file's directory
-	# this is so that relative paths work
-	file_data : Dict[str, Any] = dict()
-	if cfg_path is not None:
-		cfg_dir : str = os.path.dirname(cfg_path)
-		if cfg_dir != '':
-			os.chdir(cfg_dir)
-		cfg_path_rel : str = os.path.relpath(cfg_path, cfg_dir)
-
-		# load config from file
-		if cfg_path is not None:
-			with open(cfg_path_rel, 'r', encoding = 'utf-8') as f:
-				if any(cfg_path_rel.endswith(x) for x in ['.yaml', '.yml']):
-					file_data = yaml.load(f, Loader = yaml.FullLoader)
-				elif cfg_path_rel.endswith('.json'):
-					file_data = json.load(f)
-				else:
-					raise ValueError(f'unknown config file type: {cfg_path}')
+def migrate_shards(cfg : Config) -> None:
+	"""move existing notes to match `cfg.note_shards`, keeping their IDs, then regenerate the vault
 	
-	# merge configs and run
-	cfg : Config = Config(**{**file_data, **kwargs})
+	reference notes are found by key, whether they were sharded or not, and
+	author tag notes are renamed. everything is then regenerated, which updates
+	the links to tags, and keeps IDs since they are read from the moved notes
+	"""
+	check_shard_scheme(cfg.note_shards)
+
+	exact : Dict[str, str]
+	sharded : Dict[str, str]
+	exact, sharded = find_reference_notes(cfg.vault_loc, cfg.note_prefix)
+
+	# get keys and dates without converting notes
+	entries : Iterable[CitationEntry]
+	if cfg.zotero_db is not None:
+		with ZoteroDB(cfg.zotero_db) as zdb:
+			entries = list(zdb.load_entries(cfg, process_note = False).values())
+	else:
+		entries = build_entries(iter_bib_raw(cfg), cfg)
+
+	n_moved : int = 0
+	for entry in entries:
+		key : str = str(entry.bib_key)
+		old : Optional[str] = exact.get(key, sharded.get(key))
+		new : str = note_fname(entry, cfg)
+		if (old is None) or (old == new):
+			continue
+		if os.path.exists(cfg.vault_loc + new):
+			print(f'WARNING: not moving {old} to {new}, which already exists', file = sys.stderr)
+			continue
+		os.replace(cfg.vault_loc + old, cfg.vault_loc + new)
+		n_moved += 1
+
+	n_tags : int = 0
+	for fname in sorted(os.listdir(cfg.vault_loc)):
+		if not (fname.startswith('tags.author.') and fname.endswith('.md')):
+			continue
+		tag : str = fname[len('tags.'):-len('.md')]
+		new_tag : str = shard_author_tag(tag, cfg.note_shards)
+		if new_tag == tag:
+			continue
+		if os.path.exists(f'{cfg.vault_loc}tags.{new_tag}.md'):
+			print(
+				f'WARNING: not moving {fname} to tags.{new_tag}.md, which already exists',
+				file = sys.stderr,
+			)
+			continue
+
+		note : PandocMarkdown = PandocMarkdown()
+		note.load(cfg.vault_loc + fname)
+		note.yaml_data['title'] = new_tag
+		note.content = note.content.replace(f'# {tag}\n', f'# {new_tag}\n', 1)
+		with open(f'{cfg.vault_loc}tags.{new_tag}.md', 'w', encoding = 'utf-8') as f:
+			f.write(note.dumps())
+		os.remove(cfg.vault_loc + fname)
+		n_tags += 1
+
+	print(f'moved {n_moved} reference notes and {n_tags} tag notes, regenerating')
+
+	# zotero only regenerates changed items, so forget what was seen
+	if os.path.exists(cfg.vault_loc + ZOTERO_STATE_FILENAME):
+		os.remove(cfg.vault_loc + ZOTERO_STATE_FILENAME)
 
 	full_process(cfg)
 
+def load_cfg(cfg_path : Optional[str], **kwargs) -> Config:
+	"""read config from both file and kwargs, merge (kwargs overwrite)
+
+	relative paths in the file are relative to the file, and relative paths in
+	`kwargs` to the working directory, which is not changed. see `load_config_file`
+
+	### Raises:
+	 - `ValueError` : for unknown fields, or fields of the wrong type
+	"""
+	file_data : Dict[str, Any] = load_config_file(cfg_path) if cfg_path is not None else dict()
+
+	unknown : List[str] = sorted(set(kwargs) - set( fld.name for fld in fields(Config) ))
+	if unknown:
+		raise ValueError(f'unknown config fields: {unknown}')
+
+	# merge configs
+	return Config(**{**file_data, **kwargs})
+
+def gen(
+		cfg_path : Optional[str], 
+		keys : Any = None,
+		collection : Any = None,
+		modified_since : Any = None,
+		**kwargs,
+	):
+	"""read config from both file and kwargs, merge (kwargs overwrite), run `full_process`
+	
+	`keys`, `collection`, and `modified_since` select which entries to regenerate,
+	see `dendron_citations.selection.EntrySelection`
+	"""
+
+	full_process(
+		load_cfg(cfg_path, **kwargs),
+		selection = EntrySelection.from_kwargs(
+			keys = keys,
+			collection = collection,
+			modified_since = modified_since,
+		),
+	)
+
+def lookup(
+		cfg_path : Optional[str],
+		author : Optional[str] = None,
+		keyword : Optional[str] = None,
+		collection : Optional[str] = None,
+		fmt : str = 'text',
+		**kwargs,
+	):
+	"""print the keys of entries by an author, with a keyword, or in a collection,
+	using the lookup index in the vault (see `dendron_citations.lookup_index`)
+	"""
+	cfg : Config = load_cfg(cfg_path, **kwargs)
+	lookup_idx : LookupIndex = LookupIndex(cfg.vault_loc)
+	if not lookup_idx.entries:
+		print(
+			f'WARNING: lookup index for {cfg.vault_loc} is empty or missing, run generation first',
+			file = sys.stderr,
+		)
+
+	result : Dict[str, Any] = dict()
+	if author is not None:
+		result = lookup_idx.by_author(str(author))
+	elif keyword is not None:
+		result = {'keys' : lookup_idx.by_keyword(str(keyword))}
+	elif collection is not None:
+		result = {'keys' : lookup_idx.by_collection(str(collection))}
+	else:
+		raise ValueError('lookup needs one of `--author`, `--keyword`, or `--collection`')
+
+	if fmt.lower() == 'json':
+		print(json.dumps(result, indent = 4))
+	else:
+		print('\n'.join(result['keys']))
+
+def plan(
+		cfg_path : Optional[str],
+		fmt : str = 'text',
+		**kwargs,
+	):
+	"""print what a run would change in the vault, without writing anything,
+	see `dendron_citations.plan`. with `verbose`, every note is listed
+	"""
+	cfg : Config = load_cfg(cfg_path, **kwargs)
+
+	if fmt.lower() == 'json':
+		# keep progress messages out of the json
+		with redirect_stdout(sys.stderr):
+			vault_plan : VaultPlan = plan_changes(cfg)
+		print(json.dumps(vault_plan.as_dict(), indent = 4))
+	else:
+		vault_plan = plan_changes(cfg)
+		print(vault_plan.format_text(list_notes = cfg.verbose))
+
 def print_help():
 	print(__doc__)
 	sys.exit(0)
@@ -230,6 +391,19 @@ def main(cfg_path : Optional[str] = None, **kwargs):
 		print_help()
 	elif 'print_cfg' in kwargs:
 		print_cfg(fmt = kwargs['fmt'] if 'fmt' in kwargs else 'json')
+	elif 'daemon' in kwargs:
+		kwargs.pop('daemon')
+		socket_path : Optional[str] = kwargs.pop('socket', None)
+		run_daemon(load_cfg(cfg_path, **kwargs), socket_path = socket_path)
+	elif 'migrate_shards' in kwargs:
+		kwargs.pop('migrate_shards')
+		migrate_shards(load_cfg(cfg_path, **kwargs))
+	elif 'lookup' in kwargs:
+		kwargs.pop('lookup')
+		lookup(cfg_path, **kwargs)
+	elif 'plan' in kwargs:
+		kwargs.pop('plan')
+		plan(cfg_path, **kwargs)
 	else:
 		gen(cfg_path, **kwargs)
 
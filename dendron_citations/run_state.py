@@ -0,0 +1,205 @@
+"""per-entry failure tracking, and checkpoints for resuming interrupted runs
+
+a single malformed entry used to abort the whole run. instead, each stage
+catches errors per entry and records them in a `FailureLog`, which is saved
+as a report in the vault, and the run carries on with the other entries.
+
+for full runs, a `RunCheckpoint` records which entries were written, along
+with a version of each (the hash of its bibtex text, or its zotero
+`dateModified`). it is saved periodically, and kept if the run is interrupted
+or any entry fails. the next run skips entries which were already written
+and haven't changed, so only failed and unprocessed entries are redone. once
+a run finishes with no failures, the checkpoint is removed.
+
+full runs from a bibtex file also keep the version of every entry which was
+written, along with the config it was written with, so that `--plan` can tell
+which entries changed without rendering them (see `dendron_citations.plan`).
+zotero runs already keep this in their state file.
+"""
+
+# standard library imports
+from typing import (
+	Optional, Any,
+	Dict, Tuple,
+)
+
+import os
+import sys
+import json
+import hashlib
+import threading
+
+# local imports
+from dendron_citations.config import Config
+
+
+# filenames, placed in the vault
+FAILURE_REPORT_FILENAME : str = '.dendron_citations.failures.json'
+CHECKPOINT_FILENAME : str = '.dendron_citations.checkpoint.json'
+SOURCE_VERSIONS_FILENAME : str = '.dendron_citations.source_versions.json'
+
+# bump this if the format of the checkpoint changes
+CHECKPOINT_VERSION : int = 1
+
+# save the checkpoint after this many entries are written
+CHECKPOINT_INTERVAL : int = 100
+
+
+class FailureLog:
+	"""thread-safe record of which entries failed, in which stage, and why"""
+
+	def __init__(self) -> None:
+		self.failures : Dict[str, Dict[str, Any]] = dict()
+		self._lock : threading.Lock = threading.Lock()
+
+	def record(self, key : str, stage : str, err : BaseException) -> None:
+		"""record that `key` failed in `stage`, and print a warning"""
+		print(f'WARNING: entry {key} failed in {stage}:\t{type(err).__name__}: {err}', file = sys.stderr)
+		with self._lock:
+			self.failures[key] = {
+				'stage' : stage,
+				'error' : type(err).__name__,
+				'message' : str(err),
+			}
+
+	def merge(self, failures : Dict[str, Dict[str, Any]]) -> None:
+		"""add failures recorded elsewhere, such as in a worker process, without warning again"""
+		with self._lock:
+			self.failures.update(failures)
+
+	def __contains__(self, key : str) -> bool:
+		return key in self.failures
+
+	def __len__(self) -> int:
+		return len(self.failures)
+
+	def save(self, path : str) -> None:
+		"""write the report, or remove an old one if nothing failed"""
+		if not self.failures:
+			if os.path.exists(path):
+				os.remove(path)
+			return
+
+		with open(path, 'w', encoding = 'utf-8') as f:
+			json.dump(self.failures, f, indent = '\t', sort_keys = True)
+
+
+# config fields which only change how a run goes, not what it writes
+RUNTIME_CFG_KEYS : Tuple[str, ...] = (
+	'verbose', 'pipeline_queue_size', 'bib_parse_procs',
+	'pandoc_max_procs', 'pandoc_timeout', 'pandoc_retries',
+	'max_writes_per_sec', 'max_memory_mb',
+)
+
+
+def config_hash(cfg : Config) -> str:
+	"""hash of everything in the config which affects the output"""
+	cfg_dict : Dict[str, Any] = {
+		k : v
+		for k,v in cfg.as_dict().items()
+		if k not in RUNTIME_CFG_KEYS
+	}
+	return hashlib.sha1(
+		(json.dumps(cfg_dict, sort_keys = True) + cfg.template).encode('utf-8')
+	).hexdigest()
+
+
+class RunCheckpoint:
+	"""which entries, at which version, were written by an unfinished run"""
+
+	def __init__(self, cfg : Config, path : Optional[str] = None) -> None:
+		"""load the checkpoint for the vault in `cfg`, if it exists and was made with the same config
+
+		### Parameters:
+		 - `cfg : Config`
+		   config of the current run
+		 - `path : Optional[str]`
+		   where to store the checkpoint
+		   (defaults to `None`, meaning `CHECKPOINT_FILENAME` in the vault)
+		"""
+		self.path : str = path if path is not None else cfg.vault_loc + CHECKPOINT_FILENAME
+		self.cfg_hash : str = config_hash(cfg)
+		# key -> version, for entries already written
+		self.done : Dict[str, str] = dict()
+		# key -> version, for entries loaded but not yet written
+		self.pending : Dict[str, str] = dict()
+		self._n_unsaved : int = 0
+		self._lock : threading.Lock = threading.Lock()
+		self._load()
+
+	def _load(self) -> None:
+		if not os.path.isfile(self.path):
+			return
+
+		try:
+			with open(self.path, 'r', encoding = 'utf-8') as f:
+				data : Dict[str, Any] = json.load(f)
+		except (OSError, ValueError) as err:
+			print(f"WARNING: couldn't read checkpoint {self.path}, starting over:\t{err}", file = sys.stderr)
+			return
+
+		if (data.get('version') == CHECKPOINT_VERSION) and (data.get('cfg_hash') == self.cfg_hash):
+			self.done = data['done']
+			print(f'  resuming from checkpoint, {len(self.done)} entries already done')
+
+	def skip(self, key : str, version : str) -> bool:
+		"""whether `key` was already written at `version`. if not, it is marked as pending"""
+		with self._lock:
+			if self.done.get(key) == version:
+				return True
+			self.pending[key] = version
+			return False
+
+	def mark_done(self, key : str) -> None:
+		"""record that a pending entry was written, saving every `CHECKPOINT_INTERVAL` entries"""
+		with self._lock:
+			if key not in self.pending:
+				return
+			self.done[key] = self.pending.pop(key)
+			self._n_unsaved += 1
+			if self._n_unsaved >= CHECKPOINT_INTERVAL:
+				self._save()
+
+	def _save(self) -> None:
+		with open(self.path, 'w', encoding = 'utf-8') as f:
+			json.dump(
+				{'version' : CHECKPOINT_VERSION, 'cfg_hash' : self.cfg_hash, 'done' : self.done},
+				f,
+			)
+		self._n_unsaved = 0
+
+	def save(self) -> None:
+		with self._lock:
+			self._save()
+
+	def finish(self, failures : FailureLog) -> None:
+		"""at the end of a run: remove the checkpoint if everything succeeded, otherwise save it"""
+		if len(failures) == 0:
+			if os.path.exists(self.path):
+				os.remove(self.path)
+		else:
+			self.save()
+
+
+def load_source_versions(cfg : Config, path : Optional[str] = None) -> Dict[str, str]:
+	"""versions of the entries written by the last full run, or nothing if it used a different config"""
+	path = path if path is not None else cfg.vault_loc + SOURCE_VERSIONS_FILENAME
+	if not os.path.isfile(path):
+		return dict()
+
+	try:
+		with open(path, 'r', encoding = 'utf-8') as f:
+			data : Dict[str, Any] = json.load(f)
+	except (OSError, ValueError) as err:
+		print(f"WARNING: couldn't read entry versions {path}, every entry will count as changed:\t{err}", file = sys.stderr)
+		return dict()
+
+	if data.get('cfg_hash') != config_hash(cfg):
+		return dict()
+	return data['versions']
+
+def save_source_versions(cfg : Config, versions : Dict[str, str], path : Optional[str] = None) -> None:
+	"""record `versions`, mapping key to version, as written with `cfg`"""
+	path = path if path is not None else cfg.vault_loc + SOURCE_VERSIONS_FILENAME
+	with open(path, 'w', encoding = 'utf-8') as f:
+		json.dump({'cfg_hash' : config_hash(cfg), 'versions' : versions}, f, sort_keys = True)
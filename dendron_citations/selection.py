@@ -0,0 +1,132 @@
+"""selecting a subset of entries to regenerate, by key, collection, or modification date"""
+
+# standard library imports
+from typing import (
+	Optional, Any,
+	Tuple, Iterable,
+)
+
+from dataclasses import dataclass
+
+# local imports
+from dendron_citations.bibtex_util import BibtexSpan,bibtex_raw_field
+from dendron_citations.citationentry import CitationEntry
+
+# fields which various tools use to record when an entry was last modified
+BIBTEX_MODIFIED_FIELDS : Tuple[str,...] = (
+	'date-modified', # bibdesk
+	'datemodified',
+	'modified',
+	'timestamp', # jabref
+)
+
+# fields which various tools use to record when an entry was added
+BIBTEX_ADDED_FIELDS : Tuple[str,...] = (
+	'date-added', # bibdesk
+	'dateadded',
+	'creationdate', # jabref
+	'added-at', # bibsonomy
+)
+
+
+def _as_tuple(val : Any) -> Optional[Tuple[str,...]]:
+	"""convert a comma separated string, or an iterable, to a tuple of strings"""
+	if val is None:
+		return None
+	if isinstance(val, str):
+		return tuple(x.strip() for x in val.split(',') if x.strip())
+	if isinstance(val, Iterable):
+		return tuple(str(x).strip() for x in val)
+	return (str(val), )
+
+def _normalize_date(date : str) -> str:
+	"""make dates like `2022-03-01T10:00:00` comparable as strings to `2022-03-01 10:00:00`"""
+	return date.strip().replace('T', ' ')
+
+
+@dataclass(frozen = True)
+class EntrySelection:
+	"""which entries to regenerate. any field which is `None` does not filter anything
+
+	 - `keys` : citation keys (or zotero item keys), case insensitive
+	 - `collection` : collection key, as found in the `collections` field
+	 - `modified_since` : ISO date or datetime, compared against the modification
+	   date of the entry. entries with no modification date are not selected
+	"""
+	keys : Optional[Tuple[str,...]] = None
+	collection : Optional[str] = None
+	modified_since : Optional[str] = None
+
+	@staticmethod
+	def from_kwargs(
+			keys : Any = None,
+			collection : Any = None,
+			modified_since : Any = None,
+		) -> 'EntrySelection':
+		"""create from command line arguments, which might be strings, tuples, or numbers"""
+		return EntrySelection(
+			keys = _as_tuple(keys),
+			collection = None if collection is None else str(collection),
+			modified_since = None if modified_since is None else _normalize_date(str(modified_since)),
+		)
+
+	@property
+	def is_all(self) -> bool:
+		return (self.keys is None) and (self.collection is None) and (self.modified_since is None)
+
+	def _match(
+			self,
+			keys : Iterable[Optional[str]],
+			collections : Iterable[str],
+			date_modified : Optional[str],
+		) -> bool:
+		if self.keys is not None:
+			keys_lower : Tuple[str,...] = tuple(x.lower() for x in self.keys)
+			if not any((k is not None) and (k.lower() in keys_lower) for k in keys):
+				return False
+
+		if (self.collection is not None) and (self.collection not in collections):
+			return False
+
+		if self.modified_since is not None:
+			if (date_modified is None) or (_normalize_date(date_modified) < self.modified_since):
+				return False
+
+		return True
+
+	def match_bibtex(self, span : BibtexSpan, raw : str) -> bool:
+		"""check an unparsed bibtex entry, for use with `load_bibtex_selected`"""
+		if self.is_all:
+			return True
+
+		collections : Optional[str] = None
+		if self.collection is not None:
+			collections = bibtex_raw_field(raw, 'collections')
+
+		date_modified : Optional[str] = None
+		if self.modified_since is not None:
+			for field in BIBTEX_MODIFIED_FIELDS:
+				date_modified = bibtex_raw_field(raw, field)
+				if date_modified is not None:
+					break
+
+		return self._match(
+			keys = (span.key, ),
+			collections = (
+				[ x.strip() for x in collections.split(',') ]
+				if collections is not None
+				else list()
+			),
+			date_modified = date_modified,
+		)
+
+	def match_entry(self, entry : CitationEntry, date_modified : Optional[str]) -> bool:
+		"""check an already loaded entry, such as one from zotero"""
+		if self.is_all:
+			return True
+
+		return self._match(
+			keys = (entry.bib_key, entry.zotero_key),
+			collections = entry.collections or list(),
+			date_modified = date_modified,
+		)
@@ -0,0 +1,83 @@
+"""splitting reference and author tag notes into smaller hierarchies
+
+with tens of thousands of references, the `refs.` and `tags.author.` hierarchies
+each have one child per note, which makes Dendron's tree view slow. setting
+`note_shards` in the config inserts one more level:
+
+ - `year` : `refs.<year>.<key>`, with `undated` for entries without a year
+ - `letter` : `refs.<first letter of key>.<key>`
+
+with either scheme, author tags become `author.<first letter of last name>.<tag>`.
+dendron needs the notes themselves to stay in the root of the vault, so this
+shards the hierarchy, not the directory.
+"""
+
+# standard library imports
+from typing import (
+	Optional,
+	Tuple, Pattern, Match,
+)
+
+import re
+
+# local imports
+from dendron_citations.config import Config
+from dendron_citations.citationentry import CitationEntry
+
+
+NOTE_SHARD_SCHEMES : Tuple[str, ...] = ('year', 'letter')
+
+# shard for entries with no year, or keys not starting with a letter or digit
+UNDATED_SHARD : str = 'undated'
+OTHER_SHARD : str = 'other'
+
+_YEAR : Pattern = re.compile(r'\b(\d{4})\b')
+
+
+def check_shard_scheme(scheme : Optional[str]) -> None:
+	if (scheme is not None) and (scheme not in NOTE_SHARD_SCHEMES):
+		raise ValueError(f'unknown `note_shards` scheme {scheme!r}, expected one of {NOTE_SHARD_SCHEMES}')
+
+def _first_char_shard(s : str) -> str:
+	s = s.strip().lower()
+	return s[0] if (s and s[0].isascii() and s[0].isalnum()) else OTHER_SHARD
+
+def entry_shard(entry : CitationEntry, scheme : Optional[str]) -> Optional[str]:
+	"""the hierarchy level to insert for this entry, or `None` if not sharding"""
+	check_shard_scheme(scheme)
+	if scheme == 'year':
+		# bibtex files often only have a `year` field
+		date : str = entry.date or (entry.bib_meta.get('year') if entry.bib_meta else None) or ''
+		match : Optional[Match] = _YEAR.search(date)
+		return match.group(1) if match else UNDATED_SHARD
+	if scheme == 'letter':
+		return _first_char_shard(str(entry.bib_key))
+	return None
+
+def note_fname(entry : CitationEntry, cfg : Config) -> str:
+	"""filename of the note for `entry`, relative to the vault"""
+	shard : Optional[str] = entry_shard(entry, cfg.note_shards)
+	if shard is None:
+		return f'{cfg.note_prefix}{entry.bib_key}.md'
+	return f'{cfg.note_prefix}{shard}.{entry.bib_key}.md'
+
+def unshard_author_tag(tag : str) -> str:
+	"""`author.f.J-Frankle` -> `author.J-Frankle`. unsharded tags are returned as-is"""
+	if not tag.startswith('author.'):
+		return tag
+	rest : str = tag[len('author.'):]
+	if '.' in rest:
+		return 'author.' + rest.split('.', 1)[1]
+	return tag
+
+def shard_author_tag(tag : str, scheme : Optional[str]) -> str:
+	"""`author.J-Frankle` -> `author.f.J-Frankle`, sharding by the first letter of the last name
+
+	tags are unsharded first, so this can be used to change schemes
+	"""
+	check_shard_scheme(scheme)
+	tag = unshard_author_tag(tag)
+	if (scheme is None) or (not tag.startswith('author.')):
+		return tag
+	base : str = tag[len('author.'):]
+	return f'author.{_first_char_shard(base.rsplit("-", 1)[-1])}.{base}'
@@ -0,0 +1,921 @@
+"""the stages of a run, shared by full runs, `--plan`, and the daemon
+
+a run reads entries from the source (`iter_bib_raw` and `build_entries`, or
+`iter_entries_zotero`), passes them through stages which each take and yield
+entries (`enrich_entries`, `cluster_authors`, `shard_entries`, ...), renders
+them to notes (`render_notes`), and writes the notes that changed
+(`write_notes`). `generate_notes` connects these with
+`dendron_citations.pipeline.run_pipeline`, then makes tag notes.
+
+`bib_versions`, `zotero_changed_keys`, and `find_reference_notes` find which
+entries changed since the last run, and which notes already exist.
+"""
+
+# standard library imports
+from typing import (
+	Optional, Any,
+	Dict, List, Tuple, Iterable, Iterator, Sequence,
+)
+
+import os
+import re
+import sys
+import calendar
+from datetime import datetime
+from collections import OrderedDict
+from functools import partial
+from itertools import chain
+from dataclasses import dataclass,replace
+
+# package imports
+import yaml # type: ignore
+import biblib.bib # type: ignore
+
+# local imports
+from dendron_citations.dc_util import (
+	OptionalStr,OrderedDictType,
+)
+from dendron_citations.md_util import PandocMarkdown,gen_dendron_ID,merge_generated
+from dendron_citations.bib_index import BibIndex
+from dendron_citations.bib_pool import BibParsePool,parse_isolated
+from dendron_citations.bibtex_util import inherit_crossref
+from dendron_citations.process_meta import Config,GLOBAL_AUTHORS_DICT
+from dendron_citations.citationentry import CitationEntry,Template,compile_template,get_needed_fields
+from dendron_citations.field_map import FieldExtractor,get_field_extractor
+from dendron_citations.pipeline import Stage,run_pipeline
+from dendron_citations.pandoc_pool import PandocPool
+from dendron_citations.process_meta import process_note_plain
+from dendron_citations.vault_index import NOTE_META_KEYS,VaultIndex,content_hash,rendered_hash
+from dendron_citations.lookup_index import LookupIndex
+from dendron_citations.export import CitationExporter
+from dendron_citations.limits import ResourceLimits
+from dendron_citations.sharding import (
+	note_fname,shard_author_tag,unshard_author_tag,
+)
+from dendron_citations.author_clusters import (
+	AuthorName,cluster_author_names,load_author_overrides,
+)
+from dendron_citations.selection import EntrySelection,BIBTEX_ADDED_FIELDS,BIBTEX_MODIFIED_FIELDS
+from dendron_citations.run_state import FailureLog,RunCheckpoint
+from dendron_citations.zotero_util import (
+	ZoteroDB,ZoteroState,ZOTERO_STATE_FILENAME,
+	load_zotero_state,save_zotero_state,
+)
+
+
+@dataclass(frozen = True)
+class RunContext:
+	"""the state of one run, which the stages that use it share. every part is optional
+
+	 - `index` : notes are read and written through it (see `VaultIndex`)
+	 - `lookup` : every entry is recorded in it
+	 - `failures` : errors are recorded in it per entry, instead of being raised
+	 - `checkpoint` : written entries are marked as done in it
+	 - `exporter` : every entry is exported to it once its note is processed
+	 - `limits` : writes, and reading from the source, are throttled by it
+	"""
+	index : Optional[VaultIndex] = None
+	lookup : Optional[LookupIndex] = None
+	failures : Optional[FailureLog] = None
+	checkpoint : Optional[RunCheckpoint] = None
+	exporter : Optional[CitationExporter] = None
+	limits : Optional[ResourceLimits] = None
+
+
+def get_note_meta(
+		vault_loc : str, 
+		fname : str, 
+		index : Optional[VaultIndex] = None,
+	) -> Optional[Dict[str, Any]]:
+	"""get the frontmatter of an existing note, or `None` if it doesn't exist
+	
+	if `index` is given, this is just a lookup. otherwise, the note is loaded from disk
+	"""
+	if index is not None:
+		return index.get(fname)
+
+	path : str = f'{vault_loc}{fname}'
+	if not os.path.exists(path):
+		return None
+
+	old_note : PandocMarkdown = PandocMarkdown()
+	old_note.load(path)
+	return old_note.yaml_data
+
+def save_note(
+		vault_loc : str, 
+		fname : str, 
+		note : PandocMarkdown, 
+		index : Optional[VaultIndex] = None,
+		limits : Optional[ResourceLimits] = None,
+	) -> None:
+	"""save a note, through `index` if it is given
+	
+	if `limits` is given, it is waited on before the file is written, but not if
+	`index` finds the file already has this content
+	"""
+	if index is not None:
+		index.write(fname, note, limits.wait_write if limits is not None else None)
+	else:
+		if limits is not None:
+			limits.wait_write()
+		with open(f'{vault_loc}{fname}', 'w', encoding = 'utf-8') as f:
+			f.write(note.dumps())
+
+def new_note_id(
+		fname : str, 
+		deterministic : bool = False, 
+		index : Optional[VaultIndex] = None,
+	) -> str:
+	"""generate an ID for a new note
+	
+	if `deterministic`, the ID is derived from the filename (without `.md`),
+	so regenerating a vault from scratch gives the same IDs.
+	if `index` is given, IDs already used in the vault are avoided
+	"""
+	seed : Optional[str] = fname[:-len('.md')] if deterministic else None
+	if index is not None:
+		return index.new_id(fname, seed = seed)
+	return gen_dendron_ID(seed = seed)
+
+# `created` and `updated` of new notes with `deterministic_ids`, if there are no dates to use
+DETERMINISTIC_EPOCH_MS : int = 0
+
+# a date, optionally with a time, in any of the forms used by zotero and bibtex managers
+_DATE_PATTERN : re.Pattern = re.compile(
+	r'(\d{4})[-./](\d{1,2})[-./](\d{1,2})(?:[ T](\d{1,2}):(\d{2})(?::(\d{2}))?)?'
+)
+
+def _parse_date_ms(date : str) -> Optional[int]:
+	"""milliseconds since the epoch of a date like `2022-03-01 10:00:00`, read as UTC
+
+	any timezone is ignored, since the result only needs to be stable.
+	returns `None` if no date is found
+	"""
+	match : Optional[re.Match] = _DATE_PATTERN.search(date)
+	if match is None:
+		return None
+	year, month, day, hour, minute, second = ( int(x) for x in match.groups(default = '0') )
+	try:
+		parsed : datetime = datetime(year, month, day, hour, minute, second)
+	except ValueError:
+		return None
+	return calendar.timegm(parsed.timetuple()) * 1000
+
+def entry_times(entry : CitationEntry) -> Tuple[int, int]:
+	"""stable `created` and `updated` times for a new note of `entry`, in milliseconds
+
+	these are the dates the entry was added and last modified, as recorded by
+	zotero or a bibtex manager (see `BIBTEX_ADDED_FIELDS` and
+	`BIBTEX_MODIFIED_FIELDS`), so regenerating the note gives the same times.
+	`created` falls back to the modification date, and both to `DETERMINISTIC_EPOCH_MS`
+	"""
+	meta : Dict[str, Any] = {
+		k.lower() : v
+		for k,v in (entry.bib_meta or dict()).items()
+	}
+
+	def _first_date(names : Sequence[str]) -> Optional[int]:
+		for name in names:
+			if name in meta:
+				parsed : Optional[int] = _parse_date_ms(str(meta[name]))
+				if parsed is not None:
+					return parsed
+		return None
+
+	modified : Optional[int] = _first_date(BIBTEX_MODIFIED_FIELDS)
+	added : Optional[int] = _first_date(BIBTEX_ADDED_FIELDS)
+	created : int = next(
+		(x for x in (added, modified) if x is not None),
+		DETERMINISTIC_EPOCH_MS,
+	)
+	return created, (modified if modified is not None else created)
+
+def make_tag_note(
+		tag : str, 
+		vault_loc : str, 
+		aliases : Optional[List[str]] = None,
+		deterministic_ids : bool = False,
+		run : Optional[RunContext] = None,
+	) -> None:
+	"""check for the existance of a tag note in the vault, and make it if it doesnt exist
+	
+	for author tags, `aliases` are the names listed in the note. if not given,
+	the names seen by `name_to_tag` are used. the note is written through the
+	index and limits of `run`, if given
+	"""
+	index : Optional[VaultIndex] = run.index if run is not None else None
+	
+	tag_fname : str = f'tags.{tag}.md'
+	
+	if (
+		(tag_fname in index) 
+		if index is not None 
+		else os.path.exists(f'{vault_loc}{tag_fname}')
+	):
+		return
+
+	note : PandocMarkdown = PandocMarkdown.get_dendron_template(fm = dict())
+	if deterministic_ids:
+		note.yaml_data['created'] = DETERMINISTIC_EPOCH_MS
+		note.yaml_data['updated'] = DETERMINISTIC_EPOCH_MS
+	note.yaml_data['id'] = new_note_id(tag_fname, deterministic_ids, index)
+	note.yaml_data['title'] = tag
+
+	note.content = f'# {tag}\n\n'
+
+	# global GLOBAL_AUTHORS_DICT
+	# if its an author tag, figure out all the names for the author:
+	if tag.startswith('author.'):
+		# removeprefix only works in python 3.9+
+		# authortag : str = tag.removeprefix('author.')
+		authortag : str = unshard_author_tag(tag)[len('author.'):]
+
+		note.content += '\n'.join([
+			'## Author names:',
+			'',
+			'\n'.join([
+				f'- {x}'
+				for x in (aliases if aliases is not None else GLOBAL_AUTHORS_DICT[authortag])
+			]),
+		])
+
+	save_note(vault_loc, tag_fname, note, index, run.limits if run is not None else None)
+
+def update_tag_members(
+		cfg : Config,
+		lookup : LookupIndex,
+		index : Optional[VaultIndex] = None,
+		limits : Optional[ResourceLimits] = None,
+	) -> int:
+	"""write the sorted list of reference notes with each tag into its tag note
+
+	the list is placed between the generated region markers (see
+	`dendron_citations.md_util`), after anything already in the note. only tag
+	notes whose members changed since they were last written are touched, and
+	a hash of the members of each is kept in `lookup`, which should be saved
+	afterwards. returns the number of tag notes written
+	"""
+	members : Dict[str, List[str]] = lookup.tag_members(cfg.note_prefix)
+	n_written : int = 0
+	for tag in sorted(set(members) | set(lookup.tag_member_hashes)):
+		notes : List[str] = members.get(tag, list())
+		members_hash : str = content_hash('\n'.join(notes))
+		if lookup.tag_member_hashes.get(tag) == members_hash:
+			continue
+
+		tag_fname : str = f'tags.{tag}.md'
+		if not os.path.exists(f'{cfg.vault_loc}{tag_fname}'):
+			if not notes:
+				del lookup.tag_member_hashes[tag]
+				continue
+			make_tag_note(
+				tag, cfg.vault_loc,
+				aliases = lookup.by_author(tag)['aliases'],
+				deterministic_ids = cfg.deterministic_ids,
+				run = RunContext(index = index, limits = limits),
+			)
+
+		note : PandocMarkdown = PandocMarkdown()
+		note.load(f'{cfg.vault_loc}{tag_fname}')
+		note.content = merge_generated(
+			note.content,
+			'\n'.join([
+				'## References:',
+				'',
+				*[ f'- [[{n}]]' for n in notes ],
+			]),
+			append = True,
+		)
+		save_note(cfg.vault_loc, tag_fname, note, index, limits)
+		n_written += 1
+
+		if notes:
+			lookup.tag_member_hashes[tag] = members_hash
+		else:
+			del lookup.tag_member_hashes[tag]
+
+	return n_written
+
+# number of entries parsed by biblib at once
+BIB_PARSE_BATCH_SIZE : int = 256
+
+def _load_bib_isolated(
+		bib_index : BibIndex,
+		keys : List[str],
+		failures : Optional[FailureLog] = None,
+	) -> OrderedDictType[str, biblib.bib.Entry]:
+	"""parse `keys`, and if that fails, parse them one at a time so only the bad entries are lost"""
+	return parse_isolated(bib_index.load, keys, failures)
+
+def resolve_crossrefs(
+		entries : OrderedDictType[str, biblib.bib.Entry],
+		bib_index : BibIndex,
+		failures : Optional[FailureLog] = None,
+	) -> OrderedDictType[str, biblib.bib.Entry]:
+	"""merge step: fill in `entries` from their `crossref` parents, which are parsed again from `bib_index`"""
+	parent_keys : List[str] = sorted(set(
+		str(entry['crossref']).strip()
+		for entry in entries.values()
+	))
+	parents : OrderedDictType[str, biblib.bib.Entry] = _load_bib_isolated(
+		bib_index, 
+		[ k for k in parent_keys if k in bib_index ], 
+		failures,
+	)
+	parents_lower : Dict[str, biblib.bib.Entry] = { k.lower() : v for k,v in parents.items() }
+
+	for key,entry in entries.items():
+		parent_key : str = str(entry['crossref']).strip()
+		if parent_key.lower() in parents_lower:
+			inherit_crossref(entry, parents_lower[parent_key.lower()])
+		else:
+			print(f'WARNING: crossref {parent_key} of entry {key} not found in {bib_index.filename}', file = sys.stderr)
+
+	return entries
+
+def iter_bib_raw(
+		cfg : Config, 
+		selection : Optional[EntrySelection] = None,
+		failures : Optional[FailureLog] = None,
+		checkpoint : Optional[RunCheckpoint] = None,
+	) -> Iterator[Tuple[str, biblib.bib.Entry]]:
+	"""source: load raw entries from the bibtex file `cfg.bib_filename`
+	
+	entries are parsed in batches, in `cfg.bib_parse_procs` worker processes
+	if it is positive (see `dendron_citations.bib_pool`). entries with a
+	`crossref` are held back until every batch is parsed, then filled in from
+	their parents. if `selection` is given, only the selected entries are
+	parsed. if `failures` is given, entries which fail to parse are recorded
+	there and skipped. if `checkpoint` is given, entries which it records as
+	done and unchanged are skipped
+	"""
+	bib_index : BibIndex = BibIndex(cfg.bib_filename)
+	keys : List[str]
+	if (selection is None) or selection.is_all:
+		keys = bib_index.keys()
+	elif (selection.keys is not None) and (selection.collection is None) and (selection.modified_since is None):
+		# only keys given, so we can look them up directly
+		keys = [ k for k in selection.keys if k in bib_index ]
+	else:
+		keys = [ k for k in bib_index.keys() if selection.match_bibtex(bib_index.span(k), bib_index.raw(k)) ]
+
+	if checkpoint is not None:
+		keys = [ k for k in keys if not checkpoint.skip(k, bib_index.entry_hash(k)) ]
+
+	if cfg.verbose:
+		print(f'  loading {len(keys)} of {len(bib_index)} entries')
+
+	batches : List[List[str]] = [
+		keys[i : i + BIB_PARSE_BATCH_SIZE]
+		for i in range(0, len(keys), BIB_PARSE_BATCH_SIZE)
+	]
+	parsed : Iterable[OrderedDictType[str, biblib.bib.Entry]] = (
+		BibParsePool(bib_index, cfg.bib_parse_procs, failures).parse(batches)
+		if (cfg.bib_parse_procs > 0) and (len(batches) > 1)
+		else ( _load_bib_isolated(bib_index, batch, failures) for batch in batches )
+	)
+
+	crossrefs : OrderedDictType[str, biblib.bib.Entry] = OrderedDict()
+	for db in parsed:
+		for key,entry in db.items():
+			if 'crossref' in entry:
+				crossrefs[key] = entry
+			else:
+				yield key, entry
+
+	if crossrefs:
+		yield from resolve_crossrefs(crossrefs, bib_index, failures).items()
+
+	bib_index.close()
+
+def zotero_changed_keys(
+		cfg : Config,
+		versions : Dict[str,str],
+		state : ZoteroState,
+	) -> List[str]:
+	"""zotero keys of items modified since `state` was saved, or whose note is missing from the vault"""
+	return [
+		key
+		for key,date_modified in versions.items()
+		if (
+			(key not in state) 
+			or (state[key]['dateModified'] != date_modified)
+			or (not os.path.exists(cfg.vault_loc + zotero_note_fname(cfg, state[key])))
+		)
+	]
+
+def zotero_note_fname(cfg : Config, item_state : Dict[str,str]) -> str:
+	"""filename of the note for an item in the zotero state. older states didn't record it"""
+	return item_state.get('fname', f'{cfg.note_prefix}{item_state["bib_key"]}.md')
+
+def iter_entries_zotero(
+		cfg : Config, 
+		process_note : bool = True,
+		selection : Optional[EntrySelection] = None,
+		failures : Optional[FailureLog] = None,
+		checkpoint : Optional[RunCheckpoint] = None,
+	) -> Iterator[CitationEntry]:
+	"""source: load entries directly from the zotero database `cfg.zotero_db`
+	
+	only items whose `dateModified` changed since the last run, or whose note
+	is missing from the vault, are loaded. if `selection` is given, exactly the 
+	selected items are loaded instead. the state is saved in the vault
+	once all entries have been loaded. `failures` and `checkpoint` are as in `iter_bib_raw`
+	"""
+	assert cfg.zotero_db is not None
+	state_path : str = cfg.vault_loc + ZOTERO_STATE_FILENAME
+	state : ZoteroState = load_zotero_state(state_path)
+
+	with ZoteroDB(cfg.zotero_db) as zdb:
+		versions : Dict[str,str] = zdb.item_versions()
+		changed : List[str]
+		if (selection is None) or selection.is_all:
+			changed = zotero_changed_keys(cfg, versions, state)
+		else:
+			# filter by date before loading, since that is cheap
+			changed = [
+				key
+				for key,date_modified in versions.items()
+				if (selection.modified_since is None) or (date_modified >= selection.modified_since)
+			]
+		entries : OrderedDictType[str, CitationEntry] = zdb.load_entries(
+			cfg, 
+			keys = changed, 
+			process_note = process_note,
+			on_error = (
+				partial(failures.record, stage = 'load')
+				if failures is not None
+				else None
+			),
+		)
+
+	if (selection is not None) and (not selection.is_all):
+		entries = OrderedDict(
+			(key, entry)
+			for key,entry in entries.items()
+			if selection.match_entry(entry, versions[str(entry.zotero_key)])
+		)
+		changed = [ str(entry.zotero_key) for entry in entries.values() ]
+
+	if cfg.verbose:
+		print(f'  loading {len(changed)} of {len(versions)} zotero items')
+
+	# drop items which no longer exist in zotero
+	new_state : ZoteroState = {
+		key : val
+		for key,val in state.items()
+		if key in versions
+	}
+
+	for entry in entries.values():
+		assert entry.zotero_key is not None
+		if (checkpoint is None) or (not checkpoint.skip(str(entry.bib_key), versions[entry.zotero_key])):
+			yield entry
+		new_state[entry.zotero_key] = {
+			'dateModified' : versions[entry.zotero_key],
+			'bib_key' : str(entry.bib_key),
+			'fname' : note_fname(entry, cfg),
+		}
+
+	save_zotero_state(state_path, new_state)
+
+def build_entries(
+		items : Iterable[Tuple[str, biblib.bib.Entry]], 
+		cfg : Config,
+		failures : Optional[FailureLog] = None,
+	) -> Iterator[CitationEntry]:
+	"""stage: convert biblib entries to our format, leaving notes unprocessed
+	
+	in this and the following stages, if `failures` is given, errors are
+	recorded there and the entry is skipped, rather than raised
+	"""
+	extractor : FieldExtractor = get_field_extractor(cfg, get_needed_fields(cfg))
+	for key,val in items:
+		try:
+			yield CitationEntry.from_bib(key, val, cfg = cfg, process_note = False, extractor = extractor)
+		except Exception as err: # pylint: disable=broad-except
+			if failures is None:
+				raise
+			failures.record(key, 'build', err)
+
+def enrich_entries(
+		entries : Iterable[CitationEntry], 
+		failures : Optional[FailureLog] = None,
+	) -> Iterator[CitationEntry]:
+	"""stage: convert notes, which may call pandoc. on failure, the note is kept as plaintext"""
+	for entry in entries:
+		try:
+			yield entry.with_processed_note()
+		except Exception as err: # pylint: disable=broad-except
+			if failures is None:
+				raise
+			failures.record(str(entry.bib_key), 'pandoc', err)
+			yield replace(entry, note = None if entry.note is None else process_note_plain(entry.note))
+
+def _record_pandoc_failure(failures : FailureLog, keys : List[str], i : int, err : BaseException) -> None:
+	"""`on_error` for `PandocPool.process_notes`, for the batch of entries with `keys`"""
+	failures.record(keys[i], 'pandoc', err)
+
+def enrich_entries_concurrent(
+		entries : Iterable[CitationEntry], 
+		cfg : Config,
+		failures : Optional[FailureLog] = None,
+	) -> Iterator[CitationEntry]:
+	"""stage: convert notes in batches, running pandoc calls concurrently
+	
+	see `dendron_citations.pandoc_pool.PandocPool`. transient errors are retried,
+	and notes which still fail are kept as plaintext, and recorded in `failures`
+	"""
+	pool : PandocPool = PandocPool(
+		max_procs = cfg.pandoc_max_procs,
+		timeout = cfg.pandoc_timeout,
+		server_url = cfg.pandoc_server_url,
+		retries = cfg.pandoc_retries,
+	)
+	# enough to keep every process busy while the batch finishes
+	batch_size : int = pool.max_procs * 4
+
+	batch : List[CitationEntry] = list()
+	for entry in chain(entries, [None]):
+		if entry is not None:
+			batch.append(entry)
+		if batch and ((len(batch) >= batch_size) or (entry is None)):
+			notes : List[OptionalStr] = pool.process_notes(
+				[x.note for x in batch], 
+				on_error = (
+					partial(_record_pandoc_failure, failures, [ str(x.bib_key) for x in batch ])
+					if failures is not None
+					else None
+				),
+			)
+			for x,note in zip(batch, notes):
+				yield replace(x, note = note)
+			batch = list()
+
+def cluster_authors(
+		entries : Iterable[CitationEntry], 
+		cfg : Config,
+		aliases : Dict[str, List[str]],
+		lookup : Optional[LookupIndex] = None,
+	) -> Iterator[CitationEntry]:
+	"""stage: replace author tags with canonical ones, see `dendron_citations.author_clusters`
+	
+	this has to see every entry before yielding any. names recorded in `lookup`
+	are clustered too, so that a partial run gives the same tags as a full one.
+	the names merged into each canonical tag are added to `aliases`
+	"""
+	entries_list : List[CitationEntry] = list(entries)
+	names : List[AuthorName] = [
+		(tag['tag_name'], tag['str_name'])
+		for entry in entries_list
+		for tag in (entry.author_tags or list())
+	]
+	if lookup is not None:
+		names.extend(
+			(tag_name, str_name)
+			for rec in lookup.entries.values()
+			for tag_name,str_name in rec['authors']
+		)
+
+	canonical : Dict[AuthorName, str] = cluster_author_names(
+		names,
+		overrides = (
+			load_author_overrides(cfg.author_aliases_path)
+			if cfg.author_aliases_path is not None
+			else None
+		),
+		cluster = cfg.cluster_authors,
+	)
+
+	for name,tag_name in sorted(canonical.items()):
+		if name[1] not in aliases.setdefault(tag_name, list()):
+			aliases[tag_name].append(name[1])
+
+	for entry in entries_list:
+		yield replace(entry, author_tags = [
+			{'tag_name' : canonical[(tag['tag_name'], tag['str_name'])], 'str_name' : tag['str_name']}
+			for tag in (entry.author_tags or list())
+		])
+
+def shard_entries(
+		entries : Iterable[CitationEntry], 
+		cfg : Config,
+	) -> Iterator[CitationEntry]:
+	"""stage: shard author tags, see `dendron_citations.sharding`"""
+	for entry in entries:
+		yield replace(entry, author_tags = [
+			{'tag_name' : shard_author_tag(tag['tag_name'], cfg.note_shards), 'str_name' : tag['str_name']}
+			for tag in (entry.author_tags or list())
+		])
+
+def index_entries(
+		entries : Iterable[CitationEntry], 
+		lookup : LookupIndex,
+		cfg : Optional[Config] = None,
+	) -> Iterator[CitationEntry]:
+	"""stage: record the authors, keywords, and collections of each entry in `lookup`, 
+	along with the name of its note if `cfg` is given"""
+	for entry in entries:
+		lookup.add(entry, note_fname(entry, cfg)[:-len('.md')] if cfg is not None else None)
+		yield entry
+
+def export_entries(
+		entries : Iterable[CitationEntry], 
+		exporter : CitationExporter,
+	) -> Iterator[CitationEntry]:
+	"""stage: write each entry to `exporter`"""
+	for entry in entries:
+		exporter.add(entry)
+		yield entry
+
+def load_old_note(
+		vault_loc : str, 
+		fname : str, 
+		index : Optional[VaultIndex] = None,
+	) -> Tuple[Optional[str], Optional[PandocMarkdown]]:
+	"""read an existing note, returning its text and the parsed note, or `None`s if it doesn't exist
+	
+	if `index` is given, it is used to check whether the note exists. a note
+	which can't be parsed is returned with `None` in place of the parsed note
+	"""
+	path : str = f'{vault_loc}{fname}'
+	if (fname not in index) if index is not None else (not os.path.exists(path)):
+		return None, None
+
+	with open(path, 'r', encoding = 'utf-8') as f:
+		text : str = f.read()
+	
+	old_note : PandocMarkdown = PandocMarkdown()
+	try:
+		old_note.loads(text, filename = path)
+	except (ValueError, yaml.YAMLError) as err:
+		print(f'WARNING: could not parse existing note {path}, it will be replaced:\t{err}', file = sys.stderr)
+		return text, None
+
+	return text, old_note
+
+def move_old_note(
+		vault_loc : str,
+		old_fname : str,
+		fname : str,
+		key : str,
+		index : Optional[VaultIndex] = None,
+	) -> bool:
+	"""move the note of `key` from `old_fname` to `fname`, if `fname` doesn't exist yet
+
+	when the shard of an entry changes, such as when its year is corrected,
+	its note would otherwise be left behind under the old shard, and a new
+	note with a new ID made. the old note is only moved if its `bibtex_key` is
+	`key`, since the key in a sharded filename is a guess (see `find_reference_notes`).
+	returns whether the note was moved
+	"""
+	if (old_fname == fname) or ((fname in index) if index is not None else os.path.exists(vault_loc + fname)):
+		return False
+
+	_, old_note = load_old_note(vault_loc, old_fname, index)
+	if (old_note is None) or (str(old_note.yaml_data.get('bibtex_key')) != key):
+		return False
+
+	if index is not None:
+		index.move(old_fname, fname)
+	else:
+		os.replace(vault_loc + old_fname, vault_loc + fname)
+	return True
+
+def render_note(
+		entry : CitationEntry,
+		cfg : Config,
+		template : Template,
+		index : Optional[VaultIndex] = None,
+		old_fname : Optional[str] = None,
+	) -> Tuple[str, Optional[PandocMarkdown]]:
+	"""render an entry to a note, keeping metadata and user content from any existing note
+
+	the rendered template replaces only the generated region of the old note
+	(see `dendron_citations.md_util.merge_generated`), and frontmatter keys not
+	set by us are kept. the old note is read once, if it exists, and not at
+	all if `index` shows it was generated from the same rendered note and
+	hasn't changed since (see `VaultIndex.is_rendered`). if `old_fname` is
+	given, it is a note for this entry under another shard, which is moved to
+	the new filename first (see `move_old_note`)
+	
+	returns the filename relative to the vault, and the note, or `None` if the
+	note on disk is already identical
+	"""
+	# make the note
+	note : PandocMarkdown = entry.to_md(template)
+	fname : str = note_fname(entry, cfg)
+	if old_fname is not None:
+		move_old_note(cfg.vault_loc, old_fname, fname, str(entry.bib_key), index)
+
+	rendered : Optional[str] = None
+	if index is not None:
+		rendered = rendered_hash(note)
+		if index.is_rendered(fname, rendered):
+			return fname, None
+
+	old_text, old_note = load_old_note(cfg.vault_loc, fname, index)
+
+	# handle note metadata
+	old_meta : Optional[Dict[str, Any]] = (
+		index.get(fname)
+		if index is not None
+		else (old_note.yaml_data if old_note is not None else None)
+	)
+	if cfg.deterministic_ids:
+		# so that regenerating a note from scratch gives the same times
+		note.yaml_data['created'], note.yaml_data['updated'] = entry_times(entry)
+	elif old_meta is None:
+		# we don't update the time unless the note is new
+		note.update_time()
+
+	# if the note exists, get the created time and id from the old note
+	if old_meta is not None:
+		for k in NOTE_META_KEYS:
+			if k in old_meta:
+				note.yaml_data[k] = old_meta[k]
+	if (old_meta is None) or ('id' not in old_meta):
+		note.yaml_data['id'] = new_note_id(fname, cfg.deterministic_ids, index)
+
+	# keep anything the user added
+	if old_note is not None:
+		for k,v in old_note.yaml_data.items():
+			note.yaml_data.setdefault(k, v)
+	note.content = merge_generated(
+		old_note.content if old_note is not None else None,
+		note.content,
+	)
+
+	unchanged : bool = (old_text is not None) and (note.dumps() == old_text)
+	if (index is not None) and (rendered is not None):
+		index.mark_rendered(fname, rendered, pending = not unchanged)
+
+	return fname, (None if unchanged else note)
+
+def render_notes(
+		entries : Iterable[CitationEntry], 
+		cfg : Config,
+		all_tags : List[str],
+		run : RunContext = RunContext(),
+	) -> Iterator[Tuple[str, PandocMarkdown]]:
+	"""stage: render each entry to a note, see `render_note`
+	
+	yields filenames relative to the vault, and tags of every entry are appended to `all_tags`.
+	notes which are unchanged are not yielded, and are marked as done in `run.checkpoint`
+	"""
+	template : Template = compile_template(cfg.template)
+
+	# existing notes by key under any shard, to move notes whose shard changed
+	shard_notes : Dict[str, str] = dict()
+	if (cfg.note_shards is not None) and os.path.isdir(cfg.vault_loc):
+		_, shard_notes = find_reference_notes(cfg.vault_loc, cfg.note_prefix)
+
+	for entry in entries:
+		key : str = str(entry.bib_key)
+		if cfg.verbose:
+			print(f'  processing key:\t{key}')
+
+		try:
+			fname, note = render_note(entry, cfg, template, run.index, shard_notes.get(key))
+		except Exception as err: # pylint: disable=broad-except
+			if run.failures is None:
+				raise
+			run.failures.record(key, 'render', err)
+			continue
+
+		# save the tags for later
+		all_tags.extend(entry.get_all_tags())
+
+		if note is None:
+			if run.checkpoint is not None:
+				run.checkpoint.mark_done(key)
+			continue
+
+		yield fname, note
+
+def write_notes(
+		notes : Iterable[Tuple[str, PandocMarkdown]], 
+		vault_loc : str,
+		run : RunContext = RunContext(),
+	) -> None:
+	"""sink: save each note to its file, marking it as done in `run.checkpoint`"""
+	for fname,note in notes:
+		key : str = str(note.yaml_data.get('bibtex_key'))
+		try:
+			save_note(vault_loc, fname, note, run.index, run.limits)
+		except OSError as err:
+			if run.failures is None:
+				raise
+			run.failures.record(key, 'write', err)
+			continue
+
+		if run.checkpoint is not None:
+			run.checkpoint.mark_done(key)
+
+def generate_notes(
+		cfg : Config,
+		source : Iterable[Any],
+		pre_stages : Sequence[Stage] = (),
+		run : RunContext = RunContext(),
+	) -> List[str]:
+	"""run the note enricher, renderer, and writer on `source`, then make tag notes
+
+	`pre_stages` are run first, and should turn `source` into `CitationEntry`s.
+	each part of `run` that is given is used by every stage (see `RunContext`).
+	returns the filenames (relative to the vault) of the notes written
+	"""
+	all_tags : List[str] = list()
+	fnames : List[str] = list()
+	# only filled in if authors are clustered
+	author_aliases : Dict[str, List[str]] = dict()
+
+	def _record(notes : Iterable[Tuple[str, PandocMarkdown]]) -> Iterator[Tuple[str, PandocMarkdown]]:
+		for fname,note in notes:
+			fnames.append(fname)
+			yield fname, note
+
+	run_pipeline(
+		source = source,
+		stages = [
+			*pre_stages,
+			*(
+				[partial(cluster_authors, cfg = cfg, aliases = author_aliases, lookup = run.lookup)]
+				if cfg.cluster_authors or (cfg.author_aliases_path is not None)
+				else []
+			),
+			*([partial(shard_entries, cfg = cfg)] if cfg.note_shards is not None else []),
+			*([partial(index_entries, lookup = run.lookup, cfg = cfg)] if run.lookup is not None else []),
+			(
+				partial(enrich_entries_concurrent, cfg = cfg, failures = run.failures)
+				if cfg.pandoc_max_procs > 0
+				else partial(enrich_entries, failures = run.failures)
+			),
+			*([partial(export_entries, exporter = run.exporter)] if run.exporter is not None else []),
+			partial(render_notes, cfg = cfg, all_tags = all_tags, run = run),
+			_record,
+		],
+		sink = partial(write_notes, vault_loc = cfg.vault_loc, run = run),
+		queue_size = cfg.pipeline_queue_size,
+		before_item = run.limits.wait_memory if run.limits is not None else None,
+	)
+	
+	# make notes for any given tag
+	# dendron backlinks can be used to see which notes are linked to a tag
+	# NOTE: existing notes will not be overwritten. 
+	if cfg.make_tag_notes:
+		for tag in set(all_tags):
+			if cfg.verbose:
+				print(f'  processing tag:\t{tag}')
+			make_tag_note(
+				tag, cfg.vault_loc,
+				aliases = author_aliases.get(unshard_author_tag(tag)),
+				deterministic_ids = cfg.deterministic_ids,
+				run = run,
+			)
+
+	return fnames
+
+def source_keys(cfg : Config, selection : Optional[EntrySelection] = None) -> Optional[List[str]]:
+	"""keys of every entry in the source, or `None` if we can't tell without a full scan
+
+	for zotero, these are the entries recorded in the state file. for bibtex,
+	they come from the index, which is only scanned if `selection` is everything
+	"""
+	if cfg.zotero_db is not None:
+		return [
+			val['bib_key'] 
+			for val in load_zotero_state(cfg.vault_loc + ZOTERO_STATE_FILENAME).values()
+		]
+	if (selection is None) or selection.is_all:
+		bib_index : BibIndex = BibIndex(cfg.bib_filename)
+		keys : List[str] = list(bib_index.keys())
+		bib_index.close()
+		return keys
+	return None
+
+def bib_versions(cfg : Config) -> Dict[str, str]:
+	"""key and version (hash of the text) of every entry in the bibtex file, without parsing it"""
+	bib_index : BibIndex = BibIndex(cfg.bib_filename)
+	versions : Dict[str, str] = {
+		key : bib_index.entry_hash(key)
+		for key in bib_index.keys()
+	}
+	bib_index.close()
+	return versions
+
+def find_reference_notes(vault_loc : str, note_prefix : str) -> Tuple[Dict[str, str], Dict[str, str]]:
+	"""existing reference notes, by key as given in the filename, and by key after a shard
+	
+	the key after a shard is only a guess, since keys can contain `.`
+	"""
+	exact : Dict[str, str] = dict()
+	sharded : Dict[str, str] = dict()
+	for fname in sorted(os.listdir(vault_loc)):
+		if not (fname.startswith(note_prefix) and fname.endswith('.md')):
+			continue
+		stem : str = fname[len(note_prefix):-len('.md')]
+		exact[stem] = fname
+		if '.' in stem:
+			sharded.setdefault(stem.split('.', 1)[1], fname)
+	return exact, sharded
@@ -0,0 +1,291 @@
+"""persistent index of note metadata in a vault
+
+for every note, `full_process` used to check whether the file exists and then
+parse its frontmatter to recover `id`, `created`, and `updated`. instead, we
+keep an index file in the vault mapping note filename to those fields, plus
+a hash of the content and the mtime and size of the file. on load, the vault
+is listed once, and only notes whose mtime or size changed are re-parsed.
+every lookup after that is a dict access.
+
+notes written by `render_note` also record a hash of the note as rendered
+from the template, before it was merged with the note on disk. if a note
+hasn't changed on disk since, and renders to the same hash, it would come
+out identical, so it isn't read again.
+"""
+
+# standard library imports
+from typing import (
+	Optional, Any,
+	Dict,
+	Callable,
+)
+
+import os
+import sys
+import json
+import hashlib
+
+# package imports
+import yaml # type: ignore
+
+# local imports
+from dendron_citations.md_util import PandocMarkdown,gen_dendron_ID
+
+
+# filename of the index, placed in the vault
+VAULT_INDEX_FILENAME : str = '.dendron_citations.vault_index.json'
+
+# bump this if the format of the index changes, to force a rebuild
+VAULT_INDEX_VERSION : int = 1
+
+NoteMeta = Dict[str, Any]
+
+# frontmatter keys which we keep in the index
+NOTE_META_KEYS : tuple = ('id', 'created', 'updated')
+
+
+def content_hash(content : str) -> str:
+	return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+def rendered_hash(note : PandocMarkdown) -> str:
+	"""hash of a note as rendered from the template
+
+	`NOTE_META_KEYS` are left out, since each note keeps its own
+	"""
+	return content_hash(json.dumps(
+		[
+			[ [k, v] for k,v in note.yaml_data.items() if k not in NOTE_META_KEYS ],
+			note.content,
+		],
+		default = str,
+	))
+
+
+class VaultIndex:
+	"""index of note metadata, keyed by filename relative to the vault"""
+
+	def __init__(
+			self,
+			vault_loc : str,
+			index_path : Optional[str] = None,
+			revalidate : bool = False,
+		) -> None:
+		"""load the index for a vault, and refresh it against the files on disk
+
+		### Parameters:
+		 - `vault_loc : str`
+		   directory of the vault
+		 - `index_path : Optional[str]`
+		   where to store the index
+		   (defaults to `None`, meaning `VAULT_INDEX_FILENAME` in the vault)
+		 - `revalidate : bool`
+		   check the file of a note every time it is looked up or written (see
+		   `refresh_note`), rather than only on `refresh`. for long-lived
+		   processes, which touch a few notes at a time
+		   (defaults to `False`)
+		"""
+		self.vault_loc : str = vault_loc
+		self.revalidate : bool = revalidate
+		self.index_path : str = (
+			index_path
+			if index_path is not None
+			else os.path.join(vault_loc, VAULT_INDEX_FILENAME)
+		)
+		self.notes : Dict[str, NoteMeta] = dict()
+		# map of dendron id to the filename using it
+		self.ids : Dict[str, str] = dict()
+		# rendered hashes of notes about to be written, see `mark_rendered`
+		self._pending_rendered : Dict[str, str] = dict()
+
+		self._load()
+		self.refresh()
+
+	def _load(self) -> None:
+		if not os.path.isfile(self.index_path):
+			return
+
+		try:
+			with open(self.index_path, 'r', encoding = 'utf-8') as f:
+				data : Dict[str, Any] = json.load(f)
+		except (OSError, ValueError) as err:
+			print(f"WARNING: couldn't read vault index {self.index_path}, will rebuild it:\t{err}", file = sys.stderr)
+			return
+
+		if data.get('version') == VAULT_INDEX_VERSION:
+			self.notes = data['notes']
+
+	def _read_note(self, fname : str, mtime : float, size : int) -> NoteMeta:
+		"""parse a single note from disk"""
+		path : str = os.path.join(self.vault_loc, fname)
+		with open(path, 'r', encoding = 'utf-8') as f:
+			raw : str = f.read()
+
+		meta : NoteMeta = {
+			'hash' : content_hash(raw),
+			'mtime' : mtime,
+			'size' : size,
+		}
+		pdm : PandocMarkdown = PandocMarkdown()
+		try:
+			pdm.loads(raw, filename = path)
+		except (ValueError, yaml.YAMLError) as err:
+			print(f'WARNING: {err}', file = sys.stderr)
+			return meta
+
+		for k in NOTE_META_KEYS:
+			if k in pdm.yaml_data:
+				meta[k] = pdm.yaml_data[k]
+
+		return meta
+
+	def refresh(self) -> None:
+		"""list the vault, re-parsing only notes whose mtime or size changed"""
+		if not os.path.isdir(self.vault_loc):
+			self.notes = dict()
+			self.ids = dict()
+			return
+
+		notes_new : Dict[str, NoteMeta] = dict()
+		with os.scandir(self.vault_loc) as it:
+			for dir_entry in it:
+				if not (dir_entry.name.endswith('.md') and dir_entry.is_file()):
+					continue
+				stat : os.stat_result = dir_entry.stat()
+				old : Optional[NoteMeta] = self.notes.get(dir_entry.name)
+				if (
+					(old is not None)
+					and (old['mtime'] == stat.st_mtime)
+					and (old['size'] == stat.st_size)
+				):
+					notes_new[dir_entry.name] = old
+				else:
+					notes_new[dir_entry.name] = self._read_note(dir_entry.name, stat.st_mtime, stat.st_size)
+
+		self.notes = notes_new
+		self.ids = {
+			meta['id'] : fname
+			for fname,meta in self.notes.items()
+			if 'id' in meta
+		}
+
+	def refresh_note(self, fname : str) -> None:
+		"""check a single note against its file, re-parsing it if its mtime or size changed"""
+		try:
+			stat : os.stat_result = os.stat(os.path.join(self.vault_loc, fname))
+		except FileNotFoundError:
+			removed : Optional[NoteMeta] = self.notes.pop(fname, None)
+			if (removed is not None) and (self.ids.get(removed.get('id', '')) == fname):
+				del self.ids[removed['id']]
+			return
+
+		old : Optional[NoteMeta] = self.notes.get(fname)
+		if (old is not None) and (old['mtime'] == stat.st_mtime) and (old['size'] == stat.st_size):
+			return
+		meta : NoteMeta = self._read_note(fname, stat.st_mtime, stat.st_size)
+		self.notes[fname] = meta
+		if 'id' in meta:
+			self.ids[meta['id']] = fname
+
+	def _lookup(self, fname : str) -> Optional[NoteMeta]:
+		if self.revalidate:
+			self.refresh_note(fname)
+		return self.notes.get(fname)
+
+	def save(self) -> None:
+		with open(self.index_path, 'w', encoding = 'utf-8') as f:
+			json.dump(
+				{'version' : VAULT_INDEX_VERSION, 'notes' : self.notes},
+				f,
+				sort_keys = True,
+			)
+
+	def get(self, fname : str) -> Optional[NoteMeta]:
+		"""get metadata for a note, given its filename relative to the vault"""
+		return self._lookup(fname)
+
+	def __contains__(self, fname : str) -> bool:
+		return self._lookup(fname) is not None
+
+	def is_rendered(self, fname : str, rendered : str) -> bool:
+		"""whether `fname` is unchanged since it was generated from a rendered note with this hash
+
+		notes which changed on disk are re-read by `refresh`, which drops the hash
+		"""
+		meta : Optional[NoteMeta] = self._lookup(fname)
+		return (meta is not None) and (meta.get('rendered') == rendered)
+
+	def mark_rendered(self, fname : str, rendered : str, pending : bool = False) -> None:
+		"""record that `fname` was generated from a rendered note with hash `rendered`
+
+		if `pending`, the note is about to be written, and the hash is only
+		recorded once it is written through `write`, so a failed write doesn't
+		leave the old note marked as up to date
+		"""
+		if pending:
+			self._pending_rendered[fname] = rendered
+		elif fname in self.notes:
+			self.notes[fname]['rendered'] = rendered
+
+	def new_id(self, fname : str, seed : Optional[str] = None) -> str:
+		"""generate a dendron ID for `fname` not used by any other note, and reserve it
+
+		if `seed` is given, the ID is derived from it (see `gen_dendron_ID`)
+		"""
+		new : str = gen_dendron_ID(seed = seed, taken = self.ids)
+		self.ids[new] = fname
+		return new
+
+	def write(
+			self, 
+			fname : str, 
+			note : PandocMarkdown,
+			before_write : Optional[Callable[[], None]] = None,
+		) -> bool:
+		"""write `note` to `fname` (relative to the vault) and record it in the index
+
+		if the file already has exactly this content, it is not written.
+		otherwise, `before_write()` is called first, if given.
+		returns whether the file was written
+		"""
+		content : str = note.dumps()
+		new_hash : str = content_hash(content)
+		rendered : Optional[str] = self._pending_rendered.pop(fname, None)
+		old : Optional[NoteMeta] = self._lookup(fname)
+		if (old is not None) and (old['hash'] == new_hash):
+			if rendered is not None:
+				old['rendered'] = rendered
+			return False
+
+		if before_write is not None:
+			before_write()
+
+		path : str = os.path.join(self.vault_loc, fname)
+		with open(path, 'w', encoding = 'utf-8') as f:
+			f.write(content)
+
+		stat : os.stat_result = os.stat(path)
+		meta : NoteMeta = {
+			'hash' : new_hash,
+			'mtime' : stat.st_mtime,
+			'size' : stat.st_size,
+		}
+		if rendered is not None:
+			meta['rendered'] = rendered
+		for k in NOTE_META_KEYS:
+			if k in note.yaml_data:
+				meta[k] = note.yaml_data[k]
+		self.notes[fname] = meta
+		if 'id' in meta:
+			self.ids[meta['id']] = fname
+
+		return True
+
+	def move(self, old_fname : str, fname : str) -> None:
+		"""rename the note `old_fname` to `fname` (both relative to the vault), keeping its metadata"""
+		os.replace(os.path.join(self.vault_loc, old_fname), os.path.join(self.vault_loc, fname))
+		meta : Optional[NoteMeta] = self.notes.pop(old_fname, None)
+		if meta is None:
+			return
+		self.notes[fname] = meta
+		if 'id' in meta:
+			self.ids[meta['id']] = fname
@@ -0,0 +1,393 @@
+"""reading entries directly from a zotero sqlite database
+
+instead of exporting to bibtex and re-parsing with `biblib`, we read
+`zotero.sqlite` directly. since zotero holds a lock on its database while
+running, we always work on a snapshot copy, opened read-only.
+
+change detection is done using the `dateModified` column of the `items` table,
+which zotero updates whenever an item (or its metadata) is modified
+"""
+
+# standard library imports
+from typing import (
+	Optional, Any,
+	Dict, List, Tuple, Iterable, FrozenSet,
+	Callable,
+)
+
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import tempfile
+from collections import OrderedDict, defaultdict
+from urllib.request import pathname2url
+
+# local imports
+from dendron_citations.dc_util import (
+	OptionalStr,OrderedDictType,
+)
+from dendron_citations.process_meta import (
+	Config,Biblib_Name_Type,
+	strip_bibtex_fmt,name_to_tag,
+	process_tag_name,process_note_HACKY,
+)
+from dendron_citations.citationentry import CitationEntry,AuthorTagDict,get_needed_fields
+
+
+# item types which are not references themselves
+ZOTERO_SKIP_ITEM_TYPES : Tuple[str,...] = ('attachment', 'note', 'annotation')
+
+# creator types which are treated as authors
+ZOTERO_AUTHOR_CREATOR_TYPES : Tuple[str,...] = ('author', )
+
+# temporary table holding the item ids being loaded, to restrict the grouped queries
+SELECTED_ITEMS : str = 'temp.dendron_citations_selected_items'
+
+# filename for storing `dateModified` of each item between runs, placed in the vault
+ZOTERO_STATE_FILENAME : str = '.dendron_citations.zotero_state.json'
+
+ZoteroState = Dict[str, Dict[str,str]]
+
+
+def _zotero_date(date : str) -> str:
+	"""zotero stores dates as `'YYYY-MM-DD original'`, we want the original string"""
+	parts : List[str] = date.split(' ', 1)
+	if len(parts) == 2 and len(parts[0]) == 10 and parts[0][4] == '-':
+		return parts[1]
+	return date
+
+def _citation_key(fields : Dict[str,str], zotero_key : str) -> str:
+	"""get the citation key for an item
+
+	checks, in order, the `citationKey` field (zotero 7+), a
+	`Citation Key: <key>` line in the `extra` field (better bibtex),
+	and finally falls back to the zotero item key
+	"""
+	if fields.get('citationKey'):
+		return fields['citationKey']
+
+	for line in fields.get('extra', '').split('\n'):
+		if line.lower().startswith('citation key:'):
+			return line.split(':', 1)[1].strip()
+
+	return zotero_key
+
+
+def _zotero_authors(
+		creators : List[Tuple[Any,...]],
+		cfg : Config,
+	) -> Tuple[List[str], List[AuthorTagDict]]:
+	"""names and tags of the authors of an item, from its `(firstName, lastName, creatorType)` rows"""
+	authors : List[str] = list()
+	author_tags : List[AuthorTagDict] = list()
+	for first,last,creator_type in creators:
+		if creator_type not in ZOTERO_AUTHOR_CREATOR_TYPES:
+			continue
+		# single-field names (`fieldMode = 1`) have an empty first name
+		nm : Biblib_Name_Type = Biblib_Name_Type(first = first or '', last = last or '')
+		nm_str : str = strip_bibtex_fmt(f'{nm.first} {nm.last}')
+		authors.append(nm_str)
+		author_tags.append({ 'tag_name' : name_to_tag(nm, cfg), 'str_name' : nm_str })
+	return authors, author_tags
+
+def _make_entry(
+		cfg : Config,
+		item : Tuple[str,str],
+		rows : Dict[str, List[Tuple[Any,...]]],
+		needed : Optional[FrozenSet[str]],
+		process_note : bool,
+	) -> CitationEntry:
+	"""build the entry for an item, given its `(key, typeName)` and its rows from
+	each query in `ZoteroDB._query_selected`. see `ZoteroDB.load_entries`
+	"""
+	zotero_key, typ = item
+
+	def _wants(field : str) -> bool:
+		return (needed is None) or (field in needed)
+
+	item_fields : Dict[str,str] = dict(rows['fields'])
+	authors, author_tags = _zotero_authors(rows['creators'], cfg)
+	item_notes : List[str] = [ x[0] for x in rows['notes'] if x[0] ]
+	raw_note : OptionalStr = '\n\n'.join(item_notes) if item_notes else None
+
+	bib_key : str = _citation_key(item_fields, zotero_key)
+	return CitationEntry(
+		bib_key = bib_key,
+		zotero_key = zotero_key,
+		title = strip_bibtex_fmt(item_fields['title']) if 'title' in item_fields else None,
+		authors = authors,
+		author_tags = author_tags,
+		typ = typ if _wants('typ') else None,
+		date = _zotero_date(item_fields['date']) if 'date' in item_fields else None,
+		links = ([ item_fields['url'] ] if 'url' in item_fields else list()) if _wants('links') else None,
+		files = [ x[0] for x in rows['files'] ],
+		keywords = [ process_tag_name(x[0]) for x in rows['tags'] ],
+		collections = [ x[0] for x in rows['collections'] ],
+		abstract = (
+			strip_bibtex_fmt(item_fields['abstractNote']) 
+			if ('abstractNote' in item_fields) and _wants('abstract') 
+			else None
+		),
+		note = process_note_HACKY(raw_note) if process_note else raw_note,
+		bib_meta = OrderedDict(item_fields) if _wants('bib_meta') else None,
+	)
+
+
+class ZoteroDB:
+	"""read-only access to a snapshot copy of `zotero.sqlite`
+
+	use as a context manager, so that the snapshot is cleaned up:
+	```python
+	with ZoteroDB('~/Zotero/zotero.sqlite') as zdb:
+		entries = zdb.load_entries(cfg)
+	```
+	"""
+
+	def __init__(self, db_path : str, snapshot : bool = True) -> None:
+		"""open a zotero database
+
+		### Parameters:
+		 - `db_path : str`
+		   path to `zotero.sqlite`. attachments are looked for in `storage/` next to it
+		 - `snapshot : bool`
+		   copy the database to a temporary directory before opening.
+		   leave this on unless you know zotero is not running
+		   (defaults to `True`)
+		"""
+		self.db_path : str = os.path.abspath(os.path.expanduser(db_path))
+		self.storage_dir : str = os.path.join(os.path.dirname(self.db_path), 'storage')
+
+		self._tmpdir : Optional[str] = None
+		open_path : str = self.db_path
+		if snapshot:
+			self._tmpdir = tempfile.mkdtemp(prefix = 'dendron_citations_')
+			open_path = os.path.join(self._tmpdir, os.path.basename(self.db_path))
+			shutil.copy2(self.db_path, open_path)
+			# copy the write-ahead log too, if there is one
+			if os.path.isfile(self.db_path + '-wal'):
+				shutil.copy2(self.db_path + '-wal', open_path + '-wal')
+
+		self.conn : sqlite3.Connection = sqlite3.connect(
+			f'file:{pathname2url(open_path)}?mode=ro',
+			uri = True,
+		)
+
+	def close(self) -> None:
+		self.conn.close()
+		if self._tmpdir is not None:
+			shutil.rmtree(self._tmpdir, ignore_errors = True)
+			self._tmpdir = None
+
+	def __enter__(self) -> 'ZoteroDB':
+		return self
+
+	def __exit__(self, *args) -> None:
+		self.close()
+
+	def item_versions(self) -> Dict[str,str]:
+		"""map of zotero item key to `dateModified`, for all reference items
+
+		this is a single cheap query, and can be compared against the state
+		from a previous run to find which items need to be reloaded
+		"""
+		placeholders : str = ','.join('?' * len(ZOTERO_SKIP_ITEM_TYPES))
+		return dict(self.conn.execute(
+			f"""SELECT items.key, items.dateModified
+			FROM items
+			JOIN itemTypes USING (itemTypeID)
+			WHERE itemTypes.typeName NOT IN ({placeholders})
+			AND items.itemID NOT IN (SELECT itemID FROM deletedItems)""",
+			ZOTERO_SKIP_ITEM_TYPES,
+		))
+
+	def _item_ids(self, keys : Optional[Iterable[str]]) -> Dict[int,Tuple[str,str]]:
+		"""map of item id to `(key, typeName)`, restricted to `keys` if given"""
+		placeholders : str = ','.join('?' * len(ZOTERO_SKIP_ITEM_TYPES))
+		rows : List[Tuple[int,str,str]] = list(self.conn.execute(
+			f"""SELECT items.itemID, items.key, itemTypes.typeName
+			FROM items
+			JOIN itemTypes USING (itemTypeID)
+			WHERE itemTypes.typeName NOT IN ({placeholders})
+			AND items.itemID NOT IN (SELECT itemID FROM deletedItems)
+			ORDER BY items.itemID""",
+			ZOTERO_SKIP_ITEM_TYPES,
+		))
+
+		if keys is not None:
+			keys_set = set(keys)
+			rows = [ x for x in rows if x[1] in keys_set ]
+
+		return { item_id : (key, typ) for item_id,key,typ in rows }
+
+	def _select_items(self, item_ids : Iterable[int]) -> None:
+		"""store `item_ids` in the temporary table `SELECTED_ITEMS`, replacing what was there
+
+		the connection is read only, but temporary tables live in a separate database
+		"""
+		self.conn.execute(f'CREATE TEMP TABLE IF NOT EXISTS {SELECTED_ITEMS} (itemID INTEGER PRIMARY KEY)')
+		self.conn.execute(f'DELETE FROM {SELECTED_ITEMS}')
+		self.conn.executemany(f'INSERT INTO {SELECTED_ITEMS} VALUES (?)', ( (x,) for x in item_ids ))
+
+	def _grouped(self, query : str) -> Dict[int,List[Tuple[Any,...]]]:
+		"""run a query whose first column is an item id, group the remaining columns by it"""
+		output : Dict[int,List[Tuple[Any,...]]] = defaultdict(list)
+		for row in self.conn.execute(query):
+			output[row[0]].append(tuple(row[1:]))
+		return output
+
+	def _attachment_path(self, att_key : str, path : Optional[str]) -> Optional[str]:
+		if not path:
+			return None
+		if path.startswith('storage:'):
+			return os.path.join(self.storage_dir, att_key, path[len('storage:'):])
+		return path
+
+	def _query_selected(
+			self,
+			with_notes : bool = True,
+		) -> Dict[str, Dict[int,List[Tuple[Any,...]]]]:
+		"""run the grouped queries for the items in `SELECTED_ITEMS`, by name of the query
+
+		attachments are returned as `files`, with their paths resolved. see `_make_entry`
+		"""
+		# all of these are grouped by item id.
+		# we query everything at once rather than per-item, since its much faster,
+		# but only for the selected items, so loading a few changed items stays cheap
+		selected : str = f'IN (SELECT itemID FROM {SELECTED_ITEMS})'
+		fields : Dict[int,List[Tuple[Any,...]]] = self._grouped(
+			f"""SELECT itemData.itemID, fields.fieldName, itemDataValues.value
+			FROM itemData
+			JOIN fields USING (fieldID)
+			JOIN itemDataValues USING (valueID)
+			WHERE itemData.itemID {selected}
+			UNION ALL
+			SELECT items.itemID, 'dateAdded', items.dateAdded
+			FROM items
+			WHERE items.itemID {selected}
+			UNION ALL
+			SELECT items.itemID, 'dateModified', items.dateModified
+			FROM items
+			WHERE items.itemID {selected}"""
+		)
+		creators : Dict[int,List[Tuple[Any,...]]] = self._grouped(
+			f"""SELECT itemCreators.itemID, creators.firstName, creators.lastName, creatorTypes.creatorType
+			FROM itemCreators
+			JOIN creators USING (creatorID)
+			JOIN creatorTypes USING (creatorTypeID)
+			WHERE itemCreators.itemID {selected}
+			ORDER BY itemCreators.itemID, itemCreators.orderIndex"""
+		)
+		tags : Dict[int,List[Tuple[Any,...]]] = self._grouped(
+			f"""SELECT itemTags.itemID, tags.name
+			FROM itemTags
+			JOIN tags USING (tagID)
+			WHERE itemTags.itemID {selected}
+			ORDER BY tags.name"""
+		)
+		collections : Dict[int,List[Tuple[Any,...]]] = self._grouped(
+			f"""SELECT collectionItems.itemID, collections.key
+			FROM collectionItems
+			JOIN collections USING (collectionID)
+			WHERE collectionItems.itemID {selected}"""
+		)
+		notes : Dict[int,List[Tuple[Any,...]]] = self._grouped(
+			f"""SELECT itemNotes.parentItemID, itemNotes.note
+			FROM itemNotes
+			WHERE itemNotes.parentItemID {selected}
+			AND itemNotes.itemID NOT IN (SELECT itemID FROM deletedItems)
+			ORDER BY itemNotes.itemID"""
+		) if with_notes else dict()
+		attachments : Dict[int,List[Tuple[Any,...]]] = self._grouped(
+			f"""SELECT itemAttachments.parentItemID, items.key, itemAttachments.path
+			FROM itemAttachments
+			JOIN items USING (itemID)
+			WHERE itemAttachments.parentItemID {selected}
+			AND itemAttachments.itemID NOT IN (SELECT itemID FROM deletedItems)
+			ORDER BY itemAttachments.itemID"""
+		)
+
+		return {
+			'fields' : fields,
+			'creators' : creators,
+			'tags' : tags,
+			'collections' : collections,
+			'notes' : notes,
+			'files' : {
+				item_id : [
+					(fpath,)
+					for fpath in (self._attachment_path(att_key, path) for att_key,path in rows)
+					if fpath is not None
+				]
+				for item_id,rows in attachments.items()
+			},
+		}
+
+	def load_entries(
+			self,
+			cfg : Config,
+			keys : Optional[Iterable[str]] = None,
+			process_note : bool = True,
+			on_error : Optional[Callable[[str, BaseException], None]] = None,
+		) -> OrderedDictType[str, CitationEntry]:
+		"""load reference items as `CitationEntry` objects, keyed by citation key
+
+		### Parameters:
+		 - `cfg : Config`
+		   config, used for author tag generation
+		 - `keys : Optional[Iterable[str]]`
+		   if given, only load items with these zotero keys
+		   (defaults to `None`, meaning load everything)
+		 - `process_note : bool`
+		   convert notes with `process_note_HACKY`. if false, the raw html is stored
+		   (defaults to `True`)
+		 - `on_error : Optional[Callable[[str, BaseException], None]]`
+		   if given, items which can't be loaded are skipped, calling `on_error(zotero_key, err)`
+		   (defaults to `None`, meaning errors are raised)
+
+		fields not in `get_needed_fields(cfg)` are left as `None`, and notes are
+		not queried at all if they aren't needed
+		"""
+		items : Dict[int,Tuple[str,str]] = self._item_ids(keys)
+		needed : Optional[FrozenSet[str]] = get_needed_fields(cfg)
+		self._select_items(items)
+		grouped : Dict[str, Dict[int,List[Tuple[Any,...]]]] = self._query_selected(
+			with_notes = (needed is None) or ('note' in needed),
+		)
+
+		output : OrderedDictType[str, CitationEntry] = OrderedDict()
+		for item_id,item in items.items():
+			try:
+				entry : CitationEntry = _make_entry(
+					cfg,
+					item,
+					{ name : rows.get(item_id, list()) for name,rows in grouped.items() },
+					needed,
+					process_note,
+				)
+			except Exception as err: # pylint: disable=broad-except
+				if on_error is None:
+					raise
+				on_error(item[0], err)
+				continue
+			output[str(entry.bib_key)] = entry
+
+		return output
+
+
+def load_zotero_state(filename : str) -> ZoteroState:
+	"""load the state from a previous run, mapping zotero key to `dateModified` and `bib_key`"""
+	if not os.path.isfile(filename):
+		return dict()
+
+	try:
+		with open(filename, 'r', encoding = 'utf-8') as f:
+			return json.load(f)
+	except (OSError, ValueError) as err:
+		print(f"WARNING: couldn't read zotero state file {filename}, will regenerate all notes:\t{err}", file = sys.stderr)
+		return dict()
+
+def save_zotero_state(filename : str, state : ZoteroState) -> None:
+	with open(filename, 'w', encoding = 'utf-8') as f:
+		json.dump(state, f, indent = '\t', sort_keys = True)
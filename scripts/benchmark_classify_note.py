@@ -0,0 +1,125 @@
+"""check the accuracy and speed of `classify_note` against the heuristic it replaced
+
+the old `classify_note` counted `<`, `>`, and `\\` over the whole note, so
+plaintext with comparisons or windows paths was sent to pandoc, and very
+large pasted notes were scanned in full. the current one looks for actual
+html tags and latex commands in the first `NOTE_CLASSIFY_SAMPLE` characters.
+```bash
+python scripts/benchmark_classify_note.py --repeat=100
+```
+
+notes are read from the labelled corpus `examples/note_corpus.json`, a list
+of `{"label" : "html" | "latex" | null, "kind" : <description>, "note" : <text>}`,
+plus a few very large generated notes, which are too big to keep in the repo.
+exits with status 1 if the current `classify_note` gets any note wrong
+"""
+
+from typing import (
+	Optional, Any,
+	Dict, List, Tuple, Callable,
+)
+
+import os
+import sys
+import json
+import time
+
+from dendron_citations.dc_util import OptionalStr
+from dendron_citations.process_meta import classify_note
+
+
+REPO_ROOT : str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CORPUS : str = os.path.join(REPO_ROOT, 'examples', 'note_corpus.json')
+
+
+def legacy_classify_note(s : str) -> OptionalStr:
+	"""`classify_note` before it looked for markup tokens"""
+	if (s.count('<') / len(s) > 0.05) and (s.count('>') / len(s) > 0.05):
+		# probably html
+		return 'html'
+	elif s.count('\\') / len(s) > 0.01:
+		# probably latex
+		return 'latex'
+
+	return None
+
+
+def load_corpus(path : str) -> List[Dict[str, Any]]:
+	with open(path, 'r', encoding = 'utf-8') as f:
+		return json.load(f)
+
+def make_large_notes() -> List[Dict[str, Any]]:
+	"""whole papers pasted into a note, which is where scanning the full note hurts"""
+	return [
+		{
+			'label' : 'html',
+			'kind' : 'generated: full text pasted into a zotero note',
+			'note' : '<p>' + 'pasted full text. ' * 20000 + '</p><p>end</p>',
+		},
+		{
+			'label' : None,
+			'kind' : 'generated: full text pasted as plaintext, with the odd comparison',
+			'note' : 'pasted full text where n < 5 and m > 3. ' * 8000,
+		},
+	]
+
+
+def _mean_time(func : Callable[[str], Any], notes : List[str], repeat : int) -> float:
+	"""mean seconds per call, taking the best of `repeat` passes over `notes`"""
+	best : float = float('inf')
+	for _ in range(repeat):
+		start : float = time.perf_counter()
+		for note in notes:
+			func(note)
+		best = min(best, time.perf_counter() - start)
+	return best / len(notes)
+
+
+def main(corpus : str = DEFAULT_CORPUS, repeat : int = 100, show_misses : bool = True) -> None:
+	"""report accuracy of both classifiers on the labelled corpus, and time them
+
+	### Parameters:
+	 - `corpus : str`
+	   path to the labelled corpus
+	   (defaults to `examples/note_corpus.json`)
+	 - `repeat : int`
+	   passes over the notes when timing. the best is used
+	 - `show_misses : bool`
+	   print each note a classifier gets wrong
+	"""
+	small : List[Dict[str, Any]] = load_corpus(corpus)
+	large : List[Dict[str, Any]] = make_large_notes()
+	classifiers : Dict[str, Callable[[str], OptionalStr]] = {
+		'legacy' : legacy_classify_note,
+		'current' : classify_note,
+	}
+
+	failed : bool = False
+	print(f'{len(small)} labelled notes from {corpus}, and {len(large)} generated large notes:')
+	for name,func in classifiers.items():
+		misses : List[Tuple[Dict[str, Any], Optional[str]]] = [
+			(item, func(item['note']))
+			for item in small + large
+			if func(item['note']) != item['label']
+		]
+		n_total : int = len(small) + len(large)
+		print(f'  {name:<8} accuracy {n_total - len(misses)}/{n_total}')
+		if show_misses:
+			for item,guess in misses:
+				print(f'    {item["kind"]}: labelled {item["label"]}, got {guess}')
+		if (name == 'current') and misses:
+			failed = True
+
+	print(f'\ntime per note, best of {repeat}:')
+	print(f'  {"":<14}{"legacy":>12}{"current":>12}')
+	for group,items in (('labelled', small), ('large', large)):
+		notes : List[str] = [ item['note'] for item in items ]
+		times : List[float] = [ _mean_time(func, notes, repeat) for func in classifiers.values() ]
+		print(f'  {group:<14}' + ''.join(f'{t * 1e6:10.2f}us' for t in times))
+
+	sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+	import fire # type: ignore
+	fire.Fire(main)
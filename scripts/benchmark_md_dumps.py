@@ -0,0 +1,118 @@
+"""benchmark `PandocMarkdown.dumps` against the implementation it replaced
+
+the old `dumps` rebuilt the key order of the note, and the frontmatter dict,
+on every call, and kept the new key order. the current one computes the key
+order once per set of frontmatter keys in a shared `PandocMarkdownWriter`.
+```bash
+python scripts/benchmark_md_dumps.py --n_notes=20000 --repeat=5
+```
+
+notes are made like reference notes, and the output of both is checked to be identical
+"""
+
+from typing import (
+	Any,
+	Dict, List, Tuple,
+)
+
+import time
+
+from dendron_citations.md_util import PandocMarkdown,PandocMarkdownWriter
+
+
+def legacy_dumps(note : PandocMarkdown) -> str:
+	"""`PandocMarkdown.dumps` before the key order was cached, including modifying `note`"""
+	note.keyorder = tuple(list(note.keyorder) + [
+		k for k in note.yaml_data
+		if k not in note.keyorder
+	])
+
+	note.yaml_data = {
+		k : note.yaml_data[k]
+		for k in note.keyorder
+		if k in note.yaml_data
+	}
+
+	return '\n'.join([
+		note.delim,
+		note.writer(note.yaml_data).strip(),
+		note.delim,
+		note.content.lstrip(),
+	])
+
+
+def legacy_ordered_data(note : PandocMarkdown) -> Dict[str, Any]:
+	"""just the reordering of the frontmatter done by `legacy_dumps`, without modifying `note`"""
+	keyorder : Tuple[str,...] = tuple(list(note.keyorder) + [
+		k for k in note.yaml_data
+		if k not in note.keyorder
+	])
+	return {
+		k : note.yaml_data[k]
+		for k in keyorder
+		if k in note.yaml_data
+	}
+
+
+def make_notes(n_notes : int) -> List[PandocMarkdown]:
+	"""notes with the same frontmatter keys as reference notes"""
+	notes : List[PandocMarkdown] = list()
+	for i in range(n_notes):
+		note : PandocMarkdown = PandocMarkdown.get_dendron_template(fm = {'traitIds' : 'referenceNote'})
+		note.yaml_data.update({
+			'title' : f'A title of note {i}',
+			'tags' : ['ML', 'deep_learning'],
+			'attached_files' : [f'/storage/{i}/paper.pdf'],
+			'authors' : ['Jonathan Frankle', 'Michael Carbin'],
+			'bibtex_key' : f'frankle{i}',
+			'id' : f'{i:021d}',
+			# fixed, so notes made at different times compare equal
+			'created' : 1651000000000 + i,
+			'updated' : 1651000000000 + i,
+		})
+		note.content = f'# Authors\n - [[Jonathan Frankle | tags.author.J-Frankle]]\n\n# Abstract\nabstract {i}\n'
+		notes.append(note)
+	return notes
+
+
+def _best_time(func : Any, notes : List[PandocMarkdown], repeat : int) -> Tuple[float, List[Any]]:
+	best : float = float('inf')
+	output : List[Any] = list()
+	for _ in range(repeat):
+		start : float = time.perf_counter()
+		output = [ func(note) for note in notes ]
+		best = min(best, time.perf_counter() - start)
+	return best, output
+
+
+def main(n_notes : int = 20000, repeat : int = 5) -> None:
+	"""time both implementations on `n_notes` notes, taking the best of `repeat` runs"""
+	md_writer : PandocMarkdownWriter = PandocMarkdownWriter()
+	results : Dict[str, Tuple[float, List[Any]]] = {
+		'legacy dumps' : _best_time(legacy_dumps, make_notes(n_notes), repeat),
+		'PandocMarkdown.dumps' : _best_time(lambda note : note.dumps(), make_notes(n_notes), repeat),
+		'shared writer' : _best_time(lambda note : note.dumps(md_writer), make_notes(n_notes), repeat),
+		# the part which changed, without the time spent in yaml
+		'legacy key order only' : _best_time(legacy_ordered_data, make_notes(n_notes), repeat),
+		'cached key order only' : _best_time(
+			lambda note : {
+				k : note.yaml_data[k]
+				for k in md_writer.key_order(tuple(note.yaml_data))
+			},
+			make_notes(n_notes), repeat,
+		),
+	}
+
+	reference : List[Any] = results['legacy dumps'][1]
+	for name in ('PandocMarkdown.dumps', 'shared writer'):
+		assert results[name][1] == reference, f'output of {name} differs from legacy dumps'
+	assert [ list(d.items()) for d in results['legacy key order only'][1] ] == [ list(d.items()) for d in results['cached key order only'][1] ]
+
+	print(f'{n_notes} notes, best of {repeat}:')
+	for name,(seconds,_) in results.items():
+		print(f'  {name:<24}{seconds * 1e6 / n_notes:8.2f} us/note')
+
+
+if __name__ == '__main__':
+	import fire # type: ignore
+	fire.Fire(main)
@@ -0,0 +1,144 @@
+"""benchmark the pipelined `full_process` against running it serially
+
+with `pipeline_queue_size=0`, every stage runs in one thread, one entry at a
+time. by default, stages run in their own threads connected by bounded
+queues, so that pandoc calls and disk writes overlap with parsing and
+rendering (see `dendron_citations.pipeline`).
+```bash
+python scripts/benchmark_pipeline.py --n_entries=2000 --repeat=3
+```
+
+both are run on a synthetic library without notes, and again with html and
+latex notes, so that pandoc is called. the pandoc runs are skipped if pandoc
+can't be found. each run writes an empty vault, and the vaults of both are
+checked to be identical (ignoring `id`, `created`, and `updated`, see
+`benchmark_versions.compare_vaults`). exits with status 1 if they differ
+"""
+
+from typing import (
+	Optional,
+	Dict, List, Match,
+)
+
+import os
+import re
+import sys
+import time
+import random
+import tempfile
+from contextlib import redirect_stdout
+
+from dendron_citations.refs_vault_gen import Config, full_process
+from dendron_citations.pandoc_pool import find_pandoc
+
+from benchmark_versions import make_library, compare_vaults
+
+
+# queue sizes to compare, by name. `0` runs everything in one thread
+QUEUE_SIZES : Dict[str, int] = {
+	'serial' : 0,
+	'pipelined' : Config.pipeline_queue_size,
+}
+
+_NOTES : List[str] = [
+	'<p>We show that <b>sparse</b> subnetworks can be trained <i>in isolation</i>.</p><ul><li>first</li><li>second</li></ul>',
+	'\\textbf{Key idea}: prune and rewind. See \\cite{frankle2019lottery} and \\emph{Section 3}.\\par Works for \\textit{most} architectures.',
+	'<div><h1>Summary</h1><p>Attention is all you need, with <a href="https://example.org">a link</a>.</p></div>',
+]
+
+
+def add_notes(library : str, seed : int = 0, fraction : float = 0.5) -> str:
+	"""add an html or latex `note` to about `fraction` of the entries in `library`"""
+	rng : random.Random = random.Random(seed)
+
+	def _add(match : Match) -> str:
+		if rng.random() >= fraction:
+			return match.group(0)
+		return match.group(0) + f'  note = {{{rng.choice(_NOTES)}}},\n'
+
+	return re.sub(r'@article\{[^,\n]*,\n', _add, library)
+
+
+def run_once(bib_filename : str, vault_loc : str, queue_size : int) -> float:
+	"""run `full_process` into a new vault at `vault_loc`, returning the time taken"""
+	os.makedirs(vault_loc)
+	cfg : Config = Config(
+		bib_filename = bib_filename,
+		vault_loc = vault_loc,
+		pipeline_queue_size = queue_size,
+	)
+	with open(os.devnull, 'w', encoding = 'utf-8') as devnull, redirect_stdout(devnull):
+		start : float = time.perf_counter()
+		full_process(cfg)
+		return time.perf_counter() - start
+
+
+def main(
+		n_entries : int = 2000,
+		seed : int = 0,
+		repeat : int = 3,
+		max_diffs_shown : int = 5,
+		workdir : Optional[str] = None,
+	) -> None:
+	"""time the serial and pipelined runs on a synthetic library, with and without pandoc
+
+	### Parameters:
+	 - `n_entries : int`, `seed : int`
+	   size and seed of the synthetic library
+	 - `repeat : int`
+	   runs of each, each into an empty vault. the best time is used
+	 - `max_diffs_shown : int`
+	   how many differing notes to print
+	 - `workdir : Optional[str]`
+	   where to put the libraries and vaults, which are kept
+	   (defaults to `None`, meaning a temporary directory which is removed)
+	"""
+	libraries : Dict[str, str] = {'without pandoc' : make_library(n_entries, seed)}
+	if find_pandoc() is not None:
+		libraries['with pandoc'] = add_notes(libraries['without pandoc'], seed)
+	else:
+		print('pandoc not found, skipping the runs with notes to convert')
+
+	failed : bool = False
+	with tempfile.TemporaryDirectory() as tmp:
+		root : str = os.path.abspath(workdir) if workdir is not None else tmp
+		os.makedirs(root, exist_ok = True)
+
+		for lib_name,library in libraries.items():
+			lib_dir : str = os.path.join(root, lib_name.replace(' ', '_'))
+			os.makedirs(lib_dir, exist_ok = True)
+			bib_filename : str = os.path.join(lib_dir, 'library.bib')
+			with open(bib_filename, 'w', encoding = 'utf-8') as f:
+				f.write(library)
+
+			best : Dict[str, float] = dict()
+			# alternate, so that warming up caches doesn't favour either
+			for i in range(repeat):
+				for name,queue_size in QUEUE_SIZES.items():
+					seconds : float = run_once(bib_filename, os.path.join(lib_dir, f'vault_{name}_{i}') + '/', queue_size)
+					best[name] = min(best.get(name, float('inf')), seconds)
+
+			diffs : List[str] = compare_vaults(
+				os.path.join(lib_dir, 'vault_serial_0'),
+				os.path.join(lib_dir, 'vault_pipelined_0'),
+			)
+
+			print(f'\n{n_entries} entries {lib_name}, best of {repeat}:')
+			for name,queue_size in QUEUE_SIZES.items():
+				print(f'  {name:<10} (pipeline_queue_size={queue_size:<3}){best[name]:8.3f}s\t{best[name] * 1e3 / n_entries:.3f} ms/entry')
+			print(f'  speedup:  {best["serial"] / best["pipelined"]:.2f}x')
+
+			if diffs:
+				failed = True
+				print(f'FAIL: output differs in {len(diffs)} notes:')
+				for diff in diffs[:max_diffs_shown]:
+					print(diff + '\n')
+			else:
+				print('  output matches')
+
+	sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+	import fire # type: ignore
+	fire.Fire(main)
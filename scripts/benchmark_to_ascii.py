@@ -0,0 +1,130 @@
+"""benchmark `to_ascii`, and the field cleanup using it, against the implementation it replaced
+
+`strip_bibtex_fmt` and `process_tag_name` used to NFKD-normalize every field
+and drop non-ascii characters by encoding. `to_ascii` returns pure-ascii
+strings, which is most bibtex fields, as-is, since they are unchanged by that.
+```bash
+python scripts/benchmark_to_ascii.py --n_names=200000 --repeat=5
+```
+
+the corpus mixes ascii names and titles with accented, full-width, and CJK
+ones, plus braces, whitespace, slashes, and dots. the output of both is
+checked to be identical, with every combination of `nodot` and `kebab_case_tag_names`
+"""
+
+from typing import (
+	Any,
+	Dict, List, Tuple, Callable,
+)
+
+import time
+import random
+import unicodedata
+from functools import partial
+
+from dendron_citations.process_meta import to_ascii,strip_bibtex_fmt,process_tag_name
+
+
+def legacy_to_ascii(s : str) -> str:
+	"""decomposing and encoding every string, as before the fast path"""
+	return unicodedata.normalize('NFKD', s).encode('ascii', 'ignore').decode('ascii')
+
+def legacy_strip_bibtex_fmt(s : str) -> str:
+	return (
+		legacy_to_ascii(s)
+		.replace('{', '')
+		.replace('}', '')
+		.replace('\n', '  ')
+		.replace('\r', '')
+		.replace('\t', '  ')
+		.strip()
+		.rstrip(',')
+	)
+
+def legacy_process_tag_name(s : str, nodot : bool = True, kebab_case_tag_names : bool = False) -> str:
+	s_new : str = (
+		legacy_to_ascii(s)
+		.replace(' - ', '-')
+		.replace(' ', '_')
+		.replace('\t', '__')
+		.replace('\\', '')
+		.replace('\n', '')
+		.replace('/', '-')
+	)
+
+	if kebab_case_tag_names:
+		s_new = s_new.replace('_', '-')
+		s_new = s_new.lower()
+
+	if nodot:
+		s_new = s_new.replace('.', '-')
+
+	return s_new
+
+
+_ASCII_NAMES : List[str] = [
+	'Jonathan Frankle', 'Michael Carbin', 'Vaswani, Ashish', 'Noam Shazeer', 'LeCun, Yann',
+	'{Bengio}, Yoshua', 'G. E. Hinton', 'van der Maaten, Laurens', 'Lottery Ticket Hypothesis',
+	'Attention Is All You Need', 'Journal of Machine Learning Research', 'deep learning',
+]
+_UNICODE_NAMES : List[str] = [
+	'Łukasz Kaiser', 'Jürgen Schmidhuber', 'Gödel, Kurt', 'Erdős, Pál', 'José Miguel Hernández-Lobato',
+	'Çağlar Gülçehre', 'Ｆｕｌｌ Ｗｉｄｔｈ', '李飞飞', '山田 太郎', 'Žižek, Slavoj', 'Ångström',
+	'naïve café résumé', 'ﬁnite ﬂows',
+]
+_PUNCTUATION : List[str] = ['', ' ', '{', '}', '\t', '\n', '/', '.', ' - ', ',', '\\', '\r']
+
+
+def make_names(n_names : int, seed : int = 0, unicode_fraction : float = 0.2) -> List[str]:
+	"""names and titles, about `unicode_fraction` of them with non-ascii characters"""
+	rng : random.Random = random.Random(seed)
+	names : List[str] = list()
+	for _ in range(n_names):
+		pool : List[str] = _UNICODE_NAMES if rng.random() < unicode_fraction else _ASCII_NAMES
+		names.append(''.join(
+			rng.choice(pool) + rng.choice(_PUNCTUATION)
+			for _ in range(rng.randint(1, 3))
+		))
+	return names
+
+
+def _best_time(func : Callable[[str], Any], names : List[str], repeat : int) -> Tuple[float, List[Any]]:
+	best : float = float('inf')
+	output : List[Any] = list()
+	for _ in range(repeat):
+		start : float = time.perf_counter()
+		output = [ func(name) for name in names ]
+		best = min(best, time.perf_counter() - start)
+	return best, output
+
+
+def main(n_names : int = 200000, repeat : int = 5, seed : int = 0, unicode_fraction : float = 0.2) -> None:
+	"""time both implementations on `n_names` names, taking the best of `repeat` runs"""
+	names : List[str] = make_names(n_names, seed, unicode_fraction)
+	n_ascii : int = sum(name.isascii() for name in names)
+
+	pairs : Dict[str, Tuple[Callable[[str], Any], Callable[[str], Any]]] = {
+		'to_ascii' : (legacy_to_ascii, to_ascii),
+		'strip_bibtex_fmt' : (legacy_strip_bibtex_fmt, strip_bibtex_fmt),
+	}
+	for nodot in (True, False):
+		for kebab in (True, False):
+			pairs[f'process_tag_name(nodot={nodot}, kebab={kebab})'] = (
+				partial(legacy_process_tag_name, nodot = nodot, kebab_case_tag_names = kebab),
+				partial(process_tag_name, nodot = nodot, kebab_case_tag_names = kebab),
+			)
+
+	print(f'{n_names} names ({n_ascii} pure ascii), best of {repeat}, ns/name:')
+	print(f'  {"":<44}{"legacy":>10}{"current":>10}')
+	for name,(legacy,current) in pairs.items():
+		legacy_time, legacy_out = _best_time(legacy, names, repeat)
+		current_time, current_out = _best_time(current, names, repeat)
+		assert legacy_out == current_out, f'output of {name} differs from the legacy implementation'
+		print(f'  {name:<44}{legacy_time * 1e9 / n_names:10.1f}{current_time * 1e9 / n_names:10.1f}')
+
+	print('output matches')
+
+
+if __name__ == '__main__':
+	import fire # type: ignore
+	fire.Fire(main)
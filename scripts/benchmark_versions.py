@@ -0,0 +1,266 @@
+"""compare the output and speed of two versions of dendron_citations
+
+upgrades which change rendered notes rewrite the whole vault, so before
+releasing, run a pinned synthetic library through the installed version and
+the version in this repository (or any other path):
+```bash
+python scripts/benchmark_versions.py --n_entries=2000 --repeat=3
+python scripts/benchmark_versions.py --baseline=../old_checkout --candidate=.
+```
+
+each version runs `full_process` in its own process, with the given path
+prepended to `PYTHONPATH` (or left as is, for the installed version). the
+vaults are compared file by file: frontmatter is compared with `id`,
+`created`, and `updated` removed, and the rest of each note byte-for-byte.
+the best time and the peak memory (max RSS) of each version are reported.
+exits with status 1 if the output differs, or the candidate is slower than
+`max_slowdown` times the baseline.
+"""
+
+from typing import (
+	Optional, Any,
+	Dict, List, Tuple,
+)
+
+import os
+import sys
+import json
+import random
+import difflib
+import tempfile
+import subprocess
+
+import yaml # type: ignore
+
+
+# frontmatter keys which differ between any two runs
+IGNORED_FM_KEYS : Tuple[str, ...] = ('id', 'created', 'updated')
+
+# prefix of the line a benchmark process prints its results on
+RESULT_PREFIX : str = 'BENCHMARK_RESULT:'
+
+REPO_ROOT : str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# run in a fresh process for each version, formatted with the paths as json strings.
+# only uses config fields and functions that every version has
+_RUNNER : str = '''
+import sys, json, time, resource
+import dendron_citations
+from dendron_citations.refs_vault_gen import Config, full_process
+cfg = Config(bib_filename = {bib_filename}, vault_loc = {vault_loc})
+start = time.perf_counter()
+full_process(cfg)
+seconds = time.perf_counter() - start
+# kilobytes on linux, bytes on macos
+max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == 'darwin':
+	max_rss //= 1024
+print({prefix!r} + json.dumps({{
+	'seconds' : seconds,
+	'max_rss_kb' : max_rss,
+	'package' : dendron_citations.__file__,
+}}))
+'''
+
+_FIRST_NAMES : List[str] = [
+	'Jonathan', 'Michael', 'Ashish', 'Noam', 'Niki', 'Jakob', 'Llion', 'Aidan', 'Lukasz', 'Illia',
+	'Yoshua', 'Geoffrey', 'Yann', 'Fei-Fei', 'Andrej', 'Ilya', 'Oriol', 'Quoc', 'Jeff', 'Sanjay',
+]
+_LAST_NAMES : List[str] = [
+	'Frankle', 'Carbin', 'Vaswani', 'Shazeer', 'Parmar', 'Uszkoreit', 'Jones', 'Gomez', 'Kaiser', 'Polosukhin',
+	'Bengio', 'Hinton', 'LeCun', 'Li', 'Karpathy', 'Sutskever', 'Vinyals', 'Le', 'Dean', 'Ghemawat',
+]
+_WORDS : List[str] = [
+	'attention', 'lottery', 'ticket', 'sparse', 'network', 'neural', 'learning', 'deep', 'gradient', 'descent',
+	'transformer', 'convolutional', 'recurrent', 'optimization', 'generalization', 'pruning', 'scaling', 'laws',
+]
+_KEYWORDS : List[str] = ['ML', 'deep learning', 'optimization', 'NLP', 'vision', 'theory', 'pruning']
+
+
+def make_library(n_entries : int, seed : int = 0) -> str:
+	"""a synthetic bibtex library, the same for a given `n_entries` and `seed`"""
+	rng : random.Random = random.Random(seed)
+	blocks : List[str] = ['@string{jmlr = "Journal of Machine Learning Research"}']
+	for i in range(n_entries):
+		authors : str = ' and '.join(
+			f'{rng.choice(_LAST_NAMES)}, {rng.choice(_FIRST_NAMES)}'
+			for _ in range(rng.randint(1, 5))
+		)
+		title : str = ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(3, 9))).capitalize()
+		year : int = rng.randint(1990, 2023)
+		key : str = f'{authors.split(",")[0].lower()}{year}{title.split()[0].lower()}{i}'
+		fields : List[str] = [
+			f'  title = {{{title}}}',
+			f'  author = {{{authors}}}',
+			f'  year = {{{year}}}',
+			'  journal = jmlr',
+			f'  url = {{https://example.org/{key}}}',
+		]
+		keywords : List[str] = rng.sample(_KEYWORDS, rng.randint(0, 3))
+		if keywords:
+			fields.append(f'  keywords = {{{", ".join(keywords)}}}')
+		if rng.random() < 0.5:
+			fields.append(f'  abstract = {{{" ".join(rng.choice(_WORDS) for _ in range(40))}}}')
+		blocks.append(f'@article{{{key},\n' + ',\n'.join(fields) + '\n}')
+
+	return '\n\n'.join(blocks) + '\n'
+
+
+def run_version(
+		package_path : Optional[str],
+		bib_filename : str,
+		vault_loc : str,
+	) -> Dict[str, Any]:
+	"""run `full_process` on `bib_filename` with the package at `package_path`, or the installed one if `None`"""
+	env : Dict[str, str] = dict(os.environ)
+	if package_path is not None:
+		env['PYTHONPATH'] = os.pathsep.join([
+			os.path.abspath(package_path),
+			*([env['PYTHONPATH']] if env.get('PYTHONPATH') else []),
+		])
+
+	os.makedirs(vault_loc, exist_ok = True)
+	proc : subprocess.CompletedProcess = subprocess.run(
+		[
+			sys.executable, '-c',
+			_RUNNER.format(
+				bib_filename = json.dumps(bib_filename),
+				vault_loc = json.dumps(vault_loc),
+				prefix = RESULT_PREFIX,
+			),
+		],
+		env = env,
+		# so that the package isn't imported from the working directory
+		cwd = os.path.dirname(vault_loc.rstrip('/')),
+		capture_output = True,
+		text = True,
+		check = False,
+	)
+	for line in proc.stdout.splitlines():
+		if line.startswith(RESULT_PREFIX):
+			return json.loads(line[len(RESULT_PREFIX):])
+
+	raise RuntimeError(
+		f'benchmark of {package_path or "installed package"} failed with code {proc.returncode}:\n{proc.stderr}'
+	)
+
+
+def normalize_note(text : str) -> str:
+	"""a note with the frontmatter keys in `IGNORED_FM_KEYS` removed, and the rest sorted"""
+	sections : List[str] = text.split('---', 2)
+	if (len(sections) < 3) or sections[0].strip():
+		return text
+	fm : Any = yaml.safe_load(sections[1])
+	if not isinstance(fm, dict):
+		return text
+	for k in IGNORED_FM_KEYS:
+		fm.pop(k, None)
+	return yaml.safe_dump(fm, sort_keys = True) + '---' + sections[2]
+
+def compare_vaults(baseline : str, candidate : str, max_diff_lines : int = 20) -> List[str]:
+	"""differences between the notes of two vaults, as readable strings"""
+	def _notes(vault : str) -> List[str]:
+		return sorted( f for f in os.listdir(vault) if f.endswith('.md') )
+
+	base_notes : List[str] = _notes(baseline)
+	cand_notes : List[str] = _notes(candidate)
+	diffs : List[str] = [
+		*[ f'only in baseline: {f}' for f in sorted(set(base_notes) - set(cand_notes)) ],
+		*[ f'only in candidate: {f}' for f in sorted(set(cand_notes) - set(base_notes)) ],
+	]
+
+	for fname in sorted(set(base_notes) & set(cand_notes)):
+		with open(os.path.join(baseline, fname), 'r', encoding = 'utf-8') as f:
+			base_text : str = normalize_note(f.read())
+		with open(os.path.join(candidate, fname), 'r', encoding = 'utf-8') as f:
+			cand_text : str = normalize_note(f.read())
+		if base_text != cand_text:
+			diff : List[str] = list(difflib.unified_diff(
+				base_text.splitlines(), cand_text.splitlines(),
+				fromfile = f'baseline/{fname}', tofile = f'candidate/{fname}',
+				lineterm = '',
+			))
+			diffs.append('\n'.join(diff[:max_diff_lines]))
+
+	return diffs
+
+
+def main(
+		baseline : Optional[str] = None,
+		candidate : str = REPO_ROOT,
+		n_entries : int = 2000,
+		seed : int = 0,
+		repeat : int = 3,
+		max_slowdown : float = 1.10,
+		max_diffs_shown : int = 5,
+		workdir : Optional[str] = None,
+	) -> None:
+	"""compare two versions of the package on a synthetic library
+
+	### Parameters:
+	 - `baseline : Optional[str]`
+	   path to put on `PYTHONPATH` for the baseline
+	   (defaults to `None`, meaning the installed package)
+	 - `candidate : str`
+	   path to put on `PYTHONPATH` for the candidate
+	   (defaults to the root of this repository)
+	 - `n_entries : int`, `seed : int`
+	   size and seed of the synthetic library
+	 - `repeat : int`
+	   runs of each version, each into an empty vault. the best time is used
+	 - `max_slowdown : float`
+	   fail if the candidate takes longer than this times the baseline
+	 - `max_diffs_shown : int`
+	   how many differing notes to print
+	 - `workdir : Optional[str]`
+	   where to put the library and vaults, which are kept
+	   (defaults to `None`, meaning a temporary directory which is removed)
+	"""
+	with tempfile.TemporaryDirectory() as tmp:
+		root : str = os.path.abspath(workdir) if workdir is not None else tmp
+		os.makedirs(root, exist_ok = True)
+		bib_filename : str = os.path.join(root, 'library.bib')
+		with open(bib_filename, 'w', encoding = 'utf-8') as f:
+			f.write(make_library(n_entries, seed))
+
+		results : Dict[str, List[Dict[str, Any]]] = dict()
+		for name,path in (('baseline', baseline), ('candidate', candidate)):
+			results[name] = [
+				run_version(path, bib_filename, os.path.join(root, f'vault_{name}_{i}') + '/')
+				for i in range(repeat)
+			]
+			print(f'{name}: {results[name][0]["package"]}')
+
+		diffs : List[str] = compare_vaults(
+			os.path.join(root, 'vault_baseline_0'),
+			os.path.join(root, 'vault_candidate_0'),
+		)
+
+	best : Dict[str, float] = { name : min(r['seconds'] for r in runs) for name,runs in results.items() }
+	peak : Dict[str, int] = { name : max(r['max_rss_kb'] for r in runs) for name,runs in results.items() }
+	speed_ratio : float = best['candidate'] / best['baseline']
+	memory_ratio : float = peak['candidate'] / peak['baseline']
+
+	print(f'\n{n_entries} entries, best of {repeat}:')
+	print(f'  time:\t\tbaseline {best["baseline"]:.3f}s\tcandidate {best["candidate"]:.3f}s\t({speed_ratio:.2f}x)')
+	print(f'  peak memory:\tbaseline {peak["baseline"] / 1024:.1f}MB\tcandidate {peak["candidate"] / 1024:.1f}MB\t({memory_ratio:.2f}x)')
+
+	failed : bool = False
+	if diffs:
+		failed = True
+		print(f'\nFAIL: output differs in {len(diffs)} notes:')
+		for diff in diffs[:max_diffs_shown]:
+			print(diff + '\n')
+	else:
+		print('\noutput matches')
+
+	if speed_ratio > max_slowdown:
+		failed = True
+		print(f'FAIL: candidate is {speed_ratio:.2f}x the time of the baseline, more than {max_slowdown:.2f}x')
+
+	sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+	import fire # type: ignore
+	fire.Fire(main)